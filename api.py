@@ -0,0 +1,227 @@
+import gzip
+import json
+import zlib
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context, url_for
+from flask_login import current_user
+
+from database import use_replica
+from models import db, Blog, User
+from pagination import paginate, InvalidCursor
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it responses are gzip-compressed only
+    brotli = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Columns behind each selectable blog field
+BLOG_FIELDS = {
+    'id': (Blog.id,),
+    'title': (Blog.title,),
+    'category': (Blog.category,),
+    'summary': (Blog.summary,),
+    'content': (Blog.content,),
+    'content_html': (Blog.content_html,),
+    'excerpt': (Blog.excerpt,),
+    'word_count': (Blog.word_count,),
+    'image': (Blog.image,),
+    'image_variants': (Blog.image_variants,),
+    'date_posted': (Blog.date_posted,),
+    'draft': (Blog.draft,),
+    'author': (Blog.user_id, User.first_name.label('author_first_name'), User.last_name.label('author_last_name')),
+}
+LIST_FIELDS = ('id', 'title', 'category', 'summary', 'image', 'date_posted', 'author')
+DETAIL_FIELDS = LIST_FIELDS + ('content', 'content_html', 'word_count', 'image_variants', 'draft')
+USER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'email', 'user_type', 'city', 'state',
+               'profile_picture')
+
+MAX_LIMIT = 100
+MAX_IDS = 100
+COMPRESS_MIN_BYTES = 1024
+
+
+def error(status, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+
+@api.before_request
+def require_login():
+    # The HTML routes redirect to the login page; API clients get a 401 instead
+    if not current_user.is_authenticated:
+        return error(401, 'Authentication required.')
+
+
+@api.errorhandler(404)
+def not_found(e):
+    return error(404, 'Not found.')
+
+
+@api.errorhandler(400)
+def bad_request(e):
+    return error(400, e.description)
+
+
+def selected_fields(default):
+    """Fields requested with ?fields=a,b,c, validated against BLOG_FIELDS."""
+    requested = request.args.get('fields')
+    if not requested:
+        return default
+    fields = tuple(dict.fromkeys(field.strip() for field in requested.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in BLOG_FIELDS]
+    if unknown:
+        abort(400, f'Unknown field(s): {", ".join(unknown)}. Available: {", ".join(BLOG_FIELDS)}.')
+    return fields
+
+
+def blog_query(query, fields, *extra_columns):
+    """Select only the columns ``fields`` need (plus the pagination key) from a Blog query."""
+    columns = {Blog.id: None, Blog.date_posted: None}
+    for field in fields:
+        columns.update(dict.fromkeys(BLOG_FIELDS[field]))
+    columns.update(dict.fromkeys(extra_columns))
+    query = query.with_entities(*columns)
+    if 'author' in fields:
+        query = query.join(User, User.id == Blog.user_id)
+    return query
+
+
+def static_url(path):
+    return url_for('static', filename=path.replace('\\', '/'), _external=True) if path else None
+
+
+def serialize_blog(row, fields):
+    item = {}
+    for field in fields:
+        if field == 'date_posted':
+            item[field] = row.date_posted.isoformat()
+        elif field == 'image':
+            item[field] = static_url(row.image)
+        elif field == 'image_variants':
+            item[field] = {extension: {width: static_url(path) for width, path in sizes.items()}
+                           for extension, sizes in (row.image_variants or {}).items()}
+        elif field == 'author':
+            item[field] = {'id': row.user_id, 'name': f'{row.author_first_name} {row.author_last_name}'}
+        else:
+            item[field] = getattr(row, field)
+    return item
+
+
+def conditional_json(payload):
+    """JSON response with a weak ETag, answering 304 when the client's copy is current.
+
+    The ETag is weak because the same JSON may be sent gzip- or
+    brotli-encoded, and a strong ETag must change with the encoding.
+    """
+    response = current_app.response_class(json.dumps(payload, separators=(',', ':')),
+                                          mimetype='application/json')
+    response.add_etag(weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@api.route('/blogs')
+@use_replica
+def list_blogs():
+    """Published blogs, newest first.
+
+    ``?ids=1,2,3`` fetches those blogs in one query instead (in the order
+    given, with unknown or unpublished ids listed under ``missing``).
+    Otherwise the list is keyset-paginated with ``after``/``before`` cursors
+    and filtered by ``category``. ``fields`` selects what each item holds.
+    """
+    fields = selected_fields(LIST_FIELDS)
+
+    if 'ids' in request.args:
+        try:
+            ids = list(dict.fromkeys(int(value) for value in request.args['ids'].split(',') if value.strip()))
+        except ValueError:
+            abort(400, 'ids must be a comma separated list of integers.')
+        if len(ids) > MAX_IDS:
+            abort(400, f'At most {MAX_IDS} ids per request.')
+        rows = blog_query(Blog.published(), fields).filter(Blog.id.in_(ids)).all()
+        found = {row.id: serialize_blog(row, fields) for row in rows}
+        return conditional_json({'data': [found[blog_id] for blog_id in ids if blog_id in found],
+                                 'missing': [blog_id for blog_id in ids if blog_id not in found]})
+
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_LIMIT))
+    try:
+        page = paginate(blog_query(Blog.published(request.args.get('category')), fields),
+                        after=request.args.get('after'), before=request.args.get('before'), per_page=limit)
+    except InvalidCursor:
+        abort(400, 'Invalid cursor.')
+    return conditional_json({'data': [serialize_blog(row, fields) for row in page.items],
+                             'next_cursor': page.next_cursor, 'prev_cursor': page.prev_cursor})
+
+
+@api.route('/blogs/<int:blog_id>')
+@use_replica
+def get_blog(blog_id):
+    fields = selected_fields(DETAIL_FIELDS)
+    row = blog_query(Blog.query, fields, Blog.draft.label('is_draft'), Blog.user_id.label('owner_id')) \
+        .filter(Blog.id == blog_id).first_or_404()
+    if row.is_draft and row.owner_id != current_user.id:  # Drafts are visible to their author only
+        abort(404)
+    return conditional_json({'data': serialize_blog(row, fields)})
+
+
+@api.route('/blogs/export')
+def export_blogs():
+    """Every published blog as newline-delimited JSON, streamed in batches."""
+    fields = selected_fields(LIST_FIELDS)
+    statement = blog_query(Blog.published(request.args.get('category')), fields) \
+        .order_by(Blog.date_posted.desc(), Blog.id.desc()).statement
+
+    def generate():
+        rows = db.session.execute(statement.execution_options(yield_per=500))
+        for row in rows:
+            yield json.dumps(serialize_blog(row, fields), separators=(',', ':')) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@api.route('/me')
+def me():
+    # current_user is a cached snapshot, so this needs no database query
+    data = {field: getattr(current_user, field, None) for field in USER_FIELDS}
+    data['profile_picture'] = static_url(data['profile_picture'])
+    return conditional_json({'data': data})
+
+
+def _stream_compressed(chunks, compressor, finish):
+    for chunk in chunks:
+        data = compressor(chunk if isinstance(chunk, bytes) else chunk.encode())
+        if data:
+            yield data
+    yield finish()
+
+
+@api.after_request
+def compress(response):
+    """Compress API responses with brotli or gzip when the client accepts it."""
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers or response.direct_passthrough:
+        return response
+    accepted = request.accept_encodings
+    encoding = 'br' if brotli is not None and accepted['br'] else 'gzip' if accepted['gzip'] else None
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        if encoding == 'br':
+            compressor = brotli.Compressor()
+            response.response = _stream_compressed(response.response, compressor.process, compressor.finish)
+        else:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+            response.response = _stream_compressed(response.response, compressor.compress, compressor.flush)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(brotli.compress(data, quality=5) if encoding == 'br' else gzip.compress(data, 6))
+    response.headers['Content-Encoding'] = encoding
+    return response
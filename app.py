@@ -1,73 +1,234 @@
+import hmac
+import ipaddress
 import os
 import re
 
+import click
 from dotenv import load_dotenv
-from flask import Flask, render_template, redirect, url_for, flash, request, session
+from flask import Blueprint, Flask, render_template, redirect, url_for, flash, request, session, abort, jsonify, Response
+from flask import current_app
 from flask_login import login_required, current_user, LoginManager, login_user
-from flask_migrate import Migrate
 from flask_wtf import FlaskForm
+from flask_wtf.csrf import validate_csrf
 from flask_wtf.file import FileAllowed
 from wtforms import StringField, PasswordField, FileField, SelectField, SubmitField
-from wtforms.fields.simple import TextAreaField, BooleanField
+from wtforms.fields.simple import TextAreaField, BooleanField, HiddenField
 from wtforms.validators import DataRequired, Length
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from models import User, db, Blog
+from sqlalchemy.exc import IntegrityError
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy.orm import joinedload, load_only, defer
+from models import User, db, Blog, BlogCard
+from pagination import paginate, InvalidCursor
+from metrics import registry as metrics_registry
+from user_cache import UserCache, CachedUser, snapshot
+from page_cache import PageCache
+from hashing import PasswordHasher, HashingBusy
+from ratelimit import LoginThrottle, RateLimitExceeded, SlidingWindow, make_store
+from uploads import save_original, make_variants, InvalidImage, srcset, VARIANT_WIDTHS
+from jobs import queue
+from search import search_index, SearchUnavailable
+from api import api
+from assets import assets
+from bulk import data_cli
+from counters import counts_cli, category_counts, author_counts
+import revisions
+from rendering import content_cli
+from views import view_counter
+from availability import availability_index
+import related
+from related import related_cli
+from revisions import RevisionConflict, InvalidPatch
+from instrumentation import instrumentation
+from database import engine_options, replica_binds, use_replica, use_primary, collect_pool_metrics
 from wtforms.validators import Regexp
 from wtforms import ValidationError
 
-# Initialize the Flask app
-app = Flask(__name__)
+# Extensions are created unconfigured here and set up by create_app() (at the
+# bottom of this module), so importing it reads no settings and opens nothing.
+bp = Blueprint('main', __name__, cli_group=None)
 
-load_dotenv()
-#print("DATABASE_URL:", os.getenv('DATABASE_URL'))
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+login_manager.login_message = 'Please log in to access this page.'
 
-# Set the secret key for session management
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a7f5b8f8e8c9d2f3b9e1e8f9b8a8e8a2')
+# User cache: identity and role data for logged-in users, so that
+# current_user costs no database round trip.
+user_cache = UserCache()
+user_cache.watch(User)  # Drop cached users on profile change or delete
+metrics_registry.register(user_cache.collect_metrics)
 
-# Database configuration
-DATABASE_URL = os.getenv('DATABASE_URL')
-app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Password hashing runs on a bounded process pool so a burst of logins cannot
+# starve other routes.
+password_hasher = PasswordHasher()
 
-# Initialize LoginManager
-login_manager = LoginManager()
-login_manager.init_app(app)
+# Login throttling, and the limit on the public availability check
+login_throttle = LoginThrottle()
+metrics_registry.register(login_throttle.collect_metrics)
+availability_limit = SlidingWindow(None, 'availability-ip', 60, 60)
+metrics_registry.register(availability_index.collect_metrics)
 
-# Set the login view route
-login_manager.login_view = 'login'
-login_manager.login_message = 'Please log in to access this page.'
+# Page cache for published blog pages and patient feeds
+page_cache = PageCache()
+metrics_registry.register(page_cache.collect_metrics)
 
+metrics_registry.register(instrumentation.collect_metrics)
+metrics_registry.register(view_counter.collect_metrics)
 
-# Load user function for Flask-Login
-@login_manager.user_loader
-def load_user(user_id):
-    return db.session.get(User, int(user_id))
 
+@metrics_registry.register
+def collect_database_metrics():
+    return collect_pool_metrics(db.engines)
 
-# Initialize SQLAlchemy
-db.init_app(app)
 
+# Tell clients to back off when the hashing pool is saturated
+@bp.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    response = current_app.make_response(('The server is busy, please try again in a moment.', 503))
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
-# Initialize Flask-Migrate
-migrate = Migrate(app, db)
 
+@bp.app_errorhandler(SearchUnavailable)
+def search_unavailable(error):
+    response = current_app.make_response(('Search is starting up, please try again in a moment.', 503))
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
-# Set the upload folder for profile pictures
-# Initialize the upload folder for profile and blog images
-app.config['UPLOAD_FOLDER_USER'] = os.path.join('static', 'images', 'user')
-app.config['UPLOAD_FOLDER_BLOG'] = os.path.join('static', 'images', 'blog')
 
-# Ensure the upload folders exist
-if not os.path.exists(app.config['UPLOAD_FOLDER_USER']):
-    os.makedirs(app.config['UPLOAD_FOLDER_USER'])
+@bp.app_errorhandler(RateLimitExceeded)
+def rate_limited(error):
+    response = current_app.make_response(('Too many login attempts, please try again later.', 429))
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
-if not os.path.exists(app.config['UPLOAD_FOLDER_BLOG']):
-    os.makedirs(app.config['UPLOAD_FOLDER_BLOG'])
 
-# Create all tables within app context
-with app.app_context():
-    db.create_all()
+# Build a response for a cached page, answering 304 if the client's copy is current
+def cached_response(entry):
+    response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    # Pages sit behind a login, so only the browser may keep them and must revalidate
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# Load user function for Flask-Login
+@login_manager.user_loader
+def load_user(user_id):
+    user_id = int(user_id)
+    data = user_cache.get(user_id)
+    if data is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        data = user_cache.set(user_id, snapshot(user))
+    return CachedUser(data)
+
+
+# Resized/WebP copies of an uploaded image are made in the background. The
+# row is only updated if it still points at the same upload.
+@queue.job('images.make_variants')
+def make_image_variants(kind, row_id, path):
+    variants = make_variants(current_app.static_folder, path, VARIANT_WIDTHS[kind])
+    if kind == 'user':
+        db.session.execute(db.update(User).where(User.id == row_id, User.profile_picture == path)
+                           .values(profile_picture_variants=variants))
+        user_cache.invalidate(row_id)
+    else:
+        result = db.session.execute(db.update(Blog).where(Blog.id == row_id, Blog.image == path)
+                                    .values(image_variants=variants))
+        if result.rowcount:
+            blog = db.session.get(Blog, row_id)
+            page_cache.invalidate_blog(row_id)
+            if not blog.draft:
+                page_cache.invalidate_feeds(blog.category)
+    db.session.commit()
+
+
+def enqueue_image_variants(kind, row_id, path):
+    queue.enqueue('images.make_variants', {'kind': kind, 'row_id': row_id, 'path': path},
+                  idempotency_key=f'variants:{kind}:{row_id}:{path}')
+
+
+@queue.job('related.update')
+def update_related_posts(blog_ids):
+    for blog_id in related.update(blog_ids):
+        page_cache.invalidate_blog(blog_id)  # Its related posts changed
+
+
+def enqueue_related_update(*blog_ids):
+    queue.enqueue('related.update', {'blog_ids': list(blog_ids)})
+
+
+# Build a srcset attribute ("url 400w, url 800w") from stored image variants
+@bp.app_template_global()
+def image_srcset(variants, extension):
+    return ', '.join(f"{assets.url_for('static', filename=path)} {width}w"
+                     for width, path in srcset(variants, extension))
+
+
+# URL for an <img> fallback: the largest resized copy if there is one, else the original
+@bp.app_template_global()
+def image_url(path, variants, default):
+    for extension in ('jpg', 'png'):
+        pairs = srcset(variants, extension)
+        if pairs:
+            return assets.url_for('static', filename=pairs[-1][1])
+    return assets.url_for('static', filename=path.replace('\\', '/') if path else default)
+
+
+# Build a listing URL for the current endpoint, keeping its filters but replacing the cursor
+@bp.app_template_global()
+def page_url(**params):
+    args = {key: value for key, value in request.args.items() if key not in ('after', 'before', 'format')}
+    args.update(request.view_args or {})
+    args.update(params)
+    return url_for(request.endpoint, **args)
+
+
+# Render one keyset page of a blog listing. With ?format=fragment only the cards
+# are rendered and returned as JSON, which backs the "Load more" button.
+# Passing feed (a category, or PageCache.ALL) marks the page as identical for
+# every viewer, so it is served from and stored in the page cache.
+def render_blog_listing(query, template, feed=None, **context):
+    cache_key = None
+    if feed is not None:
+        cache_key = page_cache.feed_key(request.endpoint, feed,
+                                        after=request.args.get('after'),
+                                        before=request.args.get('before'),
+                                        format=request.args.get('format'),
+                                        most_read=view_counter.digest(feed))  # Re-rendered when the ranking changes
+        entry = page_cache.get(cache_key)
+        if entry is not None:
+            return cached_response(entry)
+        if page_cache.enabled:
+            use_primary(db.session)  # Never fill the shared cache from a lagging replica
+
+    # Select only the card columns so article bodies never leave the database
+    if isinstance(query, (list, tuple)):
+        query = [branch.with_entities(*Blog.card_columns()) for branch in query]
+    else:
+        query = query.with_entities(*Blog.card_columns())
+
+    try:
+        page = paginate(query,
+                        after=request.args.get('after'),
+                        before=request.args.get('before'),
+                        per_page=current_app.config['BLOGS_PER_PAGE'])
+    except InvalidCursor:
+        abort(400)
+    page.items = [BlogCard.from_row(row) for row in page.items]
+
+    if request.args.get('format') == 'fragment':
+        html = render_template('_blog_cards.html', blogs=page.items, drafts=context.get('drafts', False))
+        response = jsonify(html=html, next_cursor=page.next_cursor)
+    else:
+        response = current_app.make_response(render_template(template, blogs=page.items, page=page, **context))
+
+    if cache_key is None:
+        return response
+    entry = page_cache.set(cache_key, response.get_data(), mimetype=response.mimetype)
+    return cached_response(entry)
 
 
 # Custom email validation regex
@@ -77,6 +238,10 @@ def validate_email_regex(field):
         raise ValidationError("Invalid email format")
 
 
+# Blog categories, in the order the filter buttons show them
+BLOG_CATEGORIES = ['Mental Health', 'Heart Disease', 'Covid19', 'Immunization']
+
+
 # Signup
 # form class
 class SignupForm(FlaskForm):
@@ -124,11 +289,31 @@ class EditBlogForm(FlaskForm):
     summary = TextAreaField('Summary', validators=[DataRequired(), Length(max=300)])
     content = TextAreaField('Content', validators=[DataRequired()])
     draft = BooleanField('Save as Draft')
+    revision = HiddenField()  # The autosave revision the content was based on
     submit = SubmitField('Update Blog')
 
 
+# Availability of a username and/or email for the signup form, e.g.
+# /api/check-availability?username=jdoe -> {"available": {"username": false}}
+@bp.route('/api/check-availability')
+def check_availability():
+    fields = {field: request.args[field] for field in ('username', 'email') if request.args.get(field)}
+    if not fields:
+        return jsonify(error='pass a username and/or an email'), 400
+    try:
+        availability_limit.hit(request.remote_addr)
+    except RateLimitExceeded as error:
+        response = jsonify(error='too many availability checks, please try again later')
+        response.status_code, response.headers['Retry-After'] = 429, str(error.retry_after)
+        return response
+    taken = availability_index.taken(**fields)
+    response = jsonify(available={field: field not in taken for field in fields})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 # Route for signup
-@app.route('/signup', methods=['GET', 'POST'])
+@bp.route('/signup', methods=['GET', 'POST'])
 def signup():
     form = SignupForm()
 
@@ -148,21 +333,30 @@ def signup():
             pincode = form.pincode.data
             user_type = form.user_type.data
 
-            # Handle profile picture upload
-            if profile_picture:
-                filename = secure_filename(profile_picture.filename)
-                profile_picture.save(os.path.join(app.config['UPLOAD_FOLDER_USER'], filename))
-                profile_picture_path = os.path.join('images', 'user', filename)  # Store relative path
-            else:
-                profile_picture_path = None
-
             # Check if password and confirm password match
             if password != confirm_password:
                 form.confirm_password.errors.append('Passwords do not match!')
                 return render_template('signup.html', form=form)
 
+            # Reject taken names before spending any hashing or disk I/O on the signup
+            taken = availability_index.taken(username, email)
+            if taken:
+                for field in taken:
+                    form[field].errors.append(f'This {field} is already taken.')
+                return render_template('signup.html', form=form)
+
+            # Handle profile picture upload
+            if profile_picture:
+                try:
+                    profile_picture_path = save_original(profile_picture, current_app.static_folder, 'images/user')
+                except InvalidImage:
+                    form.profile_picture.errors.append('Please upload a JPG, PNG, GIF or WebP image.')
+                    return render_template('signup.html', form=form)
+            else:
+                profile_picture_path = None
+
             # Hash the password before saving
-            hash_password = generate_password_hash(password)
+            hash_password = password_hasher.hash(password)
 
             # Create a new user and add to the database
             new_user = User(
@@ -181,9 +375,22 @@ def signup():
 
             try:
                 db.session.add(new_user)
+                if profile_picture_path:
+                    db.session.flush()  # Assigns new_user.id for the job
+                    enqueue_image_variants('user', new_user.id, profile_picture_path)
                 db.session.commit()  # Commit to the database
+                availability_index.add(username, email)
                 flash('Account created successfully!', 'success')
-                return redirect(url_for('login'))  # Redirect to login page
+                return redirect(url_for('main.login'))  # Redirect to login page
+            except IntegrityError:
+                # Taken since the check, e.g. by a signup in another worker
+                db.session.rollback()
+                taken = availability_index.recheck(username, email)
+                for field in taken:
+                    form[field].errors.append(f'This {field} is already taken.')
+                if not taken:
+                    flash('Could not create the account, please try again.', 'danger')
+                return render_template('signup.html', form=form)
             except Exception as e:
                 db.session.rollback()  # Rollback in case of error
                 flash(f'Error occurred: {str(e)}', 'danger')
@@ -201,34 +408,36 @@ class LoginForm(FlaskForm):
 
 
 # Route for home
-@app.route('/')
+@bp.route('/')
 def home():
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 
 # Route for user dashboard (only accessible after login)
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
-    # Fetch the user data from the database
-    user = db.session.get(User, current_user.id)
+    # current_user is already loaded (usually from the user cache)
+    user = current_user
 
-    # Debugging: Print user information to check if the user is fetched correctly
-    if user:
-        print(f"User ID: {user.id}, User Type: {user.user_type}")
-    else:
+    if not user:
         flash('User not found!', 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
-    return render_template('user_dashboard.html', user=user)
+    # Post counts come from the blog counters, so this is one primary-key lookup
+    counts = author_counts(user.id) if user.user_type == 'Doctor' else None
+    return render_template('user_dashboard.html', user=user, counts=counts)
 
 
 # Route for login
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
 
     if request.method == 'POST':
+        # Throttle before any database or hashing work; raises RateLimitExceeded
+        login_throttle.check(request.remote_addr, request.form.get('username'))
+
         if form.validate_on_submit():
             # Get form data
             username = form.username.data
@@ -238,11 +447,17 @@ def login():
             user = User.query.filter_by(username=username).first()
 
             # Check if user exists and password is correct
-            if user and check_password_hash(user.password, password):
+            if user and password_hasher.verify(user.password, password):
+                login_throttle.succeeded(username)
+                # Upgrade hashes made with an older algorithm or cost while we have the password
+                if password_hasher.needs_rehash(user.password):
+                    user.password = password_hasher.hash(password)
+                    db.session.commit()
                 login_user(user)  # Log the user in
                 flash('Login successful!', 'success')
-                return redirect(url_for('dashboard'))
+                return redirect(url_for('main.dashboard'))
             else:
+                login_throttle.failed(username)
                 login_error = "Login failed. Please check your username and/or password."
                 return render_template('login.html', form=form, login_error=login_error)
 
@@ -250,14 +465,29 @@ def login():
 
 
 # Route to delete user
-@app.route('/delete_user/<int:user_id>', methods=['POST'])
+@bp.route('/delete_user/<int:user_id>', methods=['POST'])
 def delete_user(user_id):
     user = User.query.get(user_id)
 
     if user:
+        published = [(blog.id, blog.category) for blog in user.blogs if not blog.draft]
+        username, email = user.username, user.email
         try:
+            revisions.delete_for([blog.id for blog in user.blogs])
+            view_counter.forget([blog.id for blog in user.blogs])
+            related.forget([blog.id for blog in user.blogs])
+            if published:
+                enqueue_related_update(*(blog_id for blog_id, _ in published))  # Posts that listed them
+            for blog_id, _ in published:
+                search_index.remove(blog_id)
             db.session.delete(user)  # Delete the user from the database
             db.session.commit()  # Commit the changes
+            availability_index.remove(username, email)
+            # Their posts were deleted with them
+            for blog_id, _ in published:
+                page_cache.invalidate_blog(blog_id)
+            if published:
+                page_cache.invalidate_feeds(*BLOG_CATEGORIES)  # Every feed's category filters show counts
             flash('User deleted successfully!', 'success')
         except Exception as e:
             db.session.rollback()  # Rollback in case of error
@@ -265,23 +495,23 @@ def delete_user(user_id):
     else:
         flash('User not found.', 'danger')
 
-    return redirect(url_for('dashboard'))  # Redirect to dashboard
+    return redirect(url_for('main.dashboard'))  # Redirect to dashboard
 
 
 # Route to logout
-@app.route('/logout', methods=['POST'])
+@bp.route('/logout', methods=['POST'])
 def logout():
     session.clear()  # Clear the session to log the user out
     flash('You have been logged out.', 'info')
-    return redirect(url_for('login'))  # Redirect to login page
+    return redirect(url_for('main.login'))  # Redirect to login page
 
 
-@app.route('/create_blog', methods=['GET', 'POST'])
+@bp.route('/create_blog', methods=['GET', 'POST'])
 @login_required
 def create_blog():
     if current_user.user_type != 'Doctor':
         flash('You do not have permission to create blog posts.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     form = BlogPostForm()
 
@@ -294,9 +524,11 @@ def create_blog():
         draft = form.draft.data
 
         if image:
-            filename = secure_filename(image.filename)
-            image.save(os.path.join(app.config['UPLOAD_FOLDER_BLOG'], filename))
-            image_path = os.path.join('images', 'blog', filename)  # Store relative path
+            try:
+                image_path = save_original(image, current_app.static_folder, 'images/blog')
+            except InvalidImage:
+                form.image.errors.append('Please upload a JPG, PNG, GIF or WebP image.')
+                return render_template('create_blog.html', form=form)
         else:
             image_path = None
 
@@ -308,14 +540,26 @@ def create_blog():
             summary=summary,
             content=content,
             draft=draft,
-            author=current_user
+            user_id=current_user.id
         )
 
         try:
             db.session.add(new_blog)
+            if image_path or not new_blog.draft:
+                db.session.flush()  # Assigns new_blog.id for the jobs
+            if image_path:
+                enqueue_image_variants('blog', new_blog.id, image_path)
+            if not new_blog.draft:
+                enqueue_related_update(new_blog.id)
+                search_index.update(new_blog)
+            # The slow work is done later from rows written in this transaction: the jobs
+            # and the search change. Invalidating the page cache only replaces its token
+            # files, and must happen before the redirect so the author sees the new post.
             db.session.commit()
+            if not new_blog.draft:
+                page_cache.invalidate_feeds(*BLOG_CATEGORIES)  # Every feed's category filters show counts
             flash('Blog post created successfully!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error occurred: {str(e)}', 'danger')
@@ -323,80 +567,123 @@ def create_blog():
     return render_template('create_blog.html', form=form)
 
 
-@app.route('/blogs')
+@bp.route('/blogs')
 @login_required
+@use_replica
 def view_blogs():
-    categories = ['Mental Health', 'Heart Disease', 'Covid19', 'Immunization']
+    categories = BLOG_CATEGORIES
     selected_category = request.args.get('category')  # Get the selected category from the query parameters
+    feed = None  # Doctors see their own drafts and edit buttons, so their feed is not cached
 
     if current_user.user_type == 'Doctor':
         # Show all blogs (drafts and published) for the doctor
-        query = Blog.query.filter((Blog.draft == False) | (Blog.user_id == current_user.id))
+        query = Blog.doctor_feed(current_user.id, selected_category)
     else:
         # Non-doctor users see only published blogs
-        query = Blog.query.filter_by(draft=False)
+        query = Blog.published(selected_category)
+        feed = selected_category or PageCache.ALL
 
-    if selected_category:  # Filter by selected category if provided
-        query = query.filter_by(category=selected_category)
+    # category_counts and most_read are called by the template, so cached pages skip them
+    return render_blog_listing(query, 'view_blogs.html', feed=feed, categories=categories,
+                               category_counts=category_counts, most_read=view_counter.most_read,
+                               selected_category=selected_category)
 
-    blogs = query.order_by(Blog.date_posted.desc()).all()
 
-    return render_template('view_blogs.html', blogs=blogs, categories=categories, selected_category=selected_category)
-
-
-@app.route('/blog/<int:blog_id>')
+@bp.route('/blogs/search')
 @login_required
-def view_blog(blog_id):
+def search_blogs():
+    categories = BLOG_CATEGORIES
+    query = request.args.get('q', '').strip()
+    selected_category = request.args.get('category') or None
+    page = max(1, min(request.args.get('page', 1, type=int), 50))
+    per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+
+    results = []
+    if query:
+        # Fetch one extra result to know whether there is a next page
+        hits = search_index.search(query, category=selected_category, limit=per_page + 1,
+                                   offset=(page - 1) * per_page)
+        has_next = len(hits) > per_page
+        hits = hits[:per_page]
+        rows = Blog.query.filter(Blog.id.in_([hit.blog_id for hit in hits]), Blog.draft == False) \
+            .with_entities(*Blog.card_columns()).all()  # noqa: E712
+        cards = {row.id: BlogCard.from_row(row) for row in rows}
+        results = [(cards[hit.blog_id], hit.snippet) for hit in hits if hit.blog_id in cards]
+    else:
+        has_next = False
 
-    blog = Blog.query.get_or_404(blog_id)
-    return render_template('view_blog.html', blog=blog)
+    return render_template('search_results.html', query=query, results=results, categories=categories,
+                           selected_category=selected_category, page=page, has_next=has_next)
 
 
-@app.route('/blogs/<category>')
+@bp.route('/blog/<int:blog_id>')
+@login_required
+@use_replica
+def view_blog(blog_id):
+    key = page_cache.blog_key(blog_id)
+    entry = page_cache.get(key)
+    if entry is None:
+        if page_cache.enabled:
+            use_primary(db.session)  # Never fill the shared cache from a lagging replica
+        # The page shows the author's name, so load it in the same query. The
+        # source text is only read for posts not rendered yet.
+        blog = Blog.query.options(joinedload(Blog.author), defer(Blog.content)) \
+            .filter_by(id=blog_id).first_or_404()
+        html = render_template('view_blog.html', blog=blog, related_posts=related.for_blog(blog_id))
+        if blog.draft:  # Only published posts are cached, and counted
+            return html
+        entry = page_cache.set(key, html)
+    view_counter.record(blog_id)
+    return cached_response(entry)
+
+
+@bp.route('/blogs/<category>')
 @login_required
+@use_replica
 def view_blogs_by_category(category):
     if current_user.user_type != 'Patient':
-        return redirect(url_for('view_blogs'))
+        return redirect(url_for('main.view_blogs'))
 
-    blogs = Blog.query.filter_by(category=category, draft=False).order_by(Blog.date_posted.desc()).all()
-    return render_template('view_blogs.html', blogs=blogs, category=category)
+    return render_blog_listing(Blog.published(category), 'view_blogs.html', feed=category, category=category)
 
 
-@app.route('/blogs/all')
+@bp.route('/blogs/all')
 @login_required
+@use_replica
 def view_all_blogs():
     if current_user.user_type == 'Patient' or current_user.user_type == 'Doctor':
         # Fetch all blogs (published) for doctors
-        blogs = Blog.query.filter_by(draft=False).order_by(Blog.date_posted.desc()).all()
-        return render_template('view_blogs.html', blogs=blogs)
+        # Doctors get edit buttons on their own posts, so only the patient view is cached
+        feed = PageCache.ALL if current_user.user_type == 'Patient' else None
+        return render_blog_listing(Blog.published(), 'view_blogs.html', feed=feed)
     else:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
 
 # Route to view only the doctor's own blogs
-@app.route('/blogs/my')
+@bp.route('/blogs/my')
 @login_required
+@use_replica
 def view_my_blogs():
     if current_user.user_type == 'Doctor':
         # Fetch only the blogs authored by the logged-in doctor
-        blogs = Blog.query.filter_by(user_id=current_user.id, draft=False).order_by(Blog.date_posted.desc()).all()
-        return render_template('view_blogs.html', blogs=blogs)
+        return render_blog_listing(Blog.by_author(current_user.id), 'view_blogs.html')
     else:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
 
-@app.route('/draft')
+@bp.route('/draft')
 @login_required
+@use_replica
 def view_draft():
     if current_user.user_type == 'Doctor':
         # Fetch only the blogs authored by the logged-in doctor
-        blogs = Blog.query.filter_by(user_id=current_user.id, draft=True).order_by(Blog.date_posted.desc()).all()
-        return render_template('draft_blog.html', blogs=blogs)
+        return render_blog_listing(Blog.by_author(current_user.id, draft=True), 'draft_blog.html', drafts=True)
     else:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
 
-@app.route('/edit_blog/<int:blog_id>', methods=['GET', 'POST'])
+@bp.route('/edit_blog/<int:blog_id>', methods=['GET', 'POST'])
 @login_required
 def edit_blog(blog_id):
     blog = Blog.query.get_or_404(blog_id)
@@ -404,11 +691,21 @@ def edit_blog(blog_id):
     # Ensure the current user is the author of the blog
     if blog.user_id != current_user.id:
         flash('You do not have permission to edit this blog.', 'danger')
-        return redirect(url_for('view_my_blogs'))
+        return redirect(url_for('main.view_my_blogs'))
 
     form = EditBlogForm(obj=blog)  # Populate form with current blog data
+    # Autosaved changes that were never submitted are shown instead of the saved content
+    revision, working_text = revisions.working_copy(blog)
+    if request.method == 'GET':
+        form.content.data, form.revision.data = working_text, revision
 
     if form.validate_on_submit():
+        if form.revision.data and form.revision.data != str(revision):
+            form.content.errors.append('This post was changed in another window after you opened it. '
+                                       'Copy your changes, reload the page and apply them again.')
+            return render_template('edit_blog.html', form=form, blog=blog)
+        old_category, was_published = blog.category, not blog.draft
+        old_text = (blog.title, blog.summary, blog.content)
         blog.title = form.title.data
         blog.category = form.category.data
         blog.summary = form.summary.data
@@ -417,20 +714,325 @@ def edit_blog(blog_id):
 
         # Handle the image update
         if form.image.data:
-            filename = secure_filename(form.image.data.filename)
-            form.image.data.save(os.path.join(app.config['UPLOAD_FOLDER_BLOG'], filename))
-            blog.image = os.path.join('images', 'blog', filename)
+            try:
+                image_path = save_original(form.image.data, current_app.static_folder, 'images/blog')
+            except InvalidImage:
+                db.session.rollback()
+                form.image.errors.append('Please upload a JPG, PNG, GIF or WebP image.')
+                return render_template('edit_blog.html', form=form, blog=blog)
+            if image_path != blog.image:
+                blog.image, blog.image_variants = image_path, None
+                enqueue_image_variants('blog', blog.id, image_path)
 
         try:
+            if revisions.normalize(blog.content) != working_text:
+                revisions.save(blog, revision, text=blog.content)  # Autosave goes on from the saved text
+            if (was_published or not blog.draft) and (was_published == blog.draft or old_category != blog.category
+                                                      or old_text != (blog.title, blog.summary, blog.content)):
+                enqueue_related_update(blog.id)
+            if was_published or not blog.draft:
+                search_index.update(blog)
             db.session.commit()
+            page_cache.invalidate_blog(blog.id)  # Inline, as in create_blog
+            if was_published or not blog.draft:
+                # Publishing, unpublishing or moving a post changes the counts every feed page shows
+                counts_changed = was_published == blog.draft or old_category != blog.category
+                if counts_changed:
+                    view_counter.discard(blog.id)  # Ranked again under its new state on a later flush
+                page_cache.invalidate_feeds(*(BLOG_CATEGORIES if counts_changed else (old_category, blog.category)))
             flash('Blog updated successfully!', 'success')
-            return redirect(url_for('view_my_blogs'))
+            return redirect(url_for('main.view_my_blogs'))
+        except RevisionConflict:
+            db.session.rollback()
+            form.content.errors.append('This post was autosaved from another window while saving. '
+                                       'Copy your changes, reload the page and apply them again.')
         except Exception as e:
             db.session.rollback()
             flash(f'Error occurred: {str(e)}', 'danger')
 
-    return render_template('edit_blog.html', form=form, blog=blog)
+    return render_template('edit_blog.html', form=form, blog=blog,
+                           autosaved=request.method == 'GET' and working_text != revisions.normalize(blog.content),
+                           autosave_interval=current_app.config['AUTOSAVE_INTERVAL_MS'])
+
+
+@bp.route('/edit_blog/<int:blog_id>/autosave', methods=['GET', 'POST'])
+@login_required
+def autosave_blog(blog_id):
+    """The working copy of a post being edited (GET), or store a patch to it (POST).
+
+    POST takes ``{"revision": n, "patch": [[start, end, replacement], ...]}``
+    with the offsets into revision n's text, and answers with the new
+    revision number, or 409 and the latest revision if n is not the latest.
+    """
+    # The content is only loaded if no revision has been autosaved yet
+    blog = Blog.query.options(load_only(Blog.id, Blog.user_id)).get_or_404(blog_id)
+    if blog.user_id != current_user.id:
+        abort(403)
+    if request.method == 'GET':
+        revision, text = revisions.working_copy(blog)
+        return jsonify(revision=revision, content=text)
+
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except ValidationError:
+            return jsonify(error='missing or invalid CSRF token'), 400
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or type(data.get('revision')) is not int:
+        return jsonify(error='expected {"revision": n, "patch": [...]}'), 400
+    try:
+        revision, text = revisions.save(blog, data['revision'], patch=data.get('patch'))
+        db.session.commit()
+    except RevisionConflict as e:
+        db.session.rollback()
+        return jsonify(error='conflict', revision=e.revision), 409
+    except InvalidPatch as e:
+        db.session.rollback()
+        return jsonify(error=str(e)), 400
+    return jsonify(revision=revision, length=len(text))
+
+
+# Prometheus-format metrics for scraping
+# Only scrapers may read the metrics: a request from METRICS_ALLOWED_IPS, or one
+# carrying METRICS_TOKEN as a bearer token
+@bp.route('/metrics')
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())):
+        try:
+            address = ipaddress.ip_address(request.remote_addr)
+        except ValueError:
+            abort(403)
+        if not any(address in ipaddress.ip_network(network, strict=False)
+                   for network in current_app.config['METRICS_ALLOWED_IPS']):
+            abort(403)
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Fail if any listing query falls back to a full table scan or a filesort.
+# Run it against a populated database so the planner's choices are realistic.
+@bp.cli.command('check-query-plans')
+def check_query_plans_command():
+    from query_plans import check_query_plans
+
+    failures = check_query_plans()
+    for name, problems in failures.items():
+        for problem in problems:
+            click.echo(f'{name}: {problem}', err=True)
+    if failures:
+        raise SystemExit(1)
+    click.echo('All listing queries use an index.')
+
+
+def create_app(config=None):
+    """Build the application and set up every extension for it.
+
+    Settings are taken from ``config`` first, then from the environment (and
+    a .env file), then from the defaults below. Nothing here touches the
+    database; the schema is managed by the migrations (``flask db upgrade``).
+    The flask command finds this factory by itself, and gunicorn serves it as
+    ``gunicorn 'app:create_app()'``.
+    """
+    load_dotenv()
+    app = Flask(__name__)
+    app.config.update(config or {})
+
+    # Set the secret key for session management (Flask's defaults include it as None)
+    if not app.config['SECRET_KEY']:
+        app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a7f5b8f8e8c9d2f3b9e1e8f9b8a8e8a2')
+
+    # Database configuration
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.getenv('DATABASE_URL'))
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    database_url = app.config['SQLALCHEMY_DATABASE_URI']
+
+    # Connection pool settings, applied to the primary and to every read replica.
+    # Pre-ping replaces connections the server has closed; recycle retires them
+    # before the server's idle timeout does.
+    app.config.setdefault('DB_POOL_SIZE', int(os.environ.get('DB_POOL_SIZE', 5)))
+    app.config.setdefault('DB_MAX_OVERFLOW', int(os.environ.get('DB_MAX_OVERFLOW', 10)))
+    app.config.setdefault('DB_POOL_RECYCLE', int(os.environ.get('DB_POOL_RECYCLE', 1800)))
+    app.config.setdefault('DB_POOL_TIMEOUT', float(os.environ.get('DB_POOL_TIMEOUT', 30)))
+    app.config.setdefault('DB_POOL_PRE_PING', os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes'))
+    pool_options = dict(pool_size=app.config['DB_POOL_SIZE'], max_overflow=app.config['DB_MAX_OVERFLOW'],
+                        pool_recycle=app.config['DB_POOL_RECYCLE'], pool_timeout=app.config['DB_POOL_TIMEOUT'],
+                        pool_pre_ping=app.config['DB_POOL_PRE_PING'])
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(database_url, **pool_options))
+
+    # Optional read replicas (comma separated URLs). Listing pages and blog pages
+    # read from them; a client that has just written reads from the primary for
+    # DATABASE_REPLICA_STICKY_SECONDS so it always sees its own changes.
+    app.config.setdefault('DATABASE_REPLICA_URLS', [url.strip() for url in
+                                                    os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+                                                    if url.strip()])
+    app.config.setdefault('DATABASE_REPLICA_STICKY_SECONDS',
+                          int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 10)))
+    app.config.setdefault('SQLALCHEMY_BINDS', replica_binds(app.config['DATABASE_REPLICA_URLS'], **pool_options))
+    db.init_app(app)
+
+    # Number of blog cards per listing page
+    app.config.setdefault('BLOGS_PER_PAGE', int(os.environ.get('BLOGS_PER_PAGE', 12)))
+
+    login_manager.init_app(app)
+
+    # USER_CACHE_BACKEND may be 'local' (in-process stand-in) or the import
+    # path of a shared backend class.
+    app.config.setdefault('USER_CACHE_SIZE', int(os.environ.get('USER_CACHE_SIZE', 1024)))
+    app.config.setdefault('USER_CACHE_TTL', int(os.environ.get('USER_CACHE_TTL', 60)))
+    app.config.setdefault('USER_CACHE_BACKEND', os.environ.get('USER_CACHE_BACKEND', ''))
+    user_cache.init_app(app)
+
+    # PASSWORD_HASH_WORKERS=0 hashes inline on the request thread.
+    app.config.setdefault('PASSWORD_HASH_METHOD', os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'))
+    app.config.setdefault('PASSWORD_HASH_WORKERS', int(os.environ.get('PASSWORD_HASH_WORKERS', 2)))
+    app.config.setdefault('PASSWORD_HASH_QUEUE_DEPTH', int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', 16)))
+    app.config.setdefault('PASSWORD_HASH_TIMEOUT', float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10)))
+    password_hasher.init_app(app)
+
+    # Login throttling: every attempt counts against the client IP and failures
+    # count against the username, in sliding windows. RATE_LIMIT_STORE is 'memory'
+    # (per process), a redis:// URL shared by all workers, or an import path.
+    app.config.setdefault('LOGIN_LIMIT_PER_IP', int(os.environ.get('LOGIN_LIMIT_PER_IP', 20)))
+    app.config.setdefault('LOGIN_LIMIT_PER_IP_WINDOW', int(os.environ.get('LOGIN_LIMIT_PER_IP_WINDOW', 60)))
+    app.config.setdefault('LOGIN_LIMIT_PER_USERNAME', int(os.environ.get('LOGIN_LIMIT_PER_USERNAME', 5)))
+    app.config.setdefault('LOGIN_LIMIT_PER_USERNAME_WINDOW',
+                          int(os.environ.get('LOGIN_LIMIT_PER_USERNAME_WINDOW', 300)))
+    app.config.setdefault('RATE_LIMIT_STORE', os.environ.get('RATE_LIMIT_STORE', 'memory'))
+    app.config.setdefault('RATE_LIMIT_MAX_KEYS', int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000)))
+    rate_limit_store = make_store(app.config['RATE_LIMIT_STORE'], app.config['RATE_LIMIT_MAX_KEYS'])
+    login_throttle.init_app(app, rate_limit_store)
+
+    # Behind TRUSTED_PROXY_HOPS reverse proxies (nginx, a load balancer), take the
+    # client address, scheme and host from their X-Forwarded-* headers, so the rate
+    # limits and the /metrics allow-list see the real client instead of the proxy.
+    # Keep it 0 when clients reach the app directly, as they could forge the headers.
+    app.config.setdefault('TRUSTED_PROXY_HOPS', int(os.environ.get('TRUSTED_PROXY_HOPS', 0)))
+    hops = app.config['TRUSTED_PROXY_HOPS']
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    # Username/email availability for signup, answered by a per-worker Bloom filter
+    # and LRU (see availability.py). The filters are rebuilt in the background every
+    # AVAILABILITY_REFRESH_INTERVAL seconds to pick up other workers' signups.
+    # /api/check-availability is public, so it is limited per IP against enumeration.
+    app.config.setdefault('AVAILABILITY_ERROR_RATE', float(os.environ.get('AVAILABILITY_ERROR_RATE', 0.01)))
+    app.config.setdefault('AVAILABILITY_CACHE_SIZE', int(os.environ.get('AVAILABILITY_CACHE_SIZE', 4096)))
+    app.config.setdefault('AVAILABILITY_REFRESH_INTERVAL', int(os.environ.get('AVAILABILITY_REFRESH_INTERVAL', 300)))
+    app.config.setdefault('AVAILABILITY_LIMIT_PER_IP', int(os.environ.get('AVAILABILITY_LIMIT_PER_IP', 60)))
+    availability_index.init_app(app)
+    availability_limit.store = rate_limit_store
+    availability_limit.limit = app.config['AVAILABILITY_LIMIT_PER_IP']
+
+    # The memory page cache is per process and the filesystem one is shared by
+    # the processes on a host. Either way an edit, in a web worker or in a job,
+    # invalidates the page on the whole host through the generation files in
+    # PAGE_CACHE_DIR; memory entries also expire after PAGE_CACHE_TTL seconds,
+    # which bounds how long other hosts serve them.
+    app.config.setdefault('PAGE_CACHE_BACKEND', os.environ.get('PAGE_CACHE_BACKEND', 'memory'))
+    app.config.setdefault('PAGE_CACHE_MAX_BYTES', int(os.environ.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+    app.config.setdefault('PAGE_CACHE_TTL', int(os.environ.get('PAGE_CACHE_TTL', 60)))
+    app.config.setdefault('PAGE_CACHE_DIR', os.environ.get('PAGE_CACHE_DIR',
+                                                           os.path.join(app.instance_path, 'page_cache')))
+    page_cache.init_app(app)
+
+    # Per-request timings, SQL statement counts and slow-request log. Requests over
+    # SLOW_REQUEST_MS are logged with their statements, and PROFILE_SAMPLE_RATE of
+    # requests (0 to 1) are run under cProfile with the stats saved to PROFILE_DIR.
+    app.config.setdefault('SLOW_REQUEST_MS', int(os.environ.get('SLOW_REQUEST_MS', 500)))
+    app.config.setdefault('N_PLUS_ONE_THRESHOLD', int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5)))
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', 0)))
+    app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles')))
+    instrumentation.init_app(app)
+
+    # /metrics answers requests from METRICS_ALLOWED_IPS (comma separated addresses
+    # or networks) and requests with an "Authorization: Bearer <METRICS_TOKEN>" header.
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN', ''))
+    app.config.setdefault('METRICS_ALLOWED_IPS', [network.strip() for network in
+                                                  os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+                                                  if network.strip()])
+
+    # Background jobs, run by `flask jobs worker`. JOBS_RUN_INLINE=1 runs them at
+    # the end of the request instead, for development without a worker.
+    app.config.setdefault('JOBS_RUN_INLINE', os.environ.get('JOBS_RUN_INLINE', '').lower() in ('1', 'true', 'yes'))
+    app.config.setdefault('JOBS_RETRY_BACKOFF', int(os.environ.get('JOBS_RETRY_BACKOFF', 5)))
+    queue.init_app(app)
+
+    # Full-text search over published blogs: SQLite FTS5 when available, otherwise
+    # an in-memory index per worker, built by a background thread that applies
+    # every worker's changes each SEARCH_SYNC_INTERVAL seconds.
+    app.config.setdefault('SEARCH_BACKEND', os.environ.get('SEARCH_BACKEND', 'auto'))  # auto, fts5 or memory
+    app.config.setdefault('SEARCH_SYNC_INTERVAL', float(os.environ.get('SEARCH_SYNC_INTERVAL', 5)))
+    app.config.setdefault('SEARCH_RESULTS_PER_PAGE', int(os.environ.get('SEARCH_RESULTS_PER_PAGE', 20)))
+    search_index.init_app(app)
+
+    # Static assets: `flask assets build` writes minified, fingerprinted and
+    # pre-compressed copies plus a manifest that url_for() in templates resolves
+    # through, and those are served with immutable caching. Set
+    # ASSETS_USE_MANIFEST=0 to serve the source files while editing them.
+    app.config.setdefault('ASSETS_USE_MANIFEST',
+                          os.environ.get('ASSETS_USE_MANIFEST', '1').lower() in ('1', 'true', 'yes'))
+    assets.init_app(app)
+
+    # Autosave while editing a post stores patches against the last revision, with
+    # the full text every AUTOSAVE_SNAPSHOT_EVERY revisions; older history beyond
+    # AUTOSAVE_KEEP_REVISIONS is pruned a whole snapshot at a time (0 keeps it all).
+    app.config.setdefault('AUTOSAVE_SNAPSHOT_EVERY', int(os.environ.get('AUTOSAVE_SNAPSHOT_EVERY', 50)))
+    app.config.setdefault('AUTOSAVE_KEEP_REVISIONS', int(os.environ.get('AUTOSAVE_KEEP_REVISIONS', 200)))
+    app.config.setdefault('AUTOSAVE_INTERVAL_MS', int(os.environ.get('AUTOSAVE_INTERVAL_MS', 3000)))
+
+    # Blog views are counted in memory and written every VIEW_FLUSH_INTERVAL
+    # seconds in one batch. VIEW_COUNTER_BUFFER is 'memory' (per worker), a
+    # redis:// URL shared by all workers, an import path, or 'off'. Listing pages
+    # show the most read posts from each worker's in-memory top VIEW_TOP_K, which
+    # is rebuilt from the database every VIEW_TOP_REFRESH seconds.
+    app.config.setdefault('VIEW_COUNTER_BUFFER', os.environ.get('VIEW_COUNTER_BUFFER', 'memory'))
+    app.config.setdefault('VIEW_FLUSH_INTERVAL', float(os.environ.get('VIEW_FLUSH_INTERVAL', 10)))
+    app.config.setdefault('VIEW_TOP_K', int(os.environ.get('VIEW_TOP_K', 10)))
+    app.config.setdefault('VIEW_TOP_REFRESH', int(os.environ.get('VIEW_TOP_REFRESH', 300)))
+    view_counter.init_app(app)
+
+    # Related posts on the blog page are precomputed by `flask related build` and
+    # kept up to date by the related.update job (see related.py), which needs the
+    # TF-IDF vectors saved at RELATED_INDEX_PATH by the last build.
+    app.config.setdefault('RELATED_POSTS', int(os.environ.get('RELATED_POSTS', 5)))
+    app.config.setdefault('RELATED_SAME_CATEGORY',
+                          os.environ.get('RELATED_SAME_CATEGORY', '').lower() in ('1', 'true', 'yes'))
+    app.config.setdefault('RELATED_TERMS_PER_POST', int(os.environ.get('RELATED_TERMS_PER_POST', 50)))
+    app.config.setdefault('RELATED_INDEX_PATH', os.environ.get('RELATED_INDEX_PATH',
+                                                               os.path.join(app.instance_path, 'related_index.npz')))
+
+    # The site's pages, and the versioned JSON API for the mobile client
+    app.register_blueprint(bp)
+    app.register_blueprint(api)
+
+    # `flask data import` / `flask data export` for onboarding and moving data in bulk
+    app.cli.add_command(data_cli)
+
+    # `flask counts rebuild` recomputes the materialized blog counts
+    app.cli.add_command(counts_cli)
+
+    # `flask content backfill` renders posts saved before content was pre-rendered
+    app.cli.add_command(content_cli)
+
+    # `flask related build` computes every post's related posts from scratch
+    app.cli.add_command(related_cli)
+
+    # Flask-Migrate (`flask db ...`) imports all of Alembic, so it is only set up
+    # when running a flask command; app servers and tests start without it. The
+    # schema is managed by the migrations alone: run `flask db upgrade`.
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    return app
 
 
 if __name__ == '__main__':
+    # Development server: create any missing tables so a fresh checkout runs
+    # without migrating first. Deployments use `flask db upgrade` instead.
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        availability_index.rebuild()
     app.run(debug=True, port=5001)
@@ -0,0 +1,397 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import urllib.request
+
+import click
+from flask import current_app, request, send_from_directory, url_for as flask_url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only .gz copies are made
+    brotli = None
+
+# Third-party files kept in static/vendor/ by `flask assets vendor`. Until they
+# have been fetched, url_for() points pages at these CDN URLs instead.
+VENDOR = {
+    'vendor/bootstrap-4.0.0.min.css': 'https://maxcdn.bootstrapcdn.com/bootstrap/4.0.0/css/bootstrap.min.css',
+    'vendor/bootstrap-4.0.0.min.js': 'https://maxcdn.bootstrapcdn.com/bootstrap/4.0.0/js/bootstrap.min.js',
+    'vendor/jquery-1.11.1.min.js': 'https://code.jquery.com/jquery-1.11.1.min.js',
+    'vendor/bootstrap-5.3.0-alpha1.min.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0-alpha1/dist/css/bootstrap.min.css',
+    'vendor/bootstrap-5.3.0-alpha1.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0-alpha1/dist/js/bootstrap.min.js',
+    'vendor/popper-2.11.6.min.js': 'https://cdn.jsdelivr.net/npm/@popperjs/core@2.11.6/dist/umd/popper.min.js',
+}
+# SHA-256 of each VENDOR file, in `sha256sum` format, in the app's folder. A download
+# whose digest is not in it (or differs) is not written into static/.
+VENDOR_DIGESTS = 'vendor.sha256'
+
+SOURCE_DIRS = ('css', 'js', 'vendor', 'images')  # Under the static folder; images/ is not recursed into
+OUTPUT_DIR = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt')
+COMPRESS_MIN_BYTES = 256
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # In order of preference
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Uploads are stored under their SHA-256 (see uploads.save_original), and so are their resized copies
+CONTENT_ADDRESSED = re.compile(r'(^|/)[0-9a-f]{64}(-\d+)?\.\w+$')
+_STRINGS_AND_COMMENTS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+# Pieces of JavaScript that minify_js() tells apart
+_JS_SPECIAL = re.compile(r'[\'"`/{}]')
+_JS_STRING = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.S)
+_JS_TEMPLATE = re.compile(r'(?:\\.|\$(?!\{)|[^`\\$])*(`|\$\{)', re.S)  # From after the ` or }
+_JS_REGEX = re.compile(r'/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[A-Za-z]*')
+# Code after which a '/' starts a regular expression rather than a division
+_JS_BEFORE_REGEX = re.compile(r'(?:[-+*%&|^!~?:;,=<>(\[{}]|\b(?:return|typeof|instanceof|in|of|new|delete|void|'
+                              r'throw|case|do|else|yield|await))\s*$')
+
+
+def minify_css(text):
+    """Drop comments and insignificant whitespace from a stylesheet, leaving strings alone."""
+    parts = []  # Alternating code and string literals, with comments already dropped
+    code = []
+    position = 0
+    for match in _STRINGS_AND_COMMENTS.finditer(text):
+        code.append(text[position:match.start()])
+        position = match.end()
+        if match.group(1):
+            parts += [_squeeze_css(''.join(code)), match.group(1)]
+            code = []
+    code.append(text[position:])
+    parts.append(_squeeze_css(''.join(code)))
+    return ''.join(parts).replace(';}', '}').strip()
+
+
+def _squeeze_css(text):
+    text = re.sub(r'\s+', ' ', text)
+    # Not around ':' on the left, where "a :hover" differs from "a:hover"
+    return re.sub(r' ?([{};,>]) ?', r'\1', text).replace(': ', ':')
+
+
+def minify_js(text):
+    """Drop comments, indentation and blank lines from a script, leaving its literals alone.
+
+    Strings, template literals and regular expressions are copied as they
+    are, so a ``//`` or indentation inside one survives. Line breaks are
+    kept, so automatic semicolon insertion is unaffected. A script that
+    cannot be tokenized is returned unchanged. This is meant for the app's
+    own small scripts; vendored files are already minified and are copied
+    as they are.
+    """
+    try:
+        pairs = _split_js(text)
+    except ValueError:
+        return text
+    return ''.join(_squeeze_js(code) + literal for code, literal in pairs).strip() + '\n'
+
+
+def _squeeze_js(code):
+    return re.sub(r'\s*\n\s*', '\n', re.sub(r'[ \t]+', ' ', code))
+
+
+def _split_js(text):
+    """``[(code, literal), ...]`` making up ``text``, with the comments left out of the code."""
+    pairs = []
+    code = []
+    substitutions = []  # '{' still open in each ${} being read, innermost last
+    position = 0
+    while True:
+        match = _JS_SPECIAL.search(text, position)
+        if match is None:
+            code.append(text[position:])
+            pairs.append((''.join(code), ''))
+            if substitutions:
+                raise ValueError('unterminated template literal')
+            return pairs
+        start, char = match.start(), match.group()
+        code.append(text[position:start])
+        position = start + 1
+        literal = None
+        if char == '{':
+            if substitutions:
+                substitutions[-1] += 1
+            code.append(char)
+        elif char == '}' and (not substitutions or substitutions[-1]):
+            if substitutions:
+                substitutions[-1] -= 1
+            code.append(char)
+        elif char in '`}':  # A template literal, or its text after a ${}
+            if char == '}':
+                substitutions.pop()
+            literal = _JS_TEMPLATE.match(text, start + 1)
+            if literal is None:
+                raise ValueError('unterminated template literal')
+            if literal.group(1) == '${':
+                substitutions.append(0)
+        elif char in '"\'':
+            literal = _JS_STRING.match(text, start)
+            if literal is None:
+                raise ValueError('unterminated string')
+        elif text.startswith('//', start):
+            position = text.find('\n', start)
+            if position < 0:
+                position = len(text)
+        elif text.startswith('/*', start):
+            end = text.find('*/', start + 2)
+            if end < 0:
+                raise ValueError('unterminated comment')
+            code.append('\n' if '\n' in text[start:end] else ' ')
+            position = end + 2
+        else:
+            preceding = ''.join(code)
+            if preceding.strip() or not pairs:
+                regex_allowed = bool(_JS_BEFORE_REGEX.search(preceding) or not preceding.strip())
+            else:  # Right after a string, template or regex, unless that opened a ${}
+                regex_allowed = pairs[-1][1].endswith('${')
+            literal = _JS_REGEX.match(text, start) if regex_allowed else None
+            if literal is None:
+                code.append(char)  # A division
+        if literal is not None:
+            pairs.append((''.join(code), text[start:literal.end()]))
+            code = []
+            position = literal.end()
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.asset-')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_digests(path):
+    """``{name: sha256 hex}`` from a ``sha256sum``-format file; '#' starts a comment."""
+    digests = {}
+    if not os.path.exists(path):
+        return digests
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                digest, name = line.split(maxsplit=1)
+                digests[name.lstrip('*')] = digest.lower()
+    return digests
+
+
+def save_digests(path, digests):
+    lines = [f'{digests[name]}  {name}\n' for name in sorted(digests)]
+    header = ('# SHA-256 of the files fetched by `flask assets vendor`, in `sha256sum` format.\n'
+              '# Record them with `flask assets vendor --pin` after checking the downloads.\n')
+    _write_atomic(path, (header + ''.join(lines)).encode())
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+
+def source_files(static_folder):
+    """Paths (relative to the static folder, with '/') of every file the pipeline processes."""
+    for directory in SOURCE_DIRS:
+        root = os.path.join(static_folder, directory)
+        if not os.path.isdir(root):
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            if directory == 'images':
+                dirnames.clear()  # Uploads live below images/ and are already content-addressed
+            for filename in sorted(filenames):
+                if not filename.startswith('.'):
+                    yield os.path.relpath(os.path.join(dirpath, filename), static_folder).replace(os.sep, '/')
+
+
+def build(static_folder):
+    """Minify, fingerprint and pre-compress the static assets into static/dist/.
+
+    Each file is written as ``dist/<name>.<hash>.<ext>`` with .gz (and .br)
+    copies next to it, and ``dist/manifest.json`` maps the original names to
+    those. Files from the previous build are kept so pages rendered by
+    workers that have not restarted yet still resolve; older ones are
+    removed. Returns the manifest and ``{'files', 'source_bytes',
+    'output_bytes', 'gzip_bytes', 'br_bytes'}``.
+    """
+    output_root = os.path.join(static_folder, OUTPUT_DIR)
+    previous = load_manifest(static_folder)
+    manifest = {}
+    stats = dict.fromkeys(('files', 'source_bytes', 'output_bytes', 'gzip_bytes', 'br_bytes'), 0)
+
+    for name in source_files(static_folder):
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            data = f.read()
+        stats['files'] += 1
+        stats['source_bytes'] += len(data)
+        stem, extension = os.path.splitext(name)
+        if not stem.endswith('.min'):
+            if extension == '.css':
+                data = minify_css(data.decode('utf-8')).encode('utf-8')
+            elif extension == '.js':
+                data = minify_js(data.decode('utf-8')).encode('utf-8')
+        stats['output_bytes'] += len(data)
+
+        output = f'{OUTPUT_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        manifest[name] = output
+        path = os.path.join(static_folder, output)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        if extension in COMPRESSIBLE and len(data) >= COMPRESS_MIN_BYTES:
+            if not os.path.exists(path + '.gz'):
+                _write_atomic(path + '.gz', gzip.compress(data, 9, mtime=0))
+            stats['gzip_bytes'] += os.path.getsize(path + '.gz')
+            if brotli is not None:
+                if not os.path.exists(path + '.br'):
+                    _write_atomic(path + '.br', brotli.compress(data, quality=11))
+                stats['br_bytes'] += os.path.getsize(path + '.br')
+
+    _write_atomic(os.path.join(output_root, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+    keep = set(manifest.values()) | set(previous.values())
+    for dirpath, _, filenames in os.walk(output_root):
+        for filename in filenames:
+            relative = os.path.relpath(os.path.join(dirpath, filename), static_folder).replace(os.sep, '/')
+            if filename != MANIFEST and re.sub(r'\.(gz|br)$', '', relative) not in keep:
+                os.remove(os.path.join(dirpath, filename))
+    return manifest, stats
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, OUTPUT_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+class AssetPipeline:
+    """Serves the fingerprinted assets made by ``flask assets build``.
+
+    ``url_for('static', filename='css/style.css')`` in templates resolves
+    through the manifest to the fingerprinted copy, which is sent with a
+    one-year immutable Cache-Control and, when the client accepts it, as
+    its pre-compressed .br or .gz file. Content-addressed uploads get the
+    same headers. Other static files are served as Flask normally does.
+    Without a manifest (e.g. in development before a build) names are
+    left as they are.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.outputs = set()
+        self.encodings = {}
+        self.vendored = set()
+        self.cli = AppGroup('assets', help='Build and vendor the static assets.')
+        self._register_commands()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_USE_MANIFEST', True)
+        if app.config['ASSETS_USE_MANIFEST']:
+            self.load(app.static_folder)
+        else:
+            self.vendored = {name for name in VENDOR if os.path.exists(os.path.join(app.static_folder, name))}
+        app.jinja_env.globals['url_for'] = self.url_for
+        app.view_functions['static'] = self.send_static
+        app.cli.add_command(self.cli)
+
+    def load(self, static_folder):
+        self.manifest = load_manifest(static_folder)
+        self.outputs = set(self.manifest.values())
+        self.encodings = {}
+        for output in self.outputs:
+            path = os.path.join(static_folder, output)
+            available = [encoding for encoding, suffix in ENCODINGS if os.path.exists(path + suffix)]
+            if available:
+                self.encodings[output] = available
+        self.vendored = {name for name in VENDOR if os.path.exists(os.path.join(static_folder, name))}
+
+    def url_for(self, endpoint, **values):
+        """Flask's url_for, with static filenames resolved through the manifest."""
+        if endpoint == 'static' and 'filename' in values:
+            filename = values['filename']
+            if filename in self.manifest:
+                values['filename'] = self.manifest[filename]
+            elif filename in VENDOR and filename not in self.vendored:
+                return VENDOR[filename]
+        return flask_url_for(endpoint, **values)
+
+    def send_static(self, filename):
+        available = self.encodings.get(filename, ())
+        accepted = request.accept_encodings
+        encoding = next((encoding for encoding in available if accepted[encoding]), None)
+        if encoding is not None:
+            response = send_from_directory(current_app.static_folder, filename + dict(ENCODINGS)[encoding],
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = current_app.send_static_file(filename)
+        if available:
+            response.vary.add('Accept-Encoding')
+        if filename in self.outputs or CONTENT_ADDRESSED.search(filename):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    def _register_commands(self):
+        pipeline = self
+
+        @self.cli.command('build')
+        def build_command():
+            """Minify, fingerprint and compress the static assets and write the manifest."""
+            manifest, stats = build(current_app.static_folder)
+            pipeline.load(current_app.static_folder)
+            click.echo(f"Built {stats['files']} file(s): {stats['source_bytes']} bytes, "
+                       f"{stats['output_bytes']} minified, {stats['gzip_bytes']} gzip"
+                       + (f", {stats['br_bytes']} brotli" if brotli is not None else '') + '.')
+            click.echo('Restart the app to serve the new manifest.')
+
+        @self.cli.command('vendor')
+        @click.option('--force', is_flag=True, help='Download files that are already present again.')
+        @click.option('--pin', is_flag=True,
+                      help=f'Record the digests of the downloads in {VENDOR_DIGESTS} instead of checking them.')
+        def vendor_command(force, pin):
+            """Download the pinned third-party CSS/JS into static/vendor/.
+
+            Each download is checked against its SHA-256 in vendor.sha256 and
+            is only written if it matches. After upgrading a file, check the
+            new copy and run again with ``--pin --force`` to record it.
+            """
+            digests_path = os.path.join(current_app.root_path, VENDOR_DIGESTS)
+            digests = load_digests(digests_path)
+            failed = 0
+            for name, url in VENDOR.items():
+                path = os.path.join(current_app.static_folder, name)
+                if os.path.exists(path) and not force:
+                    continue
+                data = fetch(url)
+                digest = hashlib.sha256(data).hexdigest()
+                if pin:
+                    digests[name] = digest
+                elif name not in digests:
+                    click.echo(f'{name}: no digest in {VENDOR_DIGESTS}; not written', err=True)
+                    failed += 1
+                    continue
+                elif digests[name] != digest:
+                    click.echo(f'{name}: SHA-256 {digest} from {url} does not match {digests[name]}; not written',
+                               err=True)
+                    failed += 1
+                    continue
+                _write_atomic(path, data)
+                click.echo(f'{name}: {len(data)} bytes from {url}, SHA-256 {digest}')
+            if pin:
+                save_digests(digests_path, digests)
+                click.echo(f'Digests recorded in {VENDOR_DIGESTS}.')
+            if failed:
+                raise SystemExit(1)
+            click.echo('Run `flask assets build` to fingerprint them.')
+
+
+assets = AssetPipeline()
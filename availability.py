@@ -0,0 +1,250 @@
+"""Username and email availability checks for signup, mostly answered from memory.
+
+Each worker keeps a Bloom filter of every username and email in the user
+table, plus a small LRU of values the database recently reported taken. A
+value the filter has never seen is certainly free, so most lookups for new
+names never reach the database; only the filter's "maybe" (a taken value,
+or a rare false positive) is looked up. Only "taken" answers are
+remembered: a free value can be taken by another worker at any moment,
+while a taken one stays taken unless its user is deleted. The unique
+constraints stay the final word: a name taken in another worker since the
+last rebuild is still rejected at commit.
+
+The filters hold values folded the way MySQL's default collations compare
+them (case, accents and trailing spaces ignored), so a value the database
+would consider equal to a stored one is never reported free. Folding more
+than the database does only costs an extra lookup.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from models import db, User
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('username', 'email')
+
+
+def fold(value):
+    """``value`` with case, accents and trailing spaces removed, as the filters store it."""
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().rstrip(' ')
+
+
+class BloomFilter:
+    """A fixed-size set that can answer "maybe present" for values never added, but never misses one that was.
+
+    Sized for ``capacity`` values at a false positive rate of ``error_rate``;
+    past its capacity the rate climbs, so it should be rebuilt larger.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def __len__(self):
+        return self.count
+
+
+class AvailabilityIndex:
+    """Per-worker Bloom filters and LRU over ``User.username`` and ``User.email``.
+
+    Built at worker boot (see gunicorn.conf.py), updated by the signups and
+    deletions this worker handles, and rebuilt every ``refresh_interval``
+    seconds to pick up other workers' writes, or sooner once it holds more
+    values than it was sized for. Rebuilds run on a background thread while
+    the old filters keep answering; until the first one is done, lookups go
+    to the database.
+    """
+
+    # Seconds before a failed background rebuild is tried again
+    RETRY_AFTER = 30
+
+    def __init__(self, app=None):
+        self.filters = None
+        self.error_rate = 0.01
+        self.cache_size = 4096
+        self.refresh_interval = 300
+        self.app = None
+        self._cache = OrderedDict()  # {(field, value): True} for values found taken, most recent last
+        self._built_at = None
+        self._failed_at = None
+        self._rebuilding = None  # The background rebuild thread, while one runs
+        self._added_during_rebuild = None
+        self._lock = threading.Lock()
+        self.lookups = {'filter': 0, 'cache': 0, 'database': 0}
+        self.false_positives = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AVAILABILITY_ERROR_RATE', 0.01)
+        app.config.setdefault('AVAILABILITY_CACHE_SIZE', 4096)
+        app.config.setdefault('AVAILABILITY_REFRESH_INTERVAL', 300)
+        self.error_rate = app.config['AVAILABILITY_ERROR_RATE']
+        self.cache_size = app.config['AVAILABILITY_CACHE_SIZE']
+        self.refresh_interval = app.config['AVAILABILITY_REFRESH_INTERVAL']
+        self.filters = self._built_at = self._failed_at = None
+        self.app = app
+
+    def _get_filters(self):
+        """The current filters, or None before the first build; starts a rebuild when they are due for one."""
+        filters = self.filters
+        if (filters is None or time.monotonic() - self._built_at > self.refresh_interval
+                or any(len(bloom) > bloom.capacity for bloom in filters.values())):
+            self._rebuild_in_background()
+        return filters
+
+    def _rebuild_in_background(self):
+        if self.app is None or (self._failed_at is not None
+                                and time.monotonic() - self._failed_at < self.RETRY_AFTER):
+            return
+        with self._lock:
+            if self._rebuilding is not None:
+                return
+            self._rebuilding = threading.Thread(target=self._run_rebuild, name='availability-rebuild', daemon=True)
+            self._rebuilding.start()
+
+    def _run_rebuild(self):
+        try:
+            with self.app.app_context():
+                self.rebuild()
+        except Exception:
+            self._failed_at = time.monotonic()
+            logger.exception('Rebuilding the availability filters failed')
+        finally:
+            self._rebuilding = None
+
+    def rebuild(self):
+        """Build the filters from the user table; sized for twice the current users so signups fit."""
+        with self._lock:
+            self._added_during_rebuild = []
+        try:
+            users = db.session.execute(db.select(db.func.count(User.id))).scalar()
+            filters = {field: BloomFilter(max(2 * users, 1024), self.error_rate) for field in FIELDS}
+            for username, email in db.session.execute(
+                    db.select(User.username, User.email).execution_options(yield_per=5000)):
+                filters['username'].add(fold(username))
+                filters['email'].add(fold(email))
+        except Exception:
+            with self._lock:
+                self._added_during_rebuild = None
+            raise
+        with self._lock:
+            # Signups this worker recorded while the user table was being read
+            for field, value in self._added_during_rebuild:
+                filters[field].add(value)
+            self._added_during_rebuild = None
+            self.filters = filters
+            self._cache = OrderedDict()
+            self._built_at = time.monotonic()
+            self._failed_at = None
+
+    def _remember(self, key):
+        with self._lock:
+            self._cache[key] = True
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def is_taken(self, field, value):
+        """Whether a user already has ``value`` as their ``field`` ('username' or 'email')."""
+        filters = self._get_filters()
+        key = (field, value)
+        if filters is not None and fold(value) not in filters[field]:
+            self.lookups['filter'] += 1
+            return False
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.lookups['cache'] += 1
+                return True
+        self.lookups['database'] += 1
+        column = getattr(User, field)
+        taken = db.session.execute(db.select(column).where(column == value).limit(1)).first() is not None
+        if taken:
+            self._remember(key)
+        elif filters is not None:
+            self.false_positives += 1
+        return taken
+
+    def taken(self, username=None, email=None):
+        """The names of the fields among ``username`` and ``email`` that are already in use."""
+        return [field for field, value in (('username', username), ('email', email))
+                if value and self.is_taken(field, value)]
+
+    def add(self, username, email):
+        """Record a user who just signed up (or was found at commit to exist)."""
+        filters = self._get_filters()
+        with self._lock:
+            for field, value in (('username', username), ('email', email)):
+                if filters is not None:
+                    filters[field].add(fold(value))
+                if self._added_during_rebuild is not None:
+                    self._added_during_rebuild.append((field, fold(value)))
+        for field, value in (('username', username), ('email', email)):
+            self._remember((field, value))
+
+    def recheck(self, username, email):
+        """Like ``taken()``, but asks the database and records the users found; for when a commit failed on them.
+
+        Each field is compared in SQL, so the column's collation decides what
+        counts as the same name, as it did for the unique constraint.
+        """
+        taken = []
+        for field, value in (('username', username), ('email', email)):
+            column = getattr(User, field)
+            row = db.session.execute(db.select(User.username, User.email).where(column == value).limit(1)).first()
+            if row is not None:
+                self.add(row.username, row.email)
+                self._remember((field, value))
+                taken.append(field)
+        return taken
+
+    def remove(self, username, email):
+        """Record a deleted user: forget that their values were taken, however they were spelled.
+
+        A Bloom filter cannot forget, so until the next rebuild their values
+        are looked up in the database.
+        """
+        removed = {('username', fold(username)), ('email', fold(email))}
+        with self._lock:
+            for key in [key for key in self._cache if (key[0], fold(key[1])) in removed]:
+                del self._cache[key]
+
+    def collect_metrics(self):
+        filters = self.filters or {}
+        return [
+            ('availability_lookups_total', 'counter', 'Username and email availability lookups, by what answered them.',
+             [('', {'answer': answer}, count) for answer, count in self.lookups.items()]),
+            ('availability_false_positives_total', 'counter',
+             'Lookups the Bloom filter sent to the database for a value that was free.',
+             [('', {}, self.false_positives)]),
+            ('availability_filter_bytes', 'gauge', 'Memory held by the availability Bloom filters.',
+             [('', {'field': field}, len(bloom.bits)) for field, bloom in filters.items()]),
+        ]
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,113 @@
+"""Autosave patches vs re-submitting the whole edit form, by article length.
+
+Usage: python -m benchmarks.bench_autosave [--words 1000,10000,50000] [--edits 200]
+
+For each article length a doctor makes --edits small edits (a word typed at a
+random spot) to one draft, saving after each one, first through the autosave
+endpoint and then by posting the edit form with the full content, as before
+autosave existed. Reports the request body bytes, the bytes written to the
+database (the patch or snapshot stored, or the content column rewritten) and
+p50/p95 latency per save. Runs in-process with the Flask test client.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from benchmarks.bench_routes import percentile
+
+PASSWORD = 'password'
+HASH_METHOD = 'pbkdf2:sha256:1000'
+
+
+def measure(save, edits, rng, text):
+    latencies = []
+    request_bytes = 0
+    for i in range(edits):
+        position = rng.randrange(len(text) + 1)
+        word = f' edit{i}'
+        started = time.perf_counter()
+        request_bytes += save(text, position, word)
+        latencies.append(time.perf_counter() - started)
+        text = text[:position] + word + text[position:]
+    latencies.sort()
+    return text, {'request_bytes_per_save': request_bytes // edits,
+                  'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                  'p95_ms': round(percentile(latencies, 0.95) * 1000, 2)}
+
+
+def run_length(app, client, words, edits):
+    from benchmarks.seed import sentence
+    from models import db, Blog, BlogRevision
+
+    rng = random.Random(words)
+    with app.app_context():
+        blog = Blog(title='Long read', category='Covid19', summary='Autosave benchmark', draft=True,
+                    content=sentence(rng, words), user_id=1)
+        db.session.add(blog)
+        db.session.commit()
+        blog_id, text = blog.id, blog.content
+    state = {'revision': 0}
+
+    def autosave(text, position, word):
+        body = json.dumps({'revision': state['revision'], 'patch': [[position, position, word]]})
+        response = client.post(f'/edit_blog/{blog_id}/autosave', data=body, content_type='application/json')
+        assert response.status_code == 200, response.get_data(as_text=True)
+        state['revision'] = response.get_json()['revision']
+        return len(body)
+
+    def full_save(text, position, word):
+        form = {'title': 'Long read', 'category': 'Covid19', 'summary': 'Autosave benchmark', 'draft': 'y',
+                'content': text[:position] + word + text[position:]}
+        response = client.post(f'/edit_blog/{blog_id}', data=form)
+        assert response.status_code == 302, response.get_data(as_text=True)
+        return sum(len(key) + len(value) + 2 for key, value in form.items())
+
+    text, autosave_stats = measure(autosave, edits, rng, text)
+    with app.app_context():
+        stored = db.session.execute(db.select(BlogRevision.snapshot, BlogRevision.patch)
+                                    .where(BlogRevision.blog_id == blog_id)).all()
+        autosave_stats['revisions_kept'] = len(stored)
+        autosave_stats['snapshots_kept'] = sum(snapshot is not None for snapshot, _ in stored)
+        autosave_stats['bytes_written_per_save'] = sum(
+            len(snapshot) if snapshot is not None else len(json.dumps(patch)) for snapshot, patch in stored) // edits
+
+    _, form_stats = measure(full_save, edits, rng, text)
+    form_stats['bytes_written_per_save'] = len(text)  # The content column is rewritten every time
+    return {'article_chars': len(text), 'autosave': autosave_stats, 'full_form': form_stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', default='1000,10000,50000', help='Article lengths to try, in words.')
+    parser.add_argument('--edits', type=int, default=200)
+    args = parser.parse_args()
+
+    from benchmarks.seed import use_scratch_database, seed
+    use_scratch_database()
+    os.environ.setdefault('SLOW_REQUEST_MS', '60000')  # Full saves of long posts are slow by design
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['AUTOSAVE_KEEP_REVISIONS'] = 0  # Keep everything so the bytes written can be totalled
+    with app.app_context():
+        seed(users=1, blogs=0, password_hash=generate_password_hash(PASSWORD, HASH_METHOD))
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'user0', 'password': PASSWORD})
+    assert response.status_code == 302, 'login failed'
+
+    report = {'edits': args.edits, 'lengths': {}}
+    for words in [int(words) for words in args.words.split(',')]:
+        result = run_length(app, client, words, args.edits)
+        report['lengths'][str(words)] = result
+        print(f'  {words} words: autosave {result["autosave"]["request_bytes_per_save"]} B/request, '
+              f'full form {result["full_form"]["request_bytes_per_save"]} B/request', file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
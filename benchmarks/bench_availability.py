@@ -0,0 +1,84 @@
+"""Cost of username/email availability checks, from the Bloom filter and from the database.
+
+Usage: python -m benchmarks.bench_availability [--users 100000] [--lookups 5000]
+
+Seeds --users users, rebuilds the availability filters and reports the
+rebuild time and their size. Then times lookups of free and taken usernames
+through the index against the unique-column query signup used to rely on,
+counts how many lookups reached the database, and times a duplicate signup,
+which is now rejected before the password is hashed.
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.bench_routes import percentile
+
+
+def timed(calls):
+    latencies = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return {'p50_us': round(percentile(latencies, 0.50) * 1e6, 1),
+            'p95_us': round(percentile(latencies, 0.95) * 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=5000)
+    parser.add_argument('--signups', type=int, default=20)
+    args = parser.parse_args()
+
+    from benchmarks.seed import use_scratch_database, seed
+    use_scratch_database()
+    from app import create_app
+    app = create_app()
+    from availability import availability_index
+    from models import db, User
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        seed(users=args.users, blogs=0)
+        started = time.perf_counter()
+        availability_index.rebuild()
+        report = {'users': args.users, 'rebuild_seconds': round(time.perf_counter() - started, 2),
+                  'filter_bytes': sum(len(bloom.bits) for bloom in availability_index.filters.values())}
+        rng = random.Random(7)
+        free = [f'free{i}' for i in range(args.lookups)]
+        taken = [f'user{rng.randrange(args.users)}' for _ in range(args.lookups)]
+
+        def query(value):
+            return lambda: db.session.execute(
+                db.select(User.username).where(User.username == value).limit(1)).first()
+
+        def lookup(value):
+            return lambda: availability_index.is_taken('username', value)
+
+        report['database'] = {'free': timed(query(value) for value in free),
+                              'taken': timed(query(value) for value in taken)}
+        before = dict(availability_index.lookups)
+        report['index'] = {'free': timed(lookup(value) for value in free),
+                           'taken': timed(lookup(value) for value in taken)}
+        report['index']['answered_by'] = {answer: count - before[answer]
+                                          for answer, count in availability_index.lookups.items()}
+        report['index']['false_positives'] = availability_index.false_positives
+
+    client = app.test_client()
+
+    def signup(username):
+        return lambda: client.post('/signup', data=dict(
+            first_name='A', last_name='B', username=username, email=f'{username}@bench.test',
+            password='secret1', confirm_password='secret1', address_line1='x', city='c', state='s',
+            pincode='123456', user_type='Patient'))
+
+    report['signup'] = {'new': timed(signup(f'new{i}') for i in range(args.signups)),
+                        'duplicate': timed(signup(f'user{i}') for i in range(args.signups))}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
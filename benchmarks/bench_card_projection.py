@@ -0,0 +1,98 @@
+"""Compare listing pages built from full Blog entities with BlogCard projections.
+
+Usage: python -m benchmarks.bench_card_projection [--blogs 10000]
+
+Each mode runs in a fresh subprocess against the same seeded SQLite file so
+that the RSS numbers are not polluted by the other mode.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def row_bytes(row):
+    return sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in row if value is not None)
+
+
+def run_mode(mode, per_page):
+    from app import create_app
+    app = create_app()
+    from models import db, Blog, BlogCard
+    from pagination import keyset_query
+
+    with app.app_context():
+        query = Blog.published()
+        if mode.startswith('cards'):
+            query = query.with_entities(*Blog.card_columns())
+        if mode.endswith('_page'):
+            query = keyset_query(query, limit=per_page + 1)
+        else:
+            query = query.order_by(Blog.date_posted.desc())
+
+        # Bytes are counted on the raw rows the database sends back
+        raw = db.session.connection().execute(query.statement).all()
+        transferred = sum(row_bytes(row) for row in raw)
+        db.session.expunge_all()
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        tracemalloc.start()
+        started = time.perf_counter()
+        rows = query.all()
+        if mode.startswith('cards'):
+            items = [BlogCard.from_row(row) for row in rows]
+        else:
+            items = rows
+            [blog.truncated_summary() for blog in items]
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {
+        'mode': mode,
+        'rows': len(items),
+        'bytes_transferred': transferred,
+        'python_peak_bytes': peak,
+        'rss_growth_kb': rss_after - rss_before,
+        'seconds': round(elapsed, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blogs', type=int, default=10000)
+    parser.add_argument('--per-page', type=int, default=12)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.per_page)))
+        return
+
+    from benchmarks.seed import use_scratch_database, seed
+    use_scratch_database()
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        seed(blogs=args.blogs)
+
+    results = []
+    for mode in ('entities_all', 'cards_all', 'entities_page', 'cards_page'):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_card_projection', '--mode', mode,
+             '--per-page', str(args.per_page)],
+            cwd=ROOT, env=os.environ, check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Compare how many concurrent connections each gunicorn worker class sustains.
+
+Usage: python -m benchmarks.bench_concurrency [--modes sync,gthread,gevent]
+           [--levels 1,8,32,64,128] [--workers 2] [--threads 8]
+           [--worker-connections 100] [--latency-ms 5] [--route view_blogs]
+           [--slo-ms 500] [--output report.json]
+
+Seeds a scratch SQLite database and serves the app with gunicorn.conf.py in
+each mode, using the same number of worker processes, through
+benchmarks.latency_app, which adds --latency-ms before every SQL statement
+like a database across the network would. The page cache is off so every
+request reaches the database. For each number of concurrent logged-in
+clients it reports throughput, p50/p95 latency and errors, and as
+``capacity`` the highest level served within --slo-ms at p95 without errors.
+Modes whose worker class is not installed (gevent) are skipped.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+
+from benchmarks.bench_routes import HttpTransport, gunicorn_server, make_users, run_route
+
+HASH_METHOD = 'pbkdf2:sha256:1000'  # Logging in the clients is setup, not what is measured
+
+
+def available_modes(requested):
+    modes = []
+    for mode in requested:
+        if mode == 'gevent' and importlib.util.find_spec('gevent') is None:
+            print('gevent is not installed; skipping the gevent mode', file=sys.stderr)
+            continue
+        modes.append(mode)
+    return modes
+
+
+def run_mode(mode, db_path, env, args):
+    env = {**env, 'GUNICORN_WORKER_CLASS': mode, 'GUNICORN_THREADS': str(args.threads),
+           'GUNICORN_WORKER_CONNECTIONS': str(args.worker_connections)}
+    results = {}
+    with gunicorn_server(db_path, env, args.workers, app_module='benchmarks.latency_app:create_app()') as (base_url, pid):
+        clients = make_users(lambda: HttpTransport(base_url), max(args.levels), db_path, 'Patient')
+        for level in args.levels:
+            stats = run_route(args.route, clients[:level], max(args.requests, level * 4), pid)
+            results[str(level)] = stats
+            print(f'  {mode} x{level}: {stats["throughput_rps"]} req/s, p95 {stats["p95_ms"]} ms, '
+                  f'errors {sum(stats["errors"].values())}', file=sys.stderr)
+    capacity = 0
+    for level in args.levels:
+        stats = results[str(level)]
+        if stats['errors'] or stats['p95_ms'] is None or stats['p95_ms'] > args.slo_ms:
+            break
+        capacity = level
+    return {'levels': results, 'capacity': capacity,
+            'peak_throughput_rps': max(stats['throughput_rps'] for stats in results.values())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='sync,gthread,gevent')
+    parser.add_argument('--levels', default='1,8,32,64,128', help='Concurrent clients to try, in order.')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes in every mode.')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gthread worker.')
+    parser.add_argument('--worker-connections', type=int, default=100, help='Greenlets per gevent worker.')
+    parser.add_argument('--latency-ms', type=float, default=5, help='Delay added before every SQL statement.')
+    parser.add_argument('--route', default='view_blogs', choices=('view_blogs', 'view_blog', 'dashboard'))
+    parser.add_argument('--requests', type=int, default=200, help='Minimum requests per level.')
+    parser.add_argument('--slo-ms', type=float, default=500)
+    parser.add_argument('--users', type=int, default=256)
+    parser.add_argument('--blogs', type=int, default=2000)
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout.')
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(',') if level]
+
+    from benchmarks.seed import use_scratch_database, seed
+    db_path = use_scratch_database()
+    os.environ.update({
+        'PASSWORD_HASH_METHOD': HASH_METHOD,
+        'PAGE_CACHE_BACKEND': 'none',  # Every request goes to the database
+        'BENCH_DB_LATENCY_MS': str(args.latency_ms),
+        'SLOW_REQUEST_MS': '60000',
+        'LOGIN_LIMIT_PER_IP': str(10 ** 9),
+        'LOGIN_LIMIT_PER_USERNAME': str(10 ** 9),
+    })
+    env = dict(os.environ)
+
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        seed(users=args.users, blogs=args.blogs, content_words=300,
+             password_hash=generate_password_hash('password', HASH_METHOD))
+
+    modes = {}
+    for mode in available_modes(args.modes.split(',')):
+        print(f'{mode}:', file=sys.stderr)
+        modes[mode] = run_mode(mode, db_path, env, args)
+
+    report = {
+        'config': {'workers': args.workers, 'threads': args.threads, 'worker_connections': args.worker_connections,
+                   'latency_ms': args.latency_ms, 'route': args.route, 'slo_ms': args.slo_ms,
+                   'cpus': os.cpu_count(), 'python': sys.version.split()[0]},
+        'modes': modes,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Measure login latency at a fixed concurrency through the Flask test client.
+
+Usage: python -m benchmarks.bench_login [--concurrency 16] [--requests 400]
+                                        [--workers 2] [--queue-depth 16]
+
+--workers 0 hashes inline on the request threads (the old behaviour) so the
+two modes can be compared. Requests rejected with 503 are counted separately
+and left out of the latency percentiles.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--queue-depth', type=int, default=16)
+    parser.add_argument('--method', default='scrypt')
+    args = parser.parse_args()
+
+    from benchmarks.seed import use_scratch_database, seed
+    use_scratch_database()
+    os.environ['PASSWORD_HASH_METHOD'] = args.method
+    os.environ['PASSWORD_HASH_WORKERS'] = str(args.workers)
+    os.environ['PASSWORD_HASH_QUEUE_DEPTH'] = str(args.queue_depth)
+    # Every simulated client shares one IP; measure the routes, not the login throttle
+    os.environ['LOGIN_LIMIT_PER_IP'] = os.environ['LOGIN_LIMIT_PER_USERNAME'] = str(10 ** 9)
+
+    from werkzeug.security import generate_password_hash
+    from app import create_app, password_hasher
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        seed(users=args.users, blogs=0, password_hash=generate_password_hash('password', args.method))
+
+    local = threading.local()
+
+    def one_login(i):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        response = client.post('/login', data={'username': f'user{i % args.users}', 'password': 'password'})
+        return response.status_code, time.perf_counter() - started
+
+    one_login(0)  # Start the pool before timing
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(one_login, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    password_hasher.shutdown()
+
+    ok = [latency for status, latency in results if status == 302]
+    print(json.dumps({
+        'concurrency': args.concurrency,
+        'workers': args.workers,
+        'method': args.method,
+        'requests': args.requests,
+        'succeeded': len(ok),
+        'rejected_503': sum(1 for status, _ in results if status == 503),
+        'throughput_rps': round(len(ok) / elapsed, 1),
+        'p50_ms': round(percentile(ok, 0.50) * 1000, 1) if ok else None,
+        'p99_ms': round(percentile(ok, 0.99) * 1000, 1) if ok else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
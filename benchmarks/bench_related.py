@@ -0,0 +1,83 @@
+"""Build time and memory of the related posts index, and the cost of keeping it up to date.
+
+Usage: python -m benchmarks.bench_related [--blogs 100000] [--content-words 300] [--updates 50]
+
+Seeds synthetic posts, then runs ``flask related build`` both across all
+categories and within each category, reporting the time per phase, the peak
+RSS growth, the size of the vectors in memory and on disk, and how many
+rows blog_related holds. Then times the incremental update job for
+--updates single-post edits, and the indexed lookup the blog page makes.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import time
+
+from benchmarks.bench_routes import percentile
+
+
+def timed(calls):
+    latencies = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return {'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blogs', type=int, default=100000)
+    parser.add_argument('--content-words', type=int, default=300)
+    parser.add_argument('--updates', type=int, default=50)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    from benchmarks.seed import use_scratch_database, seed, sentence
+    db_path = use_scratch_database()
+    os.environ['RELATED_INDEX_PATH'] = os.path.join(os.path.dirname(db_path), 'related_index.npz')
+    from app import create_app
+    app = create_app()
+    from models import db, Blog
+    import related
+
+    with app.app_context():
+        started = time.perf_counter()
+        seed(users=20, blogs=args.blogs, content_words=args.content_words)
+        report = {'blogs': args.blogs, 'content_words': args.content_words,
+                  'seed_seconds': round(time.perf_counter() - started, 1), 'builds': {}}
+        rng = random.Random(7)
+
+        for name, same_category in (('any_category', False), ('same_category', True)):
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            stats = related.build(same_category=same_category)
+            stats['total_seconds'] = round(sum(stats['seconds'].values()), 2)
+            stats['peak_rss_growth_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+            stats['index_file_bytes'] = os.path.getsize(app.config['RELATED_INDEX_PATH'])
+            report['builds'][name] = stats
+
+        # Each update edits one published post, as saving the edit form does, then runs the job
+        published = db.session.execute(db.select(Blog.id).where(Blog.draft == False)).scalars().all()  # noqa: E712
+
+        def edit_and_update(blog_id):
+            def call():
+                db.session.execute(db.update(Blog).where(Blog.id == blog_id)
+                                   .values(content=sentence(rng, args.content_words)))
+                db.session.commit()
+                report.setdefault('pages_invalidated', []).append(len(related.update([blog_id])))
+            return call
+
+        report['update'] = timed(edit_and_update(blog_id) for blog_id in rng.sample(published, args.updates))
+        invalidated = report.pop('pages_invalidated')
+        report['update']['pages_invalidated_mean'] = round(sum(invalidated) / len(invalidated), 1)
+        report['lookup'] = timed((lambda blog_id=blog_id: related.for_blog(blog_id))
+                                 for blog_id in rng.choices(published, k=args.lookups))
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
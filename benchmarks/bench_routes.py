@@ -0,0 +1,401 @@
+"""Load-test the auth and blog routes through the test client and a real gunicorn.
+
+Usage: python -m benchmarks.bench_routes [--mode client|gunicorn|both]
+           [--users 50] [--blogs 5000] [--concurrency 8] [--requests 200]
+           [--gunicorn-workers 2] [--output report.json]
+           [--baseline old.json] [--threshold 0.25]
+
+Seeds a scratch SQLite database, then drives login, dashboard, view_blogs,
+view_blog, create_blog and edit_blog one route at a time at a fixed
+concurrency, with real CSRF tokens and sessions. Each route reports
+throughput, p50/p95/p99 latency of successful requests, errors and the peak
+RSS of the serving process(es) while it ran, as JSON.
+
+With --baseline the run is compared with an earlier report and the exit
+status is 1 if any route's p95 latency grew, or its throughput fell, by more
+than --threshold (a fraction). ``--current new.json --baseline old.json``
+compares two saved reports without running anything.
+"""
+import argparse
+import contextlib
+import http.cookiejar
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = ('login', 'dashboard', 'view_blogs', 'view_blog', 'create_blog', 'edit_blog')
+PASSWORD = 'password'
+CSRF_RE = re.compile(rb'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def rss_kb(pid):
+    """Resident set size of ``pid`` and all of its descendants, from /proc (Linux only)."""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as status:
+                total += next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+            with open(f'/proc/{current}/task/{current}/children') as children:
+                pending.extend(int(child) for child in children.read().split())
+        except (OSError, StopIteration):
+            continue
+    return total
+
+
+class PeakRSS:
+    """Samples the RSS of a process tree in the background and keeps the peak."""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_kb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_kb(self.pid))
+
+
+class ClientTransport:
+    """One browser session against the app in this process (Flask test client)."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.data
+
+    def post(self, path, data):
+        response = self.client.post(path, data=data)
+        return response.status_code, response.data
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport:
+    """One browser session against a running server, with its own cookie jar."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data):
+        return self._open(urllib.request.Request(self.base_url + path, data=urllib.parse.urlencode(data).encode()))
+
+
+class VirtualUser:
+    """A logged-in user with a CSRF token, issuing one request per route call."""
+
+    def __init__(self, transport, username, user_type, blog_ids, own_blog_ids, rng):
+        self.transport = transport
+        self.username = username
+        self.user_type = user_type
+        self.blog_ids = blog_ids
+        self.own_blog_ids = own_blog_ids
+        self.rng = rng
+        self.csrf_token = self._csrf_token('/login')
+
+    def _csrf_token(self, path):
+        _, body = self.transport.get(path)
+        match = CSRF_RE.search(body)
+        return match.group(1).decode() if match else ''
+
+    def login(self):
+        return self.transport.post('/login', {'username': self.username, 'password': PASSWORD,
+                                              'csrf_token': self.csrf_token})[0]
+
+    def dashboard(self):
+        return self.transport.get('/dashboard')[0]
+
+    def view_blogs(self):
+        category = self.rng.choice(['', 'Mental Health', 'Heart Disease', 'Covid19', 'Immunization'])
+        return self.transport.get('/blogs' + ('?' + urllib.parse.urlencode({'category': category})
+                                              if category else ''))[0]
+
+    def view_blog(self):
+        return self.transport.get(f'/blog/{self.rng.choice(self.blog_ids)}')[0]
+
+    def _blog_form(self):
+        return {'title': f'Load test {self.rng.random():.6f}', 'category': self.rng.choice(
+            ['Mental Health', 'Heart Disease', 'Covid19', 'Immunization']),
+            'summary': 'A short summary written by the load test.',
+            'content': 'Body text written by the load test. ' * 40, 'csrf_token': self.csrf_token}
+
+    def create_blog(self):
+        return self.transport.post('/create_blog', self._blog_form())[0]
+
+    def edit_blog(self):
+        return self.transport.post(f'/edit_blog/{self.rng.choice(self.own_blog_ids)}', self._blog_form())[0]
+
+
+# Status codes that count as success for each route; anything else is an error
+EXPECTED = {'login': {302}, 'dashboard': {200}, 'view_blogs': {200, 304}, 'view_blog': {200, 304},
+            'create_blog': {302}, 'edit_blog': {302}}
+
+
+def load_fixtures(db_path):
+    connection = sqlite3.connect(db_path)
+    users = connection.execute('SELECT id, username, user_type FROM user ORDER BY id').fetchall()
+    published = [row[0] for row in connection.execute('SELECT id FROM blog WHERE draft = 0')]
+    owned = {}
+    for blog_id, user_id in connection.execute('SELECT id, user_id FROM blog'):
+        owned.setdefault(user_id, []).append(blog_id)
+    connection.close()
+    return users, published, owned
+
+
+def make_users(make_transport, concurrency, db_path, user_type):
+    """Log in ``concurrency`` distinct users of ``user_type`` (doctors must own blogs)."""
+    users, published, owned = load_fixtures(db_path)
+    candidates = [row for row in users if row[2] == user_type and (user_type != 'Doctor' or row[0] in owned)]
+    virtual_users = []
+    for i in range(concurrency):
+        user_id, username, _ = candidates[i % len(candidates)]
+        user = VirtualUser(make_transport(), username, user_type, published, owned.get(user_id, []),
+                           random.Random(i))
+        if user.login() != 302:
+            raise RuntimeError(f'Could not log in as {username}')
+        if user_type == 'Doctor':
+            user.csrf_token = user._csrf_token('/create_blog') or user.csrf_token
+        virtual_users.append(user)
+    return virtual_users
+
+
+def run_route(route, virtual_users, requests, pid):
+    """Issue ``requests`` calls of ``route`` spread over the virtual users; return the stats."""
+    concurrency = len(virtual_users)
+    for user in virtual_users:  # Warm up: first-use costs (pools, caches, indexes) are not measured
+        getattr(user, route)()
+
+    def worker(user, count):
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            status = getattr(user, route)()
+            samples.append((status, time.perf_counter() - started))
+        return samples
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    with PeakRSS(pid) as rss, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        results = [sample for samples in executor.map(worker, virtual_users, shares) for sample in samples]
+        elapsed = time.perf_counter() - started
+
+    ok = [latency for status, latency in results if status in EXPECTED[route]]
+    errors = {}
+    for status, _ in results:
+        if status not in EXPECTED[route]:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    return {
+        'requests': len(results),
+        'succeeded': len(ok),
+        'errors': errors,
+        'throughput_rps': round(len(ok) / elapsed, 1),
+        'p50_ms': round(percentile(ok, 0.50) * 1000, 2) if ok else None,
+        'p95_ms': round(percentile(ok, 0.95) * 1000, 2) if ok else None,
+        'p99_ms': round(percentile(ok, 0.99) * 1000, 2) if ok else None,
+        'peak_rss_kb': rss.peak,
+    }
+
+
+def run_routes(make_transport, db_path, args, pid):
+    results = {}
+    for route in args.routes:
+        user_type = 'Doctor' if route in ('create_blog', 'edit_blog') else 'Patient'
+        virtual_users = make_users(make_transport, args.concurrency, db_path, user_type)
+        results[route] = run_route(route, virtual_users, args.requests, pid)
+        print(f'  {route}: {results[route]["throughput_rps"]} req/s, p95 {results[route]["p95_ms"]} ms',
+              file=sys.stderr)
+    return results
+
+
+def run_client(db_path, args):
+    from app import create_app, password_hasher
+    app = create_app()
+    try:
+        return run_routes(lambda: ClientTransport(app), db_path, args, os.getpid())
+    finally:
+        password_hasher.shutdown()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def gunicorn_server(db_path, env, workers, extra_args=(), app_module='app:create_app()'):
+    """Run gunicorn on a free port against ``db_path``; yields its base URL and pid."""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning', *extra_args, app_module],
+        cwd=ROOT, env={**env, 'DATABASE_URL': f'sqlite:///{db_path}'})
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.2)
+        yield f'http://127.0.0.1:{port}', server.pid
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def run_gunicorn(db_path, args, env):
+    with gunicorn_server(db_path, env, args.gunicorn_workers) as (base_url, pid):
+        return run_routes(lambda: HttpTransport(base_url), db_path, args, pid)
+
+
+def compare(baseline, current, threshold):
+    """Return a list of regressions of ``current`` against ``baseline``."""
+    regressions = []
+    for mode, routes in current['modes'].items():
+        for route, stats in routes.items():
+            before = baseline.get('modes', {}).get(mode, {}).get(route)
+            if not before or not before.get('p95_ms') or not stats.get('p95_ms'):
+                continue
+            latency_change = stats['p95_ms'] / before['p95_ms'] - 1
+            throughput_change = stats['throughput_rps'] / before['throughput_rps'] - 1 \
+                if before['throughput_rps'] else 0
+            line = (f'{mode:9} {route:12} p95 {before["p95_ms"]:>9} -> {stats["p95_ms"]:>9} ms ({latency_change:+.0%})'
+                    f'  throughput {before["throughput_rps"]:>8} -> {stats["throughput_rps"]:>8} '
+                    f'({throughput_change:+.0%})')
+            regressed = latency_change > threshold or throughput_change < -threshold
+            print(('REGRESSED ' if regressed else 'ok        ') + line, file=sys.stderr)
+            if regressed:
+                regressions.append(f'{mode}/{route}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('client', 'gunicorn', 'both'), default='both')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--blogs', type=int, default=5000)
+    parser.add_argument('--draft-ratio', type=float, default=0.1)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route.')
+    parser.add_argument('--routes', default=','.join(ROUTES), help='Comma separated subset of routes.')
+    parser.add_argument('--gunicorn-workers', type=int, default=2)
+    parser.add_argument('--hash-method', default='scrypt')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout.')
+    parser.add_argument('--baseline', help='Earlier report to compare against.')
+    parser.add_argument('--current', help='Compare this saved report instead of running.')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args()
+    args.routes = [route for route in args.routes.split(',') if route]
+
+    if args.current:
+        with open(args.current) as f:
+            report = json.load(f)
+    else:
+        report = run(args)
+        print(json.dumps(report, indent=2))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f'Regressions past {args.threshold:.0%}: {", ".join(regressions)}', file=sys.stderr)
+            sys.exit(1)
+
+
+def run(args):
+    from benchmarks.seed import use_scratch_database, seed
+    db_path = use_scratch_database()
+    # Keep the server's hashing method equal to the seeded one so logins never rehash
+    os.environ['PASSWORD_HASH_METHOD'] = args.hash_method
+    os.environ.setdefault('SLOW_REQUEST_MS', '60000')  # Logins are slow by design; keep the log quiet
+    # Every simulated client shares one IP; measure the routes, not the login throttle
+    os.environ['LOGIN_LIMIT_PER_IP'] = os.environ['LOGIN_LIMIT_PER_USERNAME'] = str(10 ** 9)
+    env = dict(os.environ)
+
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        seed(users=args.users, blogs=args.blogs, content_words=300, draft_ratio=args.draft_ratio,
+             password_hash=generate_password_hash(PASSWORD, args.hash_method))
+    # Each mode starts from the same freshly seeded data
+    pristine = os.path.join(tempfile.mkdtemp(prefix='blog-bench-'), 'pristine.db')
+    shutil.copy(db_path, pristine)
+
+    modes = {}
+    if args.mode in ('client', 'both'):
+        print('client:', file=sys.stderr)
+        modes['client'] = run_client(db_path, args)
+    if args.mode in ('gunicorn', 'both'):
+        print('gunicorn:', file=sys.stderr)
+        server_db = os.path.join(os.path.dirname(pristine), 'server.db')
+        shutil.copy(pristine, server_db)
+        modes['gunicorn'] = run_gunicorn(server_db, args, env)
+
+    return {
+        'config': {'users': args.users, 'blogs': args.blogs, 'concurrency': args.concurrency,
+                   'requests_per_route': args.requests, 'gunicorn_workers': args.gunicorn_workers,
+                   'hash_method': args.hash_method, 'python': sys.version.split()[0]},
+        'modes': modes,
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Build time, memory and query latency of the search backends on synthetic posts.
+
+Usage: python -m benchmarks.bench_search [--blogs 100000] [--content-words 150]
+"""
+import argparse
+import json
+import random
+import resource
+import time
+
+
+def timed_queries(search_index, queries, category=None):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        search_index.search(query, category=category, limit=20)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blogs', type=int, default=100000)
+    parser.add_argument('--content-words', type=int, default=150)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    from benchmarks.seed import use_scratch_database, seed, VOCABULARY, CATEGORIES
+    use_scratch_database()
+    from app import create_app
+    app = create_app()
+    from search import search_index, FTS5Backend
+
+    with app.app_context():
+        started = time.perf_counter()
+        seed(users=20, blogs=args.blogs, content_words=args.content_words)
+        seed_seconds = time.perf_counter() - started
+
+        rng = random.Random(7)
+        queries = [' '.join(rng.sample(VOCABULARY[:2000], rng.choice((1, 2, 3)))) for _ in range(args.queries)]
+        report = {'blogs': args.blogs, 'content_words': args.content_words,
+                  'seed_seconds': round(seed_seconds, 1), 'backends': {}}
+
+        for name in ('fts5', 'memory'):
+            if name == 'fts5' and not FTS5Backend.available(app.extensions['sqlalchemy'].engine):
+                continue
+            search_index._backend_name = name
+            search_index.backend = search_index._use_fts5 = None
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            started = time.perf_counter()
+            if name == 'fts5':
+                search_index.rebuild()
+            else:
+                search_index.sync()  # What the worker's background thread runs first
+            build_seconds = time.perf_counter() - started
+            result = {'build_seconds': round(build_seconds, 2),
+                      'peak_rss_growth_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before}
+            if name == 'memory':
+                postings = search_index.backend.postings.values()
+                result['terms'] = len(search_index.backend.postings)
+                result['postings'] = sum(len(ids) for ids, _ in postings)
+                result['postings_bytes'] = sum(ids.itemsize * len(ids) + tfs.itemsize * len(tfs)
+                                               for ids, tfs in postings)
+            result['query'] = timed_queries(search_index, queries)
+            result['query_with_category'] = timed_queries(search_index, queries, category=CATEGORIES[0])
+            report['backends'][name] = result
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
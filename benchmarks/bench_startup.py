@@ -0,0 +1,105 @@
+"""Cold-start cost of the app: module import time and gunicorn boot to first response.
+
+Usage: python -m benchmarks.bench_startup [--runs 7] [--workers 2]
+           [--budget-ms 1000] [--output report.json]
+
+Each import run starts a fresh interpreter and times ``import app`` plus
+``create_app()`` inside it (and the whole process, interpreter start-up
+included). Each boot run starts gunicorn with gunicorn.conf.py, with and
+without GUNICORN_PRELOAD, and times how long until GET /login first answers
+200. A scratch SQLite database with
+the schema already in place is used, as after ``flask db upgrade``. Medians
+are reported; the exit status is 1 if the median import time exceeds
+--budget-ms, so the check can run in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.bench_routes import ROOT, free_port
+
+IMPORT_SNIPPET = ('import time; started = time.perf_counter(); import app; app.create_app(); '
+                  'print(time.perf_counter() - started)')
+
+
+def time_import(env):
+    """(seconds spent importing and creating the app, seconds for the whole process)."""
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return float(output.split()[-1]), time.perf_counter() - started
+
+
+def time_boot(env, workers, timeout=60):
+    """Seconds from starting gunicorn until /login answers 200."""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'app:create_app()'], cwd=ROOT, env=env)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            if server.poll() is not None or time.perf_counter() - started > timeout:
+                raise RuntimeError('gunicorn did not start')
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def summary(seconds):
+    return {'median_ms': round(statistics.median(seconds) * 1000, 1),
+            'min_ms': round(min(seconds) * 1000, 1), 'max_ms': round(max(seconds) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--budget-ms', type=float, default=1000, help='Allowed median time to import and create the app.')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout.')
+    args = parser.parse_args()
+
+    from benchmarks.seed import use_scratch_database
+    use_scratch_database()
+    env = {**os.environ, 'SLOW_REQUEST_MS': '60000'}
+    subprocess.run([sys.executable, '-c', 'from app import create_app\nfrom benchmarks.seed import seed\napp = create_app()\n'
+                    'with app.app_context(): seed(users=5, blogs=50)'], cwd=ROOT, env=env, check=True)
+
+    imports = [time_import(env) for _ in range(args.runs)]
+    report = {
+        'config': {'runs': args.runs, 'workers': args.workers, 'budget_ms': args.budget_ms,
+                   'python': sys.version.split()[0]},
+        'import': summary([seconds for seconds, _ in imports]),
+        'process': summary([seconds for _, seconds in imports]),
+        'boot_to_first_200': {},
+    }
+    for name, preload in (('no_preload', ''), ('preload', 'true')):
+        boots = [time_boot({**env, 'GUNICORN_PRELOAD': preload}, args.workers) for _ in range(args.runs)]
+        report['boot_to_first_200'][name] = summary(boots)
+        print(f'  gunicorn {name}: {report["boot_to_first_200"][name]["median_ms"]} ms', file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['import']['median_ms'] > args.budget_ms:
+        print(f'Importing and creating the app took {report["import"]["median_ms"]} ms, over the {args.budget_ms:g} ms budget',
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
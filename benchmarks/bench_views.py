@@ -0,0 +1,133 @@
+"""Read-route latency with view counting off, buffered, and written through on every read.
+
+Usage: python -m benchmarks.bench_views [--blogs 2000] [--concurrency 8]
+           [--requests 400] [--gunicorn-workers 2] [--hot 20]
+
+Seeds a scratch SQLite database and serves it with gunicorn three times:
+with VIEW_COUNTER_BUFFER=off, with the default in-memory buffer, and with a
+buffer that upserts each view as it happens, which is what counting in
+view_blog itself would cost. In each mode it measures view_blog, whose
+reads are spread over --hot posts so the same counter rows are hit over and
+over, and then view_blogs while background clients keep reading those
+posts. Reports p50/p95 latency and throughput per route and the views
+stored by the end, as JSON.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+
+from benchmarks.bench_routes import PASSWORD, HttpTransport, gunicorn_server, make_users, run_route
+
+MODES = {
+    'off': 'off',
+    'buffered': 'memory',
+    'write_through': 'benchmarks.bench_views:WriteThroughBuffer',
+}
+
+
+class WriteThroughBuffer:
+    """Upserts every view immediately, in the request, instead of buffering it."""
+
+    def add(self, blog_id, count=1):
+        from counters import upsert_increments
+        from models import db, BlogViewCount
+        upsert_increments(db.session, BlogViewCount, ('blog_id',), 'views', [{'blog_id': blog_id, 'views': count}])
+        db.session.commit()
+
+    def drain(self):
+        return {}
+
+    def __len__(self):
+        return 0
+
+
+def stored_views(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute('SELECT COALESCE(SUM(views), 0) FROM blog_view_count').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def run_mode(db_path, env, args):
+    results = {}
+    with gunicorn_server(db_path, env, args.gunicorn_workers) as (base_url, pid):
+        def make_transport():
+            return HttpTransport(base_url)
+
+        readers = make_users(make_transport, args.concurrency, db_path, 'Patient')
+        for user in readers:
+            user.blog_ids = user.blog_ids[:args.hot]
+        results['view_blog'] = run_route('view_blog', readers, args.requests, pid)
+
+        # Listing pages while the hot posts keep being read in the background
+        stop = threading.Event()
+
+        def keep_reading(user):
+            while not stop.is_set():
+                user.view_blog()
+
+        background = [threading.Thread(target=keep_reading, args=(user,)) for user in readers]
+        for thread in background:
+            thread.start()
+        try:
+            listers = make_users(make_transport, args.concurrency, db_path, 'Patient')
+            results['view_blogs_under_views'] = run_route('view_blogs', listers, args.requests, pid)
+        finally:
+            stop.set()
+            for thread in background:
+                thread.join()
+    # Stopping gunicorn flushes what the workers still buffer
+    results['views_stored'] = stored_views(db_path)
+    for route in ('view_blog', 'view_blogs_under_views'):
+        print(f'  {route}: {results[route]["throughput_rps"]} req/s, p95 {results[route]["p95_ms"]} ms',
+              file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--blogs', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400, help='Requests per route and mode.')
+    parser.add_argument('--gunicorn-workers', type=int, default=2)
+    parser.add_argument('--hot', type=int, default=20, help='How many posts the view traffic is spread over.')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='VIEW_FLUSH_INTERVAL while buffered.')
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args()
+
+    from benchmarks.seed import use_scratch_database, seed
+    db_path = use_scratch_database()
+    os.environ.setdefault('SLOW_REQUEST_MS', '60000')
+    os.environ['LOGIN_LIMIT_PER_IP'] = os.environ['LOGIN_LIMIT_PER_USERNAME'] = str(10 ** 9)
+    os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    os.environ['VIEW_FLUSH_INTERVAL'] = str(args.flush_interval)
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        seed(users=args.users, blogs=args.blogs, content_words=300, draft_ratio=0,
+             password_hash=generate_password_hash(PASSWORD, 'pbkdf2:sha256:1000'))
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+
+    report = {'config': {'blogs': args.blogs, 'hot_posts': args.hot, 'concurrency': args.concurrency,
+                         'requests': args.requests, 'gunicorn_workers': args.gunicorn_workers,
+                         'flush_interval_s': args.flush_interval},
+              'modes': {}}
+    for mode in args.modes.split(','):
+        print(f'{mode}:', file=sys.stderr)
+        server_db = os.path.join(workdir, f'{mode}.db')
+        shutil.copy(db_path, server_db)
+        env = {**os.environ, 'VIEW_COUNTER_BUFFER': MODES[mode]}
+        report['modes'][mode] = run_mode(server_db, env, args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
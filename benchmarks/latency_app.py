@@ -0,0 +1,21 @@
+"""The app with a fixed delay before every SQL statement, standing in for a database across the network.
+
+Served by bench_concurrency as ``'benchmarks.latency_app:create_app()'``. The delay
+(BENCH_DB_LATENCY_MS, default 5) is a time.sleep, which releases the GIL and
+yields to other greenlets under gevent's monkey-patching, just like waiting
+on a socket would.
+"""
+import os
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app  # noqa: F401  Served from here, so importing this module adds the delay
+
+LATENCY = float(os.environ.get('BENCH_DB_LATENCY_MS', 5)) / 1000
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _round_trip(conn, cursor, statement, parameters, context, executemany):
+    time.sleep(LATENCY)
@@ -0,0 +1,77 @@
+"""Synthetic data for the benchmarks.
+
+Benchmarks point DATABASE_URL at a scratch SQLite file *before* importing the
+app, then call seed() to fill it.
+"""
+import itertools
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+CATEGORIES = ['Mental Health', 'Heart Disease', 'Covid19', 'Immunization']
+
+WORDS = ('health heart blood pressure vaccine immunity covid virus mental stress anxiety sleep diet exercise '
+         'doctor patient clinic symptom treatment therapy recovery risk dose booster study trial cholesterol '
+         'diabetes fever cough breathing lungs children elderly nutrition care prevention screening').split()
+
+
+def use_scratch_database(name='bench.db'):
+    """Point DATABASE_URL at a fresh SQLite file in a temp dir and return its path."""
+    path = os.path.join(tempfile.mkdtemp(prefix='blog-bench-'), name)
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    return path
+
+
+# A long tail of made-up words after the real ones, drawn with Zipf-like
+# weights, so term frequencies look like natural text rather than 40 words
+# that appear in every post.
+VOCABULARY = WORDS + [''.join(random.Random(i).choices('bcdfghklmnprstvz', k=3)) + ''.join(
+    random.Random(-i).choices('aeiou', k=2)) + str(i % 97) for i in range(20000)]
+WEIGHTS = [1.0 / (rank + 1) for rank in range(len(VOCABULARY))]
+# Passed to choices() instead of WEIGHTS, which it would accumulate on every call; the words drawn are the same
+CUM_WEIGHTS = list(itertools.accumulate(WEIGHTS))
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=words))
+
+
+def seed(users=10, blogs=1000, content_words=600, draft_ratio=0.1, password_hash='x', seed_value=42):
+    """Insert ``users`` doctors and ``blogs`` posts spread over the four categories.
+
+    Must be called inside an app context. Creates the tables first, as the
+    scratch database starts empty. Returns the list of user ids.
+    """
+    from models import db, User, Blog
+
+    db.create_all()
+    rng = random.Random(seed_value)
+    db.session.execute(db.insert(User), [
+        dict(first_name=f'First{i}', last_name=f'Last{i}', username=f'user{i}', email=f'user{i}@example.com',
+             password=password_hash, address_line1='1 Main St', city='City', state='State', pincode='123456',
+             user_type='Doctor' if i % 2 == 0 else 'Patient')
+        for i in range(users)
+    ])
+    user_ids = [row.id for row in db.session.execute(db.select(User.id).where(User.user_type == 'Doctor'))]
+
+    start = datetime(2020, 1, 1)
+    batch = []
+    for i in range(blogs):
+        batch.append(dict(
+            title=sentence(rng, 6).title()[:120],
+            image=None,
+            category=CATEGORIES[i % len(CATEGORIES)],
+            summary=sentence(rng, 25)[:250],
+            content=sentence(rng, content_words),
+            date_posted=start + timedelta(minutes=i),
+            draft=rng.random() < draft_ratio,
+            user_id=rng.choice(user_ids),
+        ))
+        if len(batch) == 1000:
+            db.session.execute(db.insert(Blog), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Blog), batch)
+    db.session.commit()
+    return user_ids
@@ -0,0 +1,357 @@
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice, repeat
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from werkzeug.security import generate_password_hash
+
+from availability import availability_index
+from counters import apply_deltas, blog_deltas
+from models import db, User, Blog
+from rendering import rendered_columns
+
+data_cli = AppGroup('data', help='Bulk import and export of users and blogs.')
+
+USER_FIELDS = ('first_name', 'last_name', 'username', 'email', 'address_line1', 'city', 'state', 'pincode',
+               'user_type')
+BLOG_FIELDS = ('title', 'category', 'summary', 'content', 'draft', 'date_posted', 'author')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+def open_text(path, mode):
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a CSV or NDJSON stream without reading it all."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        # Lines that are not JSON objects are flagged here and rejected by the importer
+        yield line_number, row if isinstance(row, dict) else {'raw': line.rstrip('\n'), '_invalid': True}
+
+
+class RowWriter:
+    """Write dict rows as CSV or NDJSON; the CSV header comes from the first row."""
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        self._csv = None
+
+    def write(self, row):
+        if self.fmt == 'ndjson':
+            self.stream.write(json.dumps(row, default=str, separators=(',', ':')) + '\n')
+            return
+        if self._csv is None:
+            self._csv = csv.DictWriter(self.stream, fieldnames=list(row), extrasaction='ignore')
+            self._csv.writeheader()
+        self._csv.writerow({key: '' if value is None else value for key, value in row.items()})
+
+
+class Rejects:
+    """Rejected rows with their line number and errors, written to a file opened on first use."""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def add(self, line_number, row, errors):
+        if self._writer is None:
+            self._file = open_text(self.path, 'w')
+            self._writer = RowWriter(self._file, self.fmt)
+        row = {key: '(removed)' if key == 'password' and value else value for key, value in row.items()}
+        self._writer.write({'line': line_number, 'errors': '; '.join(errors), **row})
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def form_errors(form):
+    return [f'{name}: {message}' for name, messages in form.errors.items() for message in messages]
+
+
+def as_formdata(row, fields):
+    data = MultiDict()
+    for field in fields:
+        value = row.get(field)
+        if field == 'draft':
+            if str(value).strip().lower() in TRUE_VALUES:
+                data[field] = 'y'  # BooleanField treats any other submitted value as true too
+        elif value is not None:
+            data[field] = str(value)
+    return data
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_chunk(model, records, rejects, after_insert=None):
+    """Insert ``[(line, row, values)]`` with one executemany in one transaction.
+
+    If the batch violates a constraint (e.g. a username taken since it was
+    checked), the rows are retried one by one in savepoints and the
+    offending ones go to the rejects file. ``after_insert(values_list)`` is
+    called in the same transaction (or savepoint) as the rows it was given.
+    """
+    if not records:
+        return 0
+    try:
+        db.session.execute(db.insert(model), [values for _, _, values in records])
+        if after_insert is not None:
+            after_insert([values for _, _, values in records])
+        db.session.commit()
+        return len(records)
+    except IntegrityError:
+        db.session.rollback()
+    inserted = 0
+    for line_number, row, values in records:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(model), [values])
+                if after_insert is not None:
+                    after_insert([values])
+            inserted += 1
+        except IntegrityError as e:
+            rejects.add(line_number, row, [f'constraint: {e.orig}'])
+    db.session.commit()
+    return inserted
+
+
+def import_users(rows, rejects, batch_size, executor, workers, method):
+    from app import SignupForm
+
+    seen_usernames, seen_emails = set(), set()
+    for chunk in chunked(rows, batch_size):
+        valid = []
+        for line_number, row in chunk:
+            if row.pop('_invalid', False):
+                rejects.add(line_number, row, ['not a JSON object'])
+                continue
+            data = as_formdata(row, USER_FIELDS)
+            password = row.get('password')
+            password_hash = row.get('password_hash')
+            if password_hash:
+                # Already hashed elsewhere (e.g. an export from another instance); the form only needs a placeholder
+                data['password'] = data['confirm_password'] = 'x' * 6
+            elif password is not None:
+                data['password'] = data['confirm_password'] = str(password)
+            form = SignupForm(formdata=data, meta={'csrf': False})
+            errors = [] if form.validate() else form_errors(form)
+            if not errors and (form.username.data in seen_usernames or form.email.data in seen_emails):
+                errors.append('duplicate username or email earlier in the file')
+            if errors:
+                rejects.add(line_number, row, errors)
+                continue
+            seen_usernames.add(form.username.data)
+            seen_emails.add(form.email.data)
+            values = {field: getattr(form, field).data for field in USER_FIELDS}
+            values['password'] = password_hash
+            valid.append((line_number, row, values))
+
+        # One query per chunk finds accounts that already exist
+        taken = set(db.session.execute(db.select(User.username, User.email).where(db.or_(
+            User.username.in_([values['username'] for _, _, values in valid]),
+            User.email.in_([values['email'] for _, _, values in valid])))).all())
+        taken_usernames = {username for username, _ in taken}
+        taken_emails = {email for _, email in taken}
+        records = []
+        for line_number, row, values in valid:
+            if values['username'] in taken_usernames or values['email'] in taken_emails:
+                rejects.add(line_number, row, ['username or email already exists'])
+            else:
+                records.append((line_number, row, values))
+
+        # Hash the chunk's passwords in parallel across processes
+        to_hash = [(values, row['password']) for _, row, values in records if not values['password']]
+        passwords = [str(password) for _, password in to_hash]
+        if executor is not None:
+            hashes = executor.map(generate_password_hash, passwords, repeat(method),
+                                  chunksize=max(1, len(passwords) // (workers * 4)))
+        else:
+            hashes = map(generate_password_hash, passwords, repeat(method))
+        for (values, _), password_hash in zip(to_hash, hashes):
+            values['password'] = password_hash
+
+        inserted = []
+        imported = insert_chunk(User, records, rejects, after_insert=inserted.extend)
+        # Core INSERTs skip the signup route, which records new names in the availability filters
+        for values in inserted:
+            availability_index.add(values['username'], values['email'])
+        yield len(chunk), imported
+
+
+def count_blogs(values_list):
+    # Core INSERTs skip the ORM flush events that keep the blog counters up to date
+    deltas = Counter()
+    for values in values_list:
+        deltas.update(blog_deltas(values['category'], values['draft'], values['user_id']))
+    apply_deltas(db.session, deltas)
+
+
+def import_blogs(rows, rejects, batch_size):
+    from app import BlogPostForm
+
+    for chunk in chunked(rows, batch_size):
+        authors = {str(row.get('author') or '') for _, row in chunk}
+        doctors = dict(db.session.execute(db.select(User.username, User.id).where(
+            User.username.in_(authors), User.user_type == 'Doctor')).all())
+        records = []
+        for line_number, row in chunk:
+            if row.pop('_invalid', False):
+                rejects.add(line_number, row, ['not a JSON object'])
+                continue
+            form = BlogPostForm(formdata=as_formdata(row, BLOG_FIELDS), meta={'csrf': False})
+            errors = [] if form.validate() else form_errors(form)
+            author_id = doctors.get(str(row.get('author') or ''))
+            if author_id is None:
+                errors.append('author: no doctor with this username')
+            date_posted = datetime.utcnow()
+            if row.get('date_posted'):
+                try:
+                    date_posted = datetime.fromisoformat(str(row['date_posted']))
+                except ValueError:
+                    errors.append('date_posted: not an ISO 8601 date')
+            if errors:
+                rejects.add(line_number, row, errors)
+                continue
+            records.append((line_number, row, {
+                'title': form.title.data, 'category': form.category.data, 'summary': form.summary.data,
+                'content': form.content.data, 'draft': form.draft.data, 'date_posted': date_posted,
+                'user_id': author_id, **rendered_columns(form.content.data),
+            }))
+        yield len(chunk), insert_chunk(Blog, records, rejects, after_insert=count_blogs)
+
+
+@data_cli.command('import')
+@click.argument('kind', type=click.Choice(['users', 'blogs']))
+@click.argument('source', type=click.Path(allow_dash=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Default: from the file extension.')
+@click.option('--batch-size', default=500, show_default=True, help='Rows per INSERT and per transaction.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True,
+              help='Processes hashing passwords; 0 hashes in this process.')
+@click.option('--rejects', 'rejects_path', help='Where to write rejected rows. Default: SOURCE.rejects.<ext>.')
+def import_command(kind, source, fmt, batch_size, workers, rejects_path):
+    """Import users or blogs from a CSV or NDJSON file.
+
+    Rows are validated with the signup and blog forms. Users need either a
+    plain ``password`` or a ``password_hash``; blogs name their ``author``
+    by username, which must be a doctor. Invalid rows are written to a
+    rejects file with the reason instead of stopping the import.
+    """
+    fmt = detect_format(source, fmt)
+    rejects = Rejects(rejects_path or ('rejects.' + fmt if source == '-' else f'{source}.rejects.{fmt}'), fmt)
+    executor = None
+    if kind == 'users' and workers > 0:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    started = time.perf_counter()
+    read = imported = 0
+    stream = open_text(source, 'r')
+    try:
+        rows = read_rows(stream, fmt)
+        if kind == 'users':
+            batches = import_users(rows, rejects, batch_size, executor, workers,
+                                   current_app.config['PASSWORD_HASH_METHOD'])
+        else:
+            batches = import_blogs(rows, rejects, batch_size)
+        for chunk_read, chunk_imported in batches:
+            read += chunk_read
+            imported += chunk_imported
+            elapsed = time.perf_counter() - started
+            click.echo(f'{read} rows read, {imported} imported ({read / elapsed:.0f} rows/s)', err=True)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        rejects.close()
+        if executor is not None:
+            executor.shutdown()
+
+    if kind == 'blogs' and imported:
+        # Rows were inserted in bulk, bypassing the per-post cache and index updates.
+        # Every feed page with category filters shows the new counts.
+        from app import page_cache, search_index, BLOG_CATEGORIES
+        page_cache.invalidate_feeds(*BLOG_CATEGORIES)
+        search_index.rebuild()
+
+    elapsed = time.perf_counter() - started
+    click.echo(f'Imported {imported} of {read} {kind} in {elapsed:.1f}s ({read / elapsed if elapsed else 0:.0f} rows/s).')
+    if rejects.count:
+        click.echo(f'{rejects.count} rejected row(s) written to {rejects.path}.')
+
+
+@data_cli.command('export')
+@click.argument('kind', type=click.Choice(['users', 'blogs']))
+@click.argument('destination', type=click.Path(allow_dash=True, dir_okay=False), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Default: from the file extension.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched from the cursor at a time.')
+@click.option('--with-password-hashes', is_flag=True, help='Include users\' password hashes (for moving accounts).')
+def export_command(kind, destination, fmt, batch_size, with_password_hashes):
+    """Export users or blogs as CSV or NDJSON, streamed from a server-side cursor."""
+    fmt = detect_format(destination, fmt)
+    if kind == 'users':
+        columns = [getattr(User, field) for field in USER_FIELDS]
+        if with_password_hashes:
+            columns.append(User.password.label('password_hash'))
+        statement = db.select(*columns).order_by(User.id)
+    else:
+        statement = (db.select(Blog.title, Blog.category, Blog.summary, Blog.content, Blog.draft, Blog.date_posted,
+                               User.username.label('author'))
+                     .join(User, User.id == Blog.user_id).order_by(Blog.id))
+
+    started = time.perf_counter()
+    count = 0
+    stream = open_text(destination, 'w')
+    try:
+        writer = RowWriter(stream, fmt)
+        result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+        for row in result.mappings():
+            row = dict(row)
+            if 'date_posted' in row:
+                row['date_posted'] = row['date_posted'].isoformat()
+            writer.write(row)
+            count += 1
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    elapsed = time.perf_counter() - started
+    click.echo(f'Exported {count} {kind} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/s).', err=True)
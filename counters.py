@@ -0,0 +1,181 @@
+import importlib
+from collections import Counter
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+
+from database import RoutingSession
+from models import db, Blog, BlogCount
+
+CATEGORY = 'category'  # Published posts per category
+AUTHOR = 'author'  # All posts per author
+AUTHOR_DRAFTS = 'author_drafts'  # Drafts per author
+
+COUNTED = ('category', 'draft', 'user_id')
+
+counts_cli = AppGroup('counts', help='Maintain the materialized blog counts.')
+
+
+def blog_deltas(category, draft, user_id, sign=1):
+    """The counter changes for adding (sign=1) or removing (sign=-1) one blog."""
+    deltas = Counter({(AUTHOR, str(user_id)): sign})
+    if draft:
+        deltas[(AUTHOR_DRAFTS, str(user_id))] += sign
+    else:
+        deltas[(CATEGORY, category)] += sign
+    return deltas
+
+
+def apply_deltas(session, deltas):
+    """Add ``deltas`` to the counters with one upsert, inside the session's current transaction.
+
+    Rows are sorted so concurrent transactions lock the counters in the same
+    order.
+    """
+    rows = [{'kind': kind, 'subject': subject, 'count': delta}
+            for (kind, subject), delta in sorted(deltas.items()) if delta]
+    upsert_increments(session, BlogCount, ('kind', 'subject'), 'count', rows)
+
+
+def upsert_increments(session, model, keys, column, rows):
+    """Add each row's ``column`` value to the row of ``model`` with the same ``keys``, creating missing ones.
+
+    One INSERT ... ON CONFLICT (or ON DUPLICATE KEY) UPDATE for all ``rows``.
+    Dialects without an upsert fall back to UPDATE, then INSERT for rows
+    that did not exist yet.
+    """
+    if not rows:
+        return
+    dialect = session.get_bind(mapper=model).dialect.name
+    counter = getattr(model, column)
+    if dialect in ('sqlite', 'postgresql'):
+        # Only the dialect in use is imported; loading them all slows down app startup
+        insert = importlib.import_module(f'sqlalchemy.dialects.{dialect}').insert(model)
+        session.execute(insert.on_conflict_do_update(index_elements=list(keys),
+                                                     set_={column: counter + insert.excluded[column]}), rows)
+    elif dialect in ('mysql', 'mariadb'):
+        insert = importlib.import_module('sqlalchemy.dialects.mysql').insert(model)
+        session.execute(insert.on_duplicate_key_update({column: counter + insert.inserted[column]}), rows)
+    else:
+        for row in rows:
+            result = session.execute(db.update(model)
+                                     .where(*(getattr(model, key) == row[key] for key in keys))
+                                     .values({column: counter + row[column]}))
+            if not result.rowcount:
+                session.execute(db.insert(model), [row])
+
+
+def _changed(blog):
+    state = inspect(blog)
+    return any(state.attrs[name].history.has_changes() for name in COUNTED)
+
+
+def _committed_values(blog):
+    """The counted attributes as last flushed, or None if one was replaced before it was ever loaded."""
+    state = inspect(blog)
+    values = []
+    for name in COUNTED:
+        history = state.attrs[name].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        elif history.added:
+            return None
+        else:
+            values.append(getattr(blog, name))  # Expired: loads it
+    return values
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _count_removed(session, flush_context, instances):
+    """Subtract deleted and changed blogs at their old values, while those can still be read."""
+    session.info.pop('blog_count_deltas', None)  # Left over from a flush that failed
+    session.info.pop('blog_count_added', None)
+    changed = [obj for obj in session.dirty if isinstance(obj, Blog) and _changed(obj)]
+    removed = [obj for obj in session.deleted if isinstance(obj, Blog)] + changed
+    if not removed and not any(isinstance(obj, Blog) for obj in session.new):
+        return
+    deltas = Counter()
+    unknown = []
+    with session.no_autoflush:
+        for blog in removed:
+            values = _committed_values(blog)
+            if values is None:
+                unknown.append(blog.id)
+            else:
+                deltas.update(blog_deltas(*values, sign=-1))
+        if unknown:
+            rows = session.execute(db.select(*(getattr(Blog, name) for name in COUNTED))
+                                   .where(Blog.id.in_(unknown)))
+            for row in rows:
+                deltas.update(blog_deltas(*row, sign=-1))
+    session.info['blog_count_deltas'] = deltas
+    session.info['blog_count_added'] = [obj for obj in session.new if isinstance(obj, Blog)] + changed
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _count_added(session, flush_context):
+    """Add new and changed blogs at their new values (foreign keys are set by now) and write the counters."""
+    deltas = session.info.pop('blog_count_deltas', None)
+    if deltas is None:
+        return
+    for blog in session.info.pop('blog_count_added'):
+        deltas.update(blog_deltas(blog.category, blog.draft, blog.user_id))
+    apply_deltas(session, deltas)
+
+
+def category_counts():
+    """Published posts per category: ``{category: count}``."""
+    return dict(db.session.execute(db.select(BlogCount.subject, BlogCount.count)
+                                   .where(BlogCount.kind == CATEGORY)).all())
+
+
+def author_counts(user_id):
+    """``{'posts': all posts, 'drafts': drafts}`` for one author."""
+    counts = dict(db.session.execute(db.select(BlogCount.kind, BlogCount.count).where(
+        BlogCount.kind.in_([AUTHOR, AUTHOR_DRAFTS]), BlogCount.subject == str(user_id))).all())
+    return {'posts': counts.get(AUTHOR, 0), 'drafts': counts.get(AUTHOR_DRAFTS, 0)}
+
+
+def actual_counts():
+    """Every counter recomputed from the blog table with GROUP BY queries."""
+    counts = {}
+    queries = {
+        CATEGORY: db.select(Blog.category, db.func.count()).where(Blog.draft == False)  # noqa: E712
+                    .group_by(Blog.category),
+        AUTHOR: db.select(Blog.user_id, db.func.count()).group_by(Blog.user_id),
+        AUTHOR_DRAFTS: db.select(Blog.user_id, db.func.count()).where(Blog.draft == True)  # noqa: E712
+                         .group_by(Blog.user_id),
+    }
+    for kind, query in queries.items():
+        for subject, count in db.session.execute(query):
+            counts[(kind, str(subject))] = count
+    return counts
+
+
+@counts_cli.command('rebuild')
+@click.option('--check', is_flag=True, help='Only report counters that are wrong; exit 1 if any are.')
+def rebuild_command(check):
+    """Recompute the blog counters from the blog table and fix any that drifted.
+
+    Counters are kept up to date on every write, so this is only needed
+    after changing blogs outside the application (e.g. with raw SQL).
+    """
+    actual = actual_counts()
+    stored = {(row.kind, row.subject): row.count for row in db.session.execute(
+        db.select(BlogCount.kind, BlogCount.subject, BlogCount.count))}
+    wrong = {key: actual.get(key, 0) for key in stored.keys() | actual.keys()
+             if stored.get(key, 0) != actual.get(key, 0)}
+    for (kind, subject), count in sorted(wrong.items()):
+        click.echo(f'{kind} {subject}: stored {stored.get((kind, subject), 0)}, actual {count}', err=True)
+    if check:
+        if wrong:
+            raise SystemExit(1)
+        click.echo('All blog counters are correct.')
+        return
+    apply_deltas(db.session, Counter({key: count - stored.get(key, 0) for key, count in wrong.items()}))
+    db.session.execute(db.delete(BlogCount).where(BlogCount.count == 0))
+    db.session.commit()
+    click.echo(f'Corrected {len(wrong)} blog counter(s).')
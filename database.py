@@ -0,0 +1,125 @@
+import random
+import time
+from functools import wraps
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+from metrics import Histogram
+
+REPLICA_PREFIX = 'replica'
+
+# Key in the Flask session holding the time until which this client reads from the primary
+STICKY_KEY = '_db_primary_until'
+
+pool_wait = Histogram('db_pool_checkout_seconds',
+                      'Time to check a connection out of the pool, including opening new ones.',
+                      buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+                      labelnames=('engine',))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long every checkout waited, labelled by engine."""
+
+    label = 'primary'
+
+    @classmethod
+    def named(cls, label):
+        # create_engine() instantiates the pool class itself, so the label goes on a subclass
+        return type(cls.__name__, (cls,), {'label': label})
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - started, engine=self.label)
+
+
+def engine_options(url, label='primary', pool_size=5, max_overflow=10, pool_recycle=1800, pool_timeout=30,
+                   pool_pre_ping=True):
+    """Engine keyword arguments for ``url``: a timed, sized queue pool with recycle and pre-ping."""
+    if not url:
+        return {}
+    options = {'pool_pre_ping': pool_pre_ping}
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options  # Flask-SQLAlchemy shares one connection for in-memory SQLite
+    options.update(poolclass=TimedQueuePool.named(label), pool_size=pool_size, max_overflow=max_overflow,
+                   pool_recycle=pool_recycle, pool_timeout=pool_timeout)
+    return options
+
+
+def replica_binds(urls, **pool_options):
+    """SQLALCHEMY_BINDS entries for read replicas, named replica0, replica1, ..."""
+    binds = {}
+    for i, url in enumerate(urls):
+        key = f'{REPLICA_PREFIX}{i}'
+        binds[key] = {'url': url, **engine_options(url, label=key, **pool_options)}
+    return binds
+
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica while a ``use_replica`` view runs.
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary, and
+    once the session has written, so do its reads. After committing a write
+    in a request the client is pinned to the primary for
+    DATABASE_REPLICA_STICKY_SECONDS, so it reads its own writes even if the
+    replicas lag behind.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        elif bind is None and self.info.get('replica') and not self.info.get('wrote'):
+            return self._db.engines[self.info['replica']]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    if session.info.get('wrote') and has_request_context() and replica_keys():
+        flask_session[STICKY_KEY] = time.time() + current_app.config['DATABASE_REPLICA_STICKY_SECONDS']
+
+
+def replica_keys():
+    return [key for key in current_app.config.get('SQLALCHEMY_BINDS') or {} if key.startswith(REPLICA_PREFIX)]
+
+
+def use_replica(view):
+    """Serve this read-only view from a randomly chosen replica, when any are configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        replicas = replica_keys()
+        if not replicas or flask_session.get(STICKY_KEY, 0) > time.time():
+            return view(*args, **kwargs)
+        session = current_app.extensions['sqlalchemy'].session()
+        session.info['replica'] = random.choice(replicas)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            session.info.pop('replica', None)
+    return wrapper
+
+
+def use_primary(session):
+    """Send the rest of this request's reads to the primary, e.g. before filling a shared cache."""
+    session.info.pop('replica', None)
+
+
+def collect_pool_metrics(engines):
+    """Pool gauges for every engine plus the checkout time histogram."""
+    gauges = {'db_pool_size': ('Connections the pool keeps open.', 'size'),
+              'db_pool_checked_out': ('Connections currently checked out.', 'checkedout'),
+              'db_pool_overflow': ('Connections open beyond the pool size.', 'overflow')}
+    metrics = []
+    for name, (help_text, method) in gauges.items():
+        samples = [('', {'engine': key or 'primary'}, getattr(engine.pool, method)())
+                   for key, engine in engines.items() if isinstance(engine.pool, QueuePool)]
+        metrics.append((name, 'gauge', help_text, samples))
+    return metrics + pool_wait.collect()
@@ -0,0 +1,66 @@
+# Gunicorn settings, read automatically by `gunicorn 'app:create_app()'` from this directory.
+#
+# GUNICORN_WORKER_CLASS picks how each worker handles concurrent requests:
+#   sync    one request at a time per worker (gunicorn's default)
+#   gthread GUNICORN_THREADS requests per worker on a thread pool; a worker
+#           waiting on the database or reading an upload keeps serving others
+#   gevent  GUNICORN_WORKER_CONNECTIONS requests per worker on greenlets
+#           (`pip install gevent`); blocking I/O is monkey-patched, so the
+#           database driver must be pure Python, e.g. mysql+pymysql://
+# The app code is the same in every mode: login_required, current_user and the
+# session are context-local, so they hold per request on threads and greenlets.
+import logging
+import multiprocessing
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Gunicorn quietly turns sync workers into gthread ones when threads > 1
+threads = int(os.environ.get('GUNICORN_THREADS', 8)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Import the app once in the master and fork workers from it: faster worker
+# boots and restarts, and the imported code is shared copy-on-write.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '').lower() in ('1', 'true', 'yes')
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5 if worker_class != 'sync' else 2))
+
+# Requests handled at once by one worker
+concurrency = {'gthread': threads, 'gevent': worker_connections}.get(worker_class, 1)
+
+# Each in-flight request may hold a database connection, so size the pool to
+# match unless it was set explicitly; otherwise requests queue for up to
+# DB_POOL_TIMEOUT seconds waiting for a connection.
+if concurrency > 1:
+    os.environ.setdefault('DB_POOL_SIZE', str(min(concurrency, 10)))
+    os.environ.setdefault('DB_MAX_OVERFLOW', str(max(0, concurrency - min(concurrency, 10))))
+
+
+def on_starting(server):
+    url = os.environ.get('DATABASE_URL', '')
+    if worker_class == 'gevent' and url.startswith(('mysql://', 'mysql+mysqldb://')):
+        logging.getLogger('gunicorn.error').warning(
+            'mysqlclient blocks the gevent loop on every query; use a mysql+pymysql:// DATABASE_URL '
+            'with GUNICORN_WORKER_CLASS=gevent')
+
+
+def post_fork(server, worker):
+    # A preloaded app's engines were created in the master. Drop any pooled
+    # connections inherited from it without closing them, since the master
+    # (or a sibling) may still own the socket; the worker opens its own.
+    if server.cfg.preload_app:
+        from models import db
+        app = server.app.wsgi()  # Already built in the master
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    # Build the signup availability filters before the first request needs them
+    from availability import availability_index
+    try:
+        with worker.wsgi.app_context():
+            availability_index.rebuild()
+    except Exception:
+        # e.g. the database is not migrated yet; the first lookup starts a build in the background instead
+        logging.getLogger('gunicorn.error').warning('Could not build the availability filters', exc_info=True)
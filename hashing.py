@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated; the request should be retried later."""
+
+    def __init__(self, retry_after=2):
+        super().__init__('Password hashing pool is busy')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a bounded process pool.
+
+    Hashing is CPU-bound and holds the GIL, so running it on the request
+    thread starves every other route in the worker. At most ``max_pending``
+    hash jobs may be queued or running per worker; beyond that HashingBusy is
+    raised immediately instead of queueing without limit. ``workers=0`` runs
+    everything inline, which is handy for development and the CLI.
+
+    ``method`` is any method accepted by werkzeug's generate_password_hash,
+    e.g. ``scrypt`` or ``pbkdf2:sha256:600000``.
+    """
+
+    def __init__(self, method='scrypt', workers=2, max_pending=16, timeout=10, retry_after=2, app=None):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._current_prefix = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_DEPTH', 16)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        self.shutdown()  # A pool started under the previous settings
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE_DEPTH'])
+        self._current_prefix = None
+
+    def _get_pool(self):
+        # Created lazily, and again after a fork, so each gunicorn worker owns its pool
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _discard_pool(self, pool):
+        # A worker died (e.g. killed for memory): the executor refuses all work from then on
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        if self.workers == 0:
+            return fn(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HashingBusy(self.retry_after)
+        pool = self._get_pool()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self._discard_pool(pool)
+            raise HashingBusy(self.retry_after)
+        # The slot is only given back once the job is over: a timed-out job
+        # that could not be cancelled still occupies a pool worker
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy(self.retry_after)
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            raise HashingBusy(self.retry_after)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if ``pwhash`` was made with a different algorithm or cost than ``method``."""
+        if self._current_prefix is None:
+            # Werkzeug fills in default parameters, so derive the full prefix from a real hash
+            self._current_prefix = self.hash('').split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._current_prefix
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
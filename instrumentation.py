@@ -0,0 +1,185 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from flask import g, request, has_app_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RequestStats:
+    __slots__ = ('started', 'statements', 'sql_seconds', 'template_seconds', 'template_started', 'profiler')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []  # (sql, seconds)
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_started = []
+        self.profiler = None
+
+
+class Instrumentation:
+    """Per-request timings, SQL statement counts and slow-request logging.
+
+    For every request it records wall time, the number and total time of
+    SQL statements (from engine events, so replicas are included), template
+    render time and response size, labelled by endpoint, and exports them as
+    histograms on /metrics. Requests slower than ``slow_request_ms`` are
+    logged with their statements. The same SELECT run ``n_plus_one_threshold``
+    times or more in one request is reported as a likely N+1 query, typically
+    a lazy-loaded relationship used inside a loop.
+
+    With ``profile_sample_rate`` above zero, that share of requests is run
+    under cProfile and the stats are written to ``profile_dir``. Only one
+    request is profiled at a time.
+    """
+
+    def __init__(self, app=None):
+        self.slow_request_ms = 500
+        self.n_plus_one_threshold = 5
+        self.profile_sample_rate = 0.0
+        self.profile_dir = None
+        self._profile_lock = threading.Lock()
+        self._n_plus_one = Counter()
+        self.request_seconds = Histogram('http_request_duration_seconds', 'Wall time spent handling requests.',
+                                         TIME_BUCKETS, labelnames=('endpoint',))
+        self.sql_statements = Histogram('http_request_sql_statements', 'SQL statements executed per request.',
+                                        COUNT_BUCKETS, labelnames=('endpoint',))
+        self.sql_seconds = Histogram('http_request_sql_seconds', 'Time spent in SQL statements per request.',
+                                     TIME_BUCKETS, labelnames=('endpoint',))
+        self.template_seconds = Histogram('http_request_template_seconds', 'Time spent rendering templates per request.',
+                                          TIME_BUCKETS, labelnames=('endpoint',))
+        self.response_bytes = Histogram('http_response_size_bytes', 'Size of response bodies.',
+                                        SIZE_BUCKETS, labelnames=('endpoint',))
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_REQUEST_MS', 500)
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+        self.slow_request_ms = app.config['SLOW_REQUEST_MS']
+        self.n_plus_one_threshold = app.config['N_PLUS_ONE_THRESHOLD']
+        self.profile_sample_rate = app.config['PROFILE_SAMPLE_RATE']
+        self.profile_dir = app.config['PROFILE_DIR']
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def _start(self):
+        stats = g.request_stats = RequestStats()
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate \
+                and self._profile_lock.acquire(blocking=False):
+            stats.profiler = cProfile.Profile()
+            stats.profiler.enable()
+
+    def _template_started(self, sender, template, context, **extra):
+        stats = g.get('request_stats')
+        if stats is not None:
+            stats.template_started.append(time.perf_counter())
+
+    def _template_finished(self, sender, template, context, **extra):
+        stats = g.get('request_stats')
+        if stats is not None and stats.template_started:
+            stats.template_seconds += time.perf_counter() - stats.template_started.pop()
+
+    def _finish(self, response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+        self.request_seconds.observe(elapsed, endpoint=endpoint)
+        self.sql_statements.observe(len(stats.statements), endpoint=endpoint)
+        self.sql_seconds.observe(stats.sql_seconds, endpoint=endpoint)
+        self.template_seconds.observe(stats.template_seconds, endpoint=endpoint)
+        if response.content_length is not None:
+            self.response_bytes.observe(response.content_length, endpoint=endpoint)
+
+        self._check_n_plus_one(stats, endpoint)
+        if elapsed * 1000 >= self.slow_request_ms:
+            self._log_slow_request(stats, elapsed, endpoint)
+        if stats.profiler is not None:
+            self._save_profile(stats, endpoint)
+        return response
+
+    def _teardown(self, exc):
+        stats = g.get('request_stats')
+        if stats is not None and stats.profiler is not None:  # The request failed before _finish
+            stats.profiler.disable()
+            stats.profiler = None
+            self._profile_lock.release()
+
+    def _check_n_plus_one(self, stats, endpoint):
+        repeated = Counter(sql for sql, _ in stats.statements if sql.lstrip()[:6].upper() == 'SELECT')
+        for sql, count in repeated.items():
+            if count >= self.n_plus_one_threshold:
+                self._n_plus_one[endpoint] += 1
+                logger.warning('Possible N+1 query in %s: statement ran %d times: %s', endpoint, count, sql)
+
+    def _log_slow_request(self, stats, elapsed, endpoint):
+        lines = [f'{seconds * 1000:8.1f} ms  {" ".join(sql.split())}' for sql, seconds in stats.statements[:50]]
+        if len(stats.statements) > 50:
+            lines.append(f'... and {len(stats.statements) - 50} more')
+        logger.warning('Slow request %s %s (%s): %.0f ms, %d SQL statements in %.0f ms, templates %.0f ms\n%s',
+                       request.method, request.path, endpoint, elapsed * 1000, len(stats.statements),
+                       stats.sql_seconds * 1000, stats.template_seconds * 1000, '\n'.join(lines))
+
+    def _save_profile(self, stats, endpoint):
+        stats.profiler.disable()
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f'{endpoint}-{time.time_ns()}.prof')
+            stats.profiler.dump_stats(path)
+            logger.info('Saved profile of %s %s to %s', request.method, request.path, path)
+        finally:
+            stats.profiler = None
+            self._profile_lock.release()
+
+    def collect_metrics(self):
+        metrics = []
+        for histogram in (self.request_seconds, self.sql_statements, self.sql_seconds,
+                          self.template_seconds, self.response_bytes):
+            metrics.extend(histogram.collect())
+        metrics.append(('http_request_n_plus_one_total', 'counter',
+                        'Requests in which the same SELECT ran repeatedly (likely N+1 queries).',
+                        [('', {'endpoint': endpoint}, count) for endpoint, count in sorted(self._n_plus_one.items())]))
+        return metrics
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._instrumentation_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_app_context():
+        return
+    stats = g.get('request_stats')
+    if stats is None:
+        return
+    seconds = time.perf_counter() - context._instrumentation_started
+    stats.statements.append((statement, seconds))
+    stats.sql_seconds += seconds
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,235 @@
+import logging
+import multiprocessing
+import random
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """Durable background jobs stored in the application database.
+
+    Jobs are rows in the ``job`` table, so ``enqueue()`` joins the caller's
+    transaction: the job exists if and only if the request's changes were
+    committed. A worker (``flask jobs worker``) claims due jobs, runs the
+    registered handler and retries failures with exponential backoff.
+    Delivery is at-least-once, so handlers must be idempotent.
+    """
+
+    def __init__(self, app=None):
+        self.handlers = {}
+        self.inline = False
+        self.backoff = 5
+        self.max_backoff = 600
+        self.stale_after = 600
+        self.cli = AppGroup('jobs', help='Run and inspect background jobs.')
+        self._register_commands()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_RUN_INLINE', False)
+        app.config.setdefault('JOBS_RETRY_BACKOFF', 5)
+        app.config.setdefault('JOBS_STALE_AFTER', 600)
+        self.inline = app.config['JOBS_RUN_INLINE']
+        self.backoff = app.config['JOBS_RETRY_BACKOFF']
+        self.stale_after = app.config['JOBS_STALE_AFTER']
+        app.cli.add_command(self.cli)
+
+        if self.inline:
+            # Without a worker (e.g. in development) run committed jobs at the end of the request
+            if not event.contains(Session, 'after_commit', self._collect_committed):
+                event.listen(Session, 'after_commit', self._collect_committed)
+                event.listen(Session, 'after_rollback', self._discard_enqueued)
+            app.after_request(self._run_committed)
+
+    def job(self, name, max_attempts=5):
+        """Register a handler: ``@queue.job('images.make_variants')``. It is called with the payload as kwargs."""
+        def decorator(fn):
+            self.handlers[name] = (fn, max_attempts)
+            return fn
+        return decorator
+
+    def enqueue(self, name, payload=None, idempotency_key=None, delay=0):
+        """Add a job to the current session; it is committed with the caller's transaction.
+
+        If a job with the same ``idempotency_key`` is still queued, nothing is
+        added and that job is returned. A job that has finished, failed or
+        already started (and so may have run against older data) gives up the
+        key, and a new job is added.
+        """
+        if name not in self.handlers:
+            raise KeyError(f'No handler registered for job {name!r}')
+        if idempotency_key is not None:
+            existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+            if existing is not None:
+                if existing.status == 'queued':
+                    return existing
+                with db.session.begin_nested():
+                    existing.idempotency_key = None
+
+        job = Job(name=name, payload=payload or {}, idempotency_key=idempotency_key,
+                  max_attempts=self.handlers[name][1],
+                  run_at=datetime.utcnow() + timedelta(seconds=delay))
+        try:
+            with db.session.begin_nested():
+                db.session.add(job)
+        except IntegrityError:  # Lost a race with another request enqueuing the same key
+            return Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if self.inline:
+            db.session.info.setdefault('enqueued_jobs', []).append(job.id)
+        return job
+
+    def _collect_committed(self, session):
+        if session.in_nested_transaction():  # A savepoint was released, not the transaction
+            return
+        job_ids = session.info.pop('enqueued_jobs', None)
+        if job_ids:
+            session.info.setdefault('committed_jobs', []).extend(job_ids)
+
+    def _discard_enqueued(self, session):
+        if not session.in_nested_transaction():
+            session.info.pop('enqueued_jobs', None)
+
+    def _run_committed(self, response):
+        job_ids = db.session.info.pop('committed_jobs', None)
+        for job_id in job_ids or ():
+            if self._claim(job_id):
+                self.run(job_id)
+        return response
+
+    def _claim(self, job_id):
+        # The status check in the WHERE clause makes the claim atomic across workers
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', locked_at=datetime.utcnow(), attempts=Job.attempts + 1)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def claim_due(self, limit):
+        """Claim up to ``limit`` jobs whose run_at has passed; returns their ids."""
+        candidates = db.session.execute(
+            db.select(Job.id)
+            .where(Job.status == 'queued', Job.run_at <= datetime.utcnow())
+            .order_by(Job.run_at)
+            .limit(limit)
+        ).scalars().all()
+        return [job_id for job_id in candidates if self._claim(job_id)]
+
+    def run(self, job_id):
+        """Run one claimed job and record the outcome."""
+        job = db.session.get(Job, job_id)
+        handler, _ = self.handlers.get(job.name, (None, None))
+        try:
+            if handler is None:
+                raise KeyError(f'No handler registered for job {job.name!r}')
+            handler(**job.payload)
+        except Exception:
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.last_error = traceback.format_exc()[-4000:]
+            if job.attempts >= job.max_attempts:
+                job.status = 'failed'
+                logger.error('Job %s (%s) failed permanently', job.id, job.name)
+            else:
+                delay = min(self.backoff * 2 ** (job.attempts - 1), self.max_backoff)
+                job.status = 'queued'
+                job.run_at = datetime.utcnow() + timedelta(seconds=delay * random.uniform(1, 1.1))
+                logger.warning('Job %s (%s) failed, retrying in %.0fs', job.id, job.name, delay)
+        else:
+            job.status = 'done'
+            job.last_error = None
+        job.locked_at = None
+        db.session.commit()
+
+    def requeue_stale(self):
+        """Put back jobs left 'running' by a worker that died mid-job."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        result = db.session.execute(
+            update(Job).where(Job.status == 'running', Job.locked_at < cutoff).values(status='queued', locked_at=None)
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def work(self, app, threads=4, poll_interval=1.0, burst=False, stop=None):
+        """Claim and run jobs on a thread pool until ``stop`` is set (or, with ``burst``, until idle)."""
+        stop = stop or threading.Event()
+
+        def run_in_context(job_id):
+            with app.app_context():
+                self.run(job_id)
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            in_flight = set()
+            while not stop.is_set():
+                in_flight = {future for future in in_flight if not future.done()}
+                free = threads - len(in_flight)
+                job_ids = []
+                if free:
+                    with app.app_context():
+                        self.requeue_stale()
+                        job_ids = self.claim_due(free)
+                for job_id in job_ids:
+                    in_flight.add(executor.submit(run_in_context, job_id))
+                if not job_ids:
+                    if burst and not in_flight:
+                        break
+                    stop.wait(poll_interval)
+
+    def _register_commands(self):
+        queue = self
+
+        @self.cli.command('worker')
+        @click.option('--threads', default=4, show_default=True, help='Jobs run concurrently per process.')
+        @click.option('--processes', default=1, show_default=True, help='Worker processes to start.')
+        @click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to sleep when idle.')
+        @click.option('--burst', is_flag=True, help='Exit once there are no due jobs left.')
+        def worker(threads, processes, poll_interval, burst):
+            """Run background jobs."""
+            app = current_app._get_current_object()
+            if processes <= 1:
+                queue.work(app, threads=threads, poll_interval=poll_interval, burst=burst)
+                return
+
+            for engine in db.engines.values():
+                engine.dispose()  # Children must not share the parent's connections
+            context = multiprocessing.get_context('fork')
+            children = [context.Process(target=queue.work, args=(app, threads, poll_interval, burst))
+                        for _ in range(processes)]
+            for child in children:
+                child.start()
+            for child in children:
+                child.join()
+
+        @self.cli.command('status')
+        def status():
+            """Show job counts by status."""
+            rows = db.session.execute(db.select(Job.status, db.func.count()).group_by(Job.status)).all()
+            for job_status, count in rows:
+                click.echo(f'{job_status}: {count}')
+
+        @self.cli.command('retry-failed')
+        def retry_failed():
+            """Re-queue every failed job."""
+            result = db.session.execute(
+                update(Job).where(Job.status == 'failed').values(status='queued', attempts=0, run_at=datetime.utcnow())
+            )
+            db.session.commit()
+            click.echo(f'Re-queued {result.rowcount} job(s).')
+
+
+queue = JobQueue()
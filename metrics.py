@@ -0,0 +1,91 @@
+import bisect
+import threading
+
+
+def _escape_label_value(value):
+    # The text format escapes backslash, double quote and line feed in label values
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in sorted(labels.items()))
+    return '{' + pairs + '}'
+
+
+class Registry:
+    """A minimal Prometheus text-format registry.
+
+    Components register a collector callback that returns a list of
+    ``(name, type, help, samples)`` tuples, where ``samples`` is a list of
+    ``(suffix, labels, value)``. Collectors are called on every scrape, so
+    they should only read counters that are already being kept.
+    """
+
+    def __init__(self):
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            for name, metric_type, help_text, samples in collector():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for suffix, labels, value in samples:
+                    lines.append(f'{name}{suffix}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class Histogram:
+    """A Prometheus histogram with fixed buckets, optionally split by labels.
+
+    ``observe()`` is cheap enough for hot paths: one bisect and a few
+    additions under a lock. Register ``collect`` with the registry.
+    """
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def collect(self):
+        samples = []
+        with self._lock:
+            series = {key: (list(counts), count, total) for key, (counts, count, total) in self._series.items()}
+        for key, (counts, count, total) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', {**labels, 'le': repr(float(bound))}, cumulative))
+            samples.append(('_bucket', {**labels, 'le': '+Inf'}, count))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, count))
+        return [(self.name, 'histogram', self.help_text, samples)]
+
+
+registry = Registry()
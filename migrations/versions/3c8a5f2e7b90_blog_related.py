@@ -0,0 +1,38 @@
+"""blog related
+
+Revision ID: 3c8a5f2e7b90
+Revises: 9b4e6d1f8a27
+Create Date: 2026-10-17 22:41:06.193527
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8a5f2e7b90'
+down_revision = '9b4e6d1f8a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `flask related build`
+    op.create_table('blog_related',
+    sa.Column('blog_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.SmallInteger(), autoincrement=False, nullable=False),
+    sa.Column('related_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['blog_id'], ['blog.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['related_id'], ['blog.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('blog_id', 'rank')
+    )
+    with op.batch_alter_table('blog_related', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_blog_related_related_id'), ['related_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('blog_related', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_blog_related_related_id'))
+
+    op.drop_table('blog_related')
@@ -0,0 +1,32 @@
+"""blog fts
+
+Revision ID: 5e8d2b7c1f94
+Revises: c16ff6685e65
+Create Date: 2026-10-18 10:12:44.305118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8d2b7c1f94'
+down_revision = 'c16ff6685e65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Used by search.FTS5Backend when SQLite has FTS5; other databases use the memory index
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    if 'ENABLE_FTS5' not in bind.exec_driver_sql('PRAGMA compile_options').scalars().all():
+        return
+    op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS blog_fts USING fts5(title, summary, content, tokenize = 'unicode61')")
+    op.execute('INSERT INTO blog_fts (rowid, title, summary, content) '
+               'SELECT id, title, summary, content FROM blog WHERE draft = 0')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS blog_fts')
@@ -0,0 +1,29 @@
+"""blog view counts
+
+Revision ID: 9b4e6d1f8a27
+Revises: f7c2e9a4d310
+Create Date: 2026-10-17 21:08:13.440281
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e6d1f8a27'
+down_revision = 'f7c2e9a4d310'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blog_view_count',
+    sa.Column('blog_id', sa.Integer(), nullable=False),
+    sa.Column('views', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['blog_id'], ['blog.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('blog_id')
+    )
+
+
+def downgrade():
+    op.drop_table('blog_view_count')
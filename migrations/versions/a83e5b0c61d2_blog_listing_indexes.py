@@ -0,0 +1,29 @@
+"""blog listing indexes
+
+Revision ID: a83e5b0c61d2
+Revises: 4f1c2a9d7e01
+Create Date: 2026-10-17 09:31:02.557190
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83e5b0c61d2'
+down_revision = '4f1c2a9d7e01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('blog', schema=None) as batch_op:
+        batch_op.create_index('ix_blog_draft_date_posted', ['draft', 'date_posted', 'id'], unique=False)
+        batch_op.create_index('ix_blog_draft_category_date_posted', ['draft', 'category', 'date_posted', 'id'], unique=False)
+        batch_op.create_index('ix_blog_user_draft_date_posted', ['user_id', 'draft', 'date_posted', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('blog', schema=None) as batch_op:
+        batch_op.drop_index('ix_blog_user_draft_date_posted')
+        batch_op.drop_index('ix_blog_draft_category_date_posted')
+        batch_op.drop_index('ix_blog_draft_date_posted')
@@ -0,0 +1,43 @@
+"""blog counts
+
+Revision ID: b6f3d8a21c57
+Revises: e2b7f04c9d18
+Create Date: 2026-10-17 16:02:37.418265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f3d8a21c57'
+down_revision = 'e2b7f04c9d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    blog_count = op.create_table('blog_count',
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('subject', sa.String(length=100), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'subject')
+    )
+
+    # Fill the counters from the existing posts
+    blog = sa.table('blog', sa.column('category', sa.String), sa.column('draft', sa.Boolean),
+                    sa.column('user_id', sa.Integer))
+    columns = ['kind', 'subject', 'count']
+    op.execute(blog_count.insert().from_select(columns, sa.select(
+        sa.literal('category'), blog.c.category, sa.func.count())
+        .where(blog.c.draft == sa.false()).group_by(blog.c.category)))
+    op.execute(blog_count.insert().from_select(columns, sa.select(
+        sa.literal('author'), sa.cast(blog.c.user_id, sa.String), sa.func.count())
+        .group_by(blog.c.user_id)))
+    op.execute(blog_count.insert().from_select(columns, sa.select(
+        sa.literal('author_drafts'), sa.cast(blog.c.user_id, sa.String), sa.func.count())
+        .where(blog.c.draft == sa.true()).group_by(blog.c.user_id)))
+
+
+def downgrade():
+    op.drop_table('blog_count')
@@ -0,0 +1,35 @@
+"""search changes
+
+Revision ID: c16ff6685e65
+Revises: 3c8a5f2e7b90
+Create Date: 2026-10-17 23:52:37.608114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c16ff6685e65'
+down_revision = '3c8a5f2e7b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Appended to by search.SearchIndex and read by each worker's memory index
+    op.create_table('search_change',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('blog_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('search_change', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_search_change_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('search_change', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_search_change_created_at'))
+
+    op.drop_table('search_change')
@@ -0,0 +1,32 @@
+"""image variants
+
+Revision ID: c5d91e7f2a43
+Revises: a83e5b0c61d2
+Create Date: 2026-10-17 11:04:19.870412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d91e7f2a43'
+down_revision = 'a83e5b0c61d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('profile_picture_variants', sa.JSON(), nullable=True))
+
+    with op.batch_alter_table('blog', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('blog', schema=None) as batch_op:
+        batch_op.drop_column('image_variants')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('profile_picture_variants')
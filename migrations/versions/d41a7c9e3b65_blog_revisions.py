@@ -0,0 +1,34 @@
+"""blog revisions
+
+Revision ID: d41a7c9e3b65
+Revises: b6f3d8a21c57
+Create Date: 2026-10-17 18:41:09.527310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a7c9e3b65'
+down_revision = 'b6f3d8a21c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blog_revision',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('blog_id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.Column('snapshot', sa.Text(), nullable=True),
+    sa.Column('patch', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['blog_id'], ['blog.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('blog_id', 'revision', name='uq_blog_revision_blog_id_revision')
+    )
+
+
+def downgrade():
+    op.drop_table('blog_revision')
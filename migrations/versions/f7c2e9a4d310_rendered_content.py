@@ -0,0 +1,31 @@
+"""rendered content
+
+Revision ID: f7c2e9a4d310
+Revises: d41a7c9e3b65
+Create Date: 2026-10-17 19:34:52.806114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c2e9a4d310'
+down_revision = 'd41a7c9e3b65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing posts are rendered afterwards by `flask content backfill`
+    with op.batch_alter_table('blog', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('excerpt', sa.String(length=300), nullable=True))
+        batch_op.add_column(sa.Column('word_count', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('blog', schema=None) as batch_op:
+        batch_op.drop_column('word_count')
+        batch_op.drop_column('excerpt')
+        batch_op.drop_column('content_html')
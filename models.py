@@ -3,8 +3,20 @@ from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 
-# Initialize the database
-db = SQLAlchemy()
+from database import RoutingSession
+
+# Initialize the database; the routing session can send reads to replicas
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def truncate_words(text, word_limit=15):
+    """Returns ``text`` cut down to ``word_limit`` words, with '...' if anything was dropped."""
+    if not text:  # Handle empty summaries
+        return ""
+    words = text.split()  # Split the summary into words
+    if len(words) > word_limit:
+        return ' '.join(words[:word_limit]) + '...'  # Truncate and add '...'
+    return text  # Return the full summary if within the limit
 
 
 class User(db.Model, UserMixin):
@@ -12,6 +24,7 @@ class User(db.Model, UserMixin):
     first_name = db.Column(db.String(100), nullable=False)
     last_name = db.Column(db.String(100), nullable=False)
     profile_picture = db.Column(db.String(100), nullable=True)
+    profile_picture_variants = db.Column(db.JSON, nullable=True)  # {'webp': {'128': path, ...}, 'jpg': {...}}
     username = db.Column(db.String(100), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
@@ -26,26 +39,190 @@ class User(db.Model, UserMixin):
 
 
 class Blog(db.Model):
+    # Composite indexes matching the listing queries: equality filters first,
+    # then the (date_posted, id) keyset used for ordering and pagination.
+    __table_args__ = (
+        db.Index('ix_blog_draft_date_posted', 'draft', 'date_posted', 'id'),
+        db.Index('ix_blog_draft_category_date_posted', 'draft', 'category', 'date_posted', 'id'),
+        db.Index('ix_blog_user_draft_date_posted', 'user_id', 'draft', 'date_posted', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(120), nullable=False)
     image = db.Column(db.String(120), nullable=True)
+    image_variants = db.Column(db.JSON, nullable=True)  # {'webp': {'400': path, ...}, 'jpg': {...}}
     category = db.Column(db.String(50), nullable=False)
     summary = db.Column(db.String(250), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # Rendered from content when it is saved (see rendering.py); NULL until backfilled
+    content_html = db.Column(db.Text, nullable=True)
+    excerpt = db.Column(db.String(300), nullable=True)  # Plain text
+    word_count = db.Column(db.Integer, nullable=True)
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     draft = db.Column(db.Boolean, default=False)
 
     # Foreign key for User
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Autosaved working copies of the content; see revisions.py. Deleting a
+    # blog does not load them: the database cascade (or revisions.delete_for) removes them.
+    revisions = db.relationship('BlogRevision', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
+
+    @classmethod
+    def published(cls, category=None):
+        """Query for published blogs, optionally limited to a single category."""
+        query = cls.query.filter_by(draft=False)
+        if category:
+            query = query.filter_by(category=category)
+        return query
+
+    @classmethod
+    def doctor_feed(cls, user_id, category=None):
+        """Queries for published blogs plus the given doctor's own drafts.
+
+        Returned as two disjoint queries so each can walk its own index;
+        pagination.paginate merges them.
+        """
+        drafts = cls.by_author(user_id, draft=True)
+        if category:
+            drafts = drafts.filter_by(category=category)
+        return [cls.published(category), drafts]
+
+    @classmethod
+    def by_author(cls, user_id, draft=False):
+        """Query for one author's published blogs, or their drafts."""
+        return cls.query.filter_by(user_id=user_id, draft=draft)
+
+    @classmethod
+    def card_columns(cls):
+        """Columns needed to render a listing card; never includes ``content``."""
+        return cls.id, cls.title, cls.image, cls.image_variants, cls.summary, cls.user_id, cls.date_posted
+
     def truncated_summary(self, word_limit=15):
         """Returns a truncated version of the summary with a word limit."""
-        if not self.summary:  # Handle empty summaries
-            return ""
-        words = self.summary.split()  # Split the summary into words
-        if len(words) > word_limit:
-            return ' '.join(words[:word_limit]) + '...'  # Truncate and add '...'
-        return self.summary  # Return the full summary if within the limit
+        return truncate_words(self.summary, word_limit)
 
     def __repr__(self):
         return f"<Blog {self.title}>"
+
+
+class BlogCard:
+    """Lightweight read-only view of a blog for listing pages.
+
+    Built from a row of Blog.card_columns(), so the article body is never
+    loaded, and the truncated summary is computed once up front.
+    """
+    __slots__ = ('id', 'title', 'image', 'image_variants', 'user_id', 'date_posted', 'truncated_summary')
+
+    def __init__(self, id, title, image, image_variants, summary, user_id, date_posted):
+        self.id = id
+        self.title = title
+        self.image = image
+        self.image_variants = image_variants
+        self.user_id = user_id
+        self.date_posted = date_posted
+        self.truncated_summary = truncate_words(summary)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.id, row.title, row.image, row.image_variants, row.summary, row.user_id, row.date_posted)
+
+    def __repr__(self):
+        return f"<BlogCard {self.title}>"
+
+
+class BlogCount(db.Model):
+    """A materialized count of blogs, kept in step with the blog table by counters.py.
+
+    ``kind`` is 'category' (published posts in the category named by
+    ``subject``), 'author' (all of a user's posts) or 'author_drafts' (a
+    user's drafts); for the author kinds ``subject`` is the user id.
+    """
+    kind = db.Column(db.String(20), primary_key=True)
+    subject = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<BlogCount {self.kind} {self.subject}={self.count}>"
+
+
+class BlogViewCount(db.Model):
+    """How many times a published blog was read; written in batches by views.ViewCounter.
+
+    Kept out of the blog table so counting views never rewrites (or locks)
+    the wide blog rows.
+    """
+    blog_id = db.Column(db.Integer, db.ForeignKey('blog.id', ondelete='CASCADE'), primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<BlogViewCount {self.blog_id}={self.views}>"
+
+
+class SearchChange(db.Model):
+    """A blog whose search entry changed, for the workers' memory indexes; see search.SearchIndex.
+
+    A NULL blog_id asks every worker to rebuild its index.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    blog_id = db.Column(db.Integer, nullable=True)  # No foreign key: deletions are logged too
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<SearchChange {self.id} blog={self.blog_id}>"
+
+
+class BlogRelated(db.Model):
+    """The ``rank``-th most similar published post to a blog, computed by related.py (0 is the closest)."""
+    blog_id = db.Column(db.Integer, db.ForeignKey('blog.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    related_id = db.Column(db.Integer, db.ForeignKey('blog.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)  # Cosine similarity of the two posts' TF-IDF vectors
+
+    def __repr__(self):
+        return f"<BlogRelated {self.blog_id}#{self.rank}={self.related_id}>"
+
+
+class BlogRevision(db.Model):
+    """One autosaved state of a blog's content, numbered from 1 per blog.
+
+    A row holds either ``snapshot``, the full text, or ``patch``, the edits
+    turning the previous revision's text into this one's (see revisions.py).
+    The unique (blog_id, revision) pair is the optimistic version check: two
+    saves based on the same revision cannot both be stored.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('blog_id', 'revision', name='uq_blog_revision_blog_id_revision'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    blog_id = db.Column(db.Integer, db.ForeignKey('blog.id', ondelete='CASCADE'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    snapshot = db.Column(db.Text, nullable=True)
+    patch = db.Column(db.JSON, nullable=True)  # [[start, end, replacement], ...]
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<BlogRevision {self.blog_id}@{self.revision}>"
+
+
+class Job(db.Model):
+    """A background job; see jobs.JobQueue."""
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.name} {self.status}>"
@@ -0,0 +1,323 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class CacheEntry:
+    """A rendered response body plus the ETag used for conditional GETs."""
+    __slots__ = ('body', 'mimetype', 'etag')
+
+    def __init__(self, body, mimetype='text/html', etag=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag or hashlib.md5(body).hexdigest()
+
+    def __len__(self):
+        return len(self.body)
+
+
+class MemoryBackend:
+    """In-process LRU store bounded by the total size of the cached bodies.
+
+    Entries expire ``ttl`` seconds after they are stored (0 keeps them until
+    evicted). Other processes cannot invalidate this store, so the TTL bounds
+    how long they keep serving a page after it changed.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at and expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = len(value) if isinstance(value, CacheEntry) else 0
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at)
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None and isinstance(item[0], CacheEntry):
+            self._size -= len(item[0])
+
+
+class FileSystemBackend:
+    """On-disk store shared by every worker on the host, bounded by total file size.
+
+    Files are touched on read, so eviction removes the least recently used
+    entries first.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+            return value
+        except Exception:  # Missing, or written by an older version of CacheEntry
+            return None
+
+    def set(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            try:
+                self._size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp_path, path)  # Atomic, so readers never see half a file
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        path = self._path(key)
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._size -= size
+            except OSError:
+                pass
+
+    def _evict(self):
+        entries = sorted((entry for entry in os.scandir(self.directory)
+                          if entry.is_file() and not entry.name.startswith('.tmp-')),
+                         key=lambda entry: entry.stat().st_atime_ns)
+        self._size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except OSError:
+                pass
+
+
+class NullBackend:
+    """Backend that stores nothing, used when the page cache is disabled."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class BackendGenerations:
+    """Generation tokens kept in the cache backend itself, so only its users see them.
+
+    Tokens are random rather than counters, so a token that gets evicted is
+    replaced by a new one instead of resurrecting stale pages.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, name):
+        generation = self.backend.get(f'gen:{name}')
+        if generation is None:
+            generation = self.bump(name)
+        return generation
+
+    def bump(self, name):
+        generation = uuid.uuid4().hex[:12]
+        self.backend.set(f'gen:{name}', generation)
+        return generation
+
+
+class FileGenerations:
+    """Generation tokens in small files, shared by every process on the host.
+
+    Web workers and ``flask jobs worker`` each have their own memory cache,
+    but they all read the tokens from here, so an invalidation in any of them
+    reaches the others. A name that was never invalidated has no file.
+    Tokens are kept in memory and a file is only looked at again (with a
+    stat, and read if it was replaced) once REFRESH_INTERVAL has passed, so
+    other processes' invalidations take up to that long to show.
+    """
+
+    REFRESH_INTERVAL = 1.0  # Seconds
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._tokens = {}  # name -> (generation, file identity, monotonic time checked)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, hashlib.sha1(name.encode('utf-8')).hexdigest())
+
+    def get(self, name):
+        now = time.monotonic()
+        cached = self._tokens.get(name)
+        if cached is not None and now - cached[2] < self.REFRESH_INTERVAL:
+            return cached[0]
+        path = self._path(name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            generation, identity = '0', None
+        else:
+            # bump() replaces the file, so a new inode or mtime means a new token
+            identity = (stat.st_ino, stat.st_mtime_ns)
+            if cached is not None and cached[1] == identity:
+                generation = cached[0]
+            else:
+                try:
+                    with open(path) as f:
+                        generation = f.read() or '0'
+                except OSError:
+                    generation, identity = '0', None
+        self._tokens[name] = (generation, identity, now)
+        return generation
+
+    def bump(self, name):
+        generation = uuid.uuid4().hex[:12]
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(generation)
+        path = self._path(name)
+        os.replace(tmp_path, path)
+        stat = os.stat(path)
+        self._tokens[name] = (generation, (stat.st_ino, stat.st_mtime_ns), time.monotonic())
+        return generation
+
+
+class PageCache:
+    """Cache of rendered published pages keyed by blog id or by feed and cursor.
+
+    Keys embed generation tokens: one per blog, and one per feed category.
+    Replacing a token invalidates the pages built with it, every cached page
+    of a feed at once, without having to enumerate them. With a memory or
+    filesystem backend the tokens live in PAGE_CACHE_DIR/generations, so
+    invalidations reach every process on the host.
+    """
+
+    ALL = '*'
+
+    def __init__(self, backend=None, app=None, generations=None):
+        self.backend = backend if backend is not None else NullBackend()
+        self.generations = generations if generations is not None else BackendGenerations(self.backend)
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Pick the backend from PAGE_CACHE_BACKEND: 'memory', 'filesystem' or anything else for none."""
+        app.config.setdefault('PAGE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        app.config.setdefault('PAGE_CACHE_TTL', 60)
+        app.config.setdefault('PAGE_CACHE_DIR', os.path.join(app.instance_path, 'page_cache'))
+        if app.config['PAGE_CACHE_BACKEND'] == 'filesystem':
+            self.backend = FileSystemBackend(app.config['PAGE_CACHE_DIR'], app.config['PAGE_CACHE_MAX_BYTES'])
+        elif app.config['PAGE_CACHE_BACKEND'] == 'memory':
+            self.backend = MemoryBackend(app.config['PAGE_CACHE_MAX_BYTES'], app.config['PAGE_CACHE_TTL'])
+        else:
+            self.backend = NullBackend()
+            self.generations = BackendGenerations(self.backend)
+            return
+        self.generations = FileGenerations(os.path.join(app.config['PAGE_CACHE_DIR'], 'generations'))
+
+    @property
+    def enabled(self):
+        return not isinstance(self.backend, NullBackend)
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def set(self, key, body, mimetype='text/html'):
+        entry = CacheEntry(body, mimetype=mimetype)
+        self.backend.set(key, entry)
+        return entry
+
+    def blog_key(self, blog_id):
+        generation = f'{self.generations.get(f"blog:{blog_id}")}.{self.generations.get("blog:" + self.ALL)}'
+        return f'blog:{blog_id}:g{generation}'
+
+    def feed_key(self, endpoint, category=None, **params):
+        category = category or self.ALL
+        generation = self.generations.get(category)
+        if category != self.ALL:
+            generation = f'{generation}.{self.generations.get(self.ALL)}'
+        extra = ':'.join(f'{name}={params[name] or ""}' for name in sorted(params))
+        return f'feed:{endpoint}:{category}:g{generation}:{extra}'
+
+    def invalidate_blog(self, blog_id):
+        key = self.blog_key(blog_id)
+        self.generations.bump(f'blog:{blog_id}')
+        self.backend.delete(key)  # Frees the space now instead of at eviction
+
+    def invalidate_all_blogs(self):
+        """Invalidate every cached blog page, e.g. after re-rendering all posts."""
+        self.generations.bump('blog:' + self.ALL)
+
+    def invalidate_feeds(self, *categories):
+        """Invalidate cached feed pages for the given categories and the unfiltered feed."""
+        for category in set(categories) | {self.ALL}:
+            self.generations.bump(category)
+
+    def collect_metrics(self):
+        return [
+            ('page_cache_hits_total', 'counter', 'Rendered pages served from the page cache.',
+             [('', {}, self.hits)]),
+            ('page_cache_misses_total', 'counter', 'Page cache lookups that had to render.',
+             [('', {}, self.misses)]),
+        ]
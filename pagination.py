@@ -0,0 +1,103 @@
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from models import Blog
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(blog):
+    """Encode the (date_posted, id) key of a blog into an opaque URL-safe cursor."""
+    raw = f"{blog.date_posted.isoformat()}|{blog.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor back into (date_posted, id)."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_part, id_part = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+class KeysetPage:
+    """One page of blogs plus the cursors needed to reach its neighbours."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_query(query, after=None, before=None, limit=12):
+    """Apply the keyset filter, ordering and limit for one page to ``query``.
+
+    Pages after a cursor (or the first page) are ordered newest first; pages
+    before a cursor are ordered oldest first and must be reversed by the caller.
+    """
+    if before:
+        date_posted, blog_id = decode_cursor(before)
+        return (query
+                .filter(or_(Blog.date_posted > date_posted,
+                            and_(Blog.date_posted == date_posted, Blog.id > blog_id)))
+                .order_by(Blog.date_posted.asc(), Blog.id.asc())
+                .limit(limit))
+
+    if after:
+        date_posted, blog_id = decode_cursor(after)
+        query = query.filter(or_(Blog.date_posted < date_posted,
+                                 and_(Blog.date_posted == date_posted, Blog.id < blog_id)))
+    return query.order_by(Blog.date_posted.desc(), Blog.id.desc()).limit(limit)
+
+
+def _sort_key(blog):
+    return blog.date_posted, blog.id
+
+
+def paginate(query, after=None, before=None, per_page=12):
+    """Return a KeysetPage of ``query`` ordered newest first by (date_posted, id).
+
+    ``after`` fetches the page following a cursor, ``before`` the page preceding
+    it. Only ``per_page + 1`` rows are read, so the cost of a page does not grow
+    with the size of the table.
+
+    ``query`` may also be a list of disjoint queries (the branches of a UNION).
+    Each branch is paged on its own index and the results are merged here,
+    which avoids the sort an ``OR`` across two indexes would need.
+    """
+    branches = query if isinstance(query, (list, tuple)) else [query]
+    rows = []
+    for branch in branches:
+        rows.extend(keyset_query(branch, after=after, before=before, limit=per_page + 1).all())
+
+    if before:
+        rows = sorted(rows, key=_sort_key)[:per_page + 1]
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        if not items:  # The previous page vanished (e.g. posts deleted); start over
+            return paginate(query, per_page=per_page)
+        return KeysetPage(items,
+                          next_cursor=encode_cursor(items[-1]),
+                          prev_cursor=encode_cursor(items[0]) if has_prev else None)
+
+    rows = sorted(rows, key=_sort_key, reverse=True)[:per_page + 1]
+    items = rows[:per_page]
+    has_next = len(rows) > per_page
+    return KeysetPage(items,
+                      next_cursor=encode_cursor(items[-1]) if has_next else None,
+                      prev_cursor=encode_cursor(items[0]) if after and items else None)
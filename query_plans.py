@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from app import BLOG_CATEGORIES
+from models import db, Blog
+from pagination import keyset_query, encode_cursor
+
+
+def listing_queries(user_id=1, category=BLOG_CATEGORIES[0], per_page=12):
+    """Every query issued by the blog listing routes, keyed by a readable name.
+
+    Each listing is checked for its first page and for the pages after and
+    before a cursor, because those add range conditions on (date_posted, id).
+    """
+    cursor = encode_cursor(Blog(id=1, date_posted=datetime(2024, 1, 1)))
+    feed_published, feed_drafts = Blog.doctor_feed(user_id, category)
+    listings = {
+        'published': Blog.published(),
+        'published_by_category': Blog.published(category),
+        'doctor_feed_published': feed_published,
+        'doctor_feed_drafts': feed_drafts,
+        'my_blogs': Blog.by_author(user_id),
+        'my_drafts': Blog.by_author(user_id, draft=True),
+    }
+
+    queries = {}
+    for name, query in listings.items():
+        query = query.with_entities(*Blog.card_columns())
+        queries[name] = keyset_query(query, limit=per_page + 1)
+        queries[f'{name}_after_cursor'] = keyset_query(query, after=cursor, limit=per_page + 1)
+        queries[f'{name}_before_cursor'] = keyset_query(query, before=cursor, limit=per_page + 1)
+    return queries
+
+
+def explain(query):
+    """Return the database's query plan for ``query`` as a list of rows."""
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    with db.engine.connect() as connection:
+        result = connection.exec_driver_sql(prefix + sql)
+        return [dict(row._mapping) for row in result]
+
+
+def plan_problems(dialect_name, plan):
+    """Return the full scans and filesorts found in a plan produced by explain()."""
+    problems = []
+    for row in plan:
+        if dialect_name == 'sqlite':
+            detail = row['detail']
+            if detail.startswith('SCAN '):
+                problems.append(f'full scan: {detail}')
+            if 'USE TEMP B-TREE' in detail:
+                problems.append(f'filesort: {detail}')
+        elif dialect_name in ('mysql', 'mariadb'):
+            if row.get('type') == 'ALL':
+                problems.append(f"full scan of {row.get('table')}")
+            if 'Using filesort' in (row.get('Extra') or ''):
+                problems.append(f"filesort on {row.get('table')}")
+    return problems
+
+
+def check_query_plans():
+    """Explain every listing query and return {name: [problems]} for the bad ones."""
+    dialect_name = db.engine.dialect.name
+    failures = {}
+    for name, query in listing_queries().items():
+        problems = plan_problems(dialect_name, explain(query))
+        if problems:
+            failures[name] = problems
+    return failures
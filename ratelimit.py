@@ -0,0 +1,196 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.utils import import_string
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a client is over a rate limit; the request should be retried after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after=60):
+        super().__init__('Too many requests')
+        self.retry_after = retry_after
+
+
+class MemoryStore:
+    """Per-process counter store, split into independently locked shards.
+
+    Every operation is O(1). Each shard keeps at most ``max_keys / shards``
+    counters and evicts the least recently updated one beyond that, so a
+    flood of distinct IPs or usernames cannot grow memory without bound.
+    Expired counters are dropped when they are next touched or evicted.
+
+    A shared store for multi-worker deployments needs the same three methods:
+    ``incr(key, amount, ttl)`` returning the new value, ``get(key)`` and
+    ``delete(*keys)``.
+    """
+
+    def __init__(self, max_keys=100000, shards=16):
+        self._shards = [(OrderedDict(), threading.Lock()) for _ in range(shards)]
+        self._max_per_shard = max(1, max_keys // shards)
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def incr(self, key, amount, ttl):
+        data, lock = self._shard(key)
+        now = time.monotonic()
+        with lock:
+            entry = data.pop(key, None)
+            if entry is None or entry[1] <= now:
+                entry = (amount, now + ttl)
+            else:
+                entry = (entry[0] + amount, entry[1])
+            data[key] = entry  # Re-inserted at the end: most recently updated
+            if len(data) > self._max_per_shard:
+                data.popitem(last=False)
+        return entry[0]
+
+    def get(self, key):
+        data, lock = self._shard(key)
+        with lock:
+            entry = data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return 0
+            return entry[0]
+
+    def delete(self, *keys):
+        for key in keys:
+            data, lock = self._shard(key)
+            with lock:
+                data.pop(key, None)
+
+    def __len__(self):
+        return sum(len(data) for data, _ in self._shards)
+
+
+class RedisStore:
+    """Counter store shared by every worker, kept in Redis (``pip install redis``)."""
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def incr(self, key, amount, ttl):
+        pipeline = self._redis.pipeline()
+        pipeline.incrby(key, amount)
+        pipeline.expire(key, math.ceil(ttl), nx=True)
+        return pipeline.execute()[0]
+
+    def get(self, key):
+        return int(self._redis.get(key) or 0)
+
+    def delete(self, *keys):
+        self._redis.delete(*keys)
+
+
+class SlidingWindow:
+    """Sliding-window counter: at most ``limit`` events per ``window`` seconds per identity.
+
+    Counts are kept per fixed window, and the estimate blends the current
+    window with the previous one weighted by how much of it still overlaps
+    the sliding window. That needs two counters per identity instead of a
+    timestamp per event. Window numbers come from wall-clock time so every
+    worker sharing a store agrees on them.
+    """
+
+    def __init__(self, store, name, limit, window):
+        self.store = store
+        self.name = name
+        self.limit = limit
+        self.window = window
+
+    def _keys(self, identity, now):
+        index = int(now // self.window)
+        return (f'rl:{self.name}:{identity}:{index}', f'rl:{self.name}:{identity}:{index - 1}',
+                (now % self.window) / self.window)
+
+    def _estimate(self, current, previous, elapsed):
+        return current + previous * (1 - elapsed)
+
+    def _retry_after(self, now):
+        return max(1, math.ceil(self.window - now % self.window))
+
+    def check(self, identity):
+        """Raise RateLimitExceeded if ``identity`` is already at the limit, without counting an event."""
+        now = time.time()
+        current_key, previous_key, elapsed = self._keys(identity, now)
+        if self._estimate(self.store.get(current_key), self.store.get(previous_key), elapsed) >= self.limit:
+            raise RateLimitExceeded(self._retry_after(now))
+
+    def hit(self, identity):
+        """Count an event and raise RateLimitExceeded if it takes ``identity`` over the limit."""
+        now = time.time()
+        current_key, previous_key, elapsed = self._keys(identity, now)
+        current = self.store.incr(current_key, 1, 2 * self.window)
+        if self._estimate(current, self.store.get(previous_key), elapsed) > self.limit:
+            raise RateLimitExceeded(self._retry_after(now))
+
+    def reset(self, identity):
+        current_key, previous_key, _ = self._keys(identity, time.time())
+        self.store.delete(current_key, previous_key)
+
+
+class LoginThrottle:
+    """Brute-force protection for the login form.
+
+    Every attempt counts against the client's IP, and failed attempts count
+    against the username, which is reset by a successful login. ``check()``
+    is called before the user lookup and password verification, so a
+    throttled attempt costs no database or hashing work.
+    """
+
+    def __init__(self, store=None, per_ip=20, per_ip_window=60, per_username=5, per_username_window=300):
+        self.per_ip = SlidingWindow(store, 'login-ip', per_ip, per_ip_window)
+        self.per_username = SlidingWindow(store, 'login-user', per_username, per_username_window)
+        self.rejected = {'ip': 0, 'username': 0}
+
+    def init_app(self, app, store):
+        app.config.setdefault('LOGIN_LIMIT_PER_IP', 20)
+        app.config.setdefault('LOGIN_LIMIT_PER_IP_WINDOW', 60)
+        app.config.setdefault('LOGIN_LIMIT_PER_USERNAME', 5)
+        app.config.setdefault('LOGIN_LIMIT_PER_USERNAME_WINDOW', 300)
+        self.per_ip = SlidingWindow(store, 'login-ip', app.config['LOGIN_LIMIT_PER_IP'],
+                                    app.config['LOGIN_LIMIT_PER_IP_WINDOW'])
+        self.per_username = SlidingWindow(store, 'login-user', app.config['LOGIN_LIMIT_PER_USERNAME'],
+                                          app.config['LOGIN_LIMIT_PER_USERNAME_WINDOW'])
+
+    @staticmethod
+    def _username(username):
+        return (username or '').strip().lower()
+
+    def check(self, ip, username):
+        try:
+            self.per_ip.hit(ip)
+        except RateLimitExceeded:
+            self.rejected['ip'] += 1
+            raise
+        try:
+            self.per_username.check(self._username(username))
+        except RateLimitExceeded:
+            self.rejected['username'] += 1
+            raise
+
+    def failed(self, username):
+        try:
+            self.per_username.hit(self._username(username))
+        except RateLimitExceeded:
+            pass  # The next attempt is the one that gets rejected
+
+    def succeeded(self, username):
+        self.per_username.reset(self._username(username))
+
+    def collect_metrics(self):
+        return [('login_rate_limited_total', 'counter', 'Login attempts rejected by the rate limiter.',
+                 [('', {'key': key}, count) for key, count in self.rejected.items()])]
+
+
+def make_store(spec, max_keys=100000):
+    """Build a counter store from a RATE_LIMIT_STORE setting: '' or 'memory', a redis:// URL, or an import path."""
+    if not spec or spec == 'memory':
+        return MemoryStore(max_keys=max_keys)
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(spec)
+    return import_string(spec)()
@@ -0,0 +1,407 @@
+"""Precomputed "related posts" for the blog page.
+
+Every published post is turned into a TF-IDF vector over the words of its
+title, summary and content (titles and summaries weigh more), kept sparse
+and cut down to its RELATED_TERMS_PER_POST strongest terms, and compared
+with the others by cosine similarity. The RELATED_POSTS nearest posts of
+each one, optionally only from the same category, are stored in
+blog_related, so the blog page reads them with one query on its primary key.
+
+``flask related build`` computes everything from scratch and saves the
+vectors to RELATED_INDEX_PATH. After that, ``update()`` (run as a background
+job whenever a post is published, edited, unpublished or deleted) only
+recomputes the posts whose neighbours can have changed. It reuses the
+vocabulary and IDF weights of the last build, so words that first appear
+later only count after the next full build; rebuild now and then, e.g.
+nightly. NumPy and SciPy are only imported by the build and the job.
+"""
+import contextlib
+import logging
+import math
+import os
+import time
+from array import array
+from collections import Counter
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models import db, Blog, BlogRelated
+from search import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Similarities computed at once, at most; each costs 8 bytes, plus scipy's working space
+MAX_SIMILARITIES = 4_000_000
+
+# How many words of the content a word in the title or summary counts as
+FIELD_WEIGHTS = {'title': 3, 'summary': 2}
+
+related_cli = AppGroup('related', help='Maintain the related posts shown on each blog page.')
+
+
+def for_blog(blog_id):
+    """``[(id, title, category), ...]`` of the posts related to ``blog_id``, most similar first."""
+    return db.session.execute(
+        db.select(Blog.id, Blog.title, Blog.category)
+        .join(BlogRelated, BlogRelated.related_id == Blog.id)
+        .where(BlogRelated.blog_id == blog_id, Blog.draft == False)  # noqa: E712
+        .order_by(BlogRelated.rank)).all()
+
+
+def forget(blog_ids):
+    """Delete the related posts of, and links to, blogs about to be deleted, in the caller's transaction."""
+    if blog_ids:
+        db.session.execute(db.delete(BlogRelated).where(
+            db.or_(BlogRelated.blog_id.in_(blog_ids), BlogRelated.related_id.in_(blog_ids))))
+
+
+def term_counts(title, summary, content):
+    """``{term: weighted count}`` for one post."""
+    counts = Counter(tokenize(content))
+    for field, text in (('title', title), ('summary', summary)):
+        for term in tokenize(text):
+            counts[term] += FIELD_WEIGHTS[field]
+    return counts
+
+
+def count_matrix(documents, vocabulary, grow=False):
+    """CSR matrix of the ``term_counts()`` of ``documents``, one row each, with a column per term of ``vocabulary``.
+
+    With ``grow``, terms missing from ``vocabulary`` are added to it;
+    otherwise they are left out.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    indptr, indices, data = array('q', [0]), array('i'), array('f')
+    for counts in documents:
+        if grow:
+            indices.extend([vocabulary.setdefault(term, len(vocabulary)) for term in counts])
+            data.extend(counts.values())
+        else:
+            for term, count in counts.items():
+                column = vocabulary.get(term)
+                if column is not None:
+                    indices.append(column)
+                    data.append(count)
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.frombuffer(data, dtype=np.float32) if data else np.zeros(0, np.float32),
+                              np.frombuffer(indices, dtype=np.int32) if indices else np.zeros(0, np.int32),
+                              np.frombuffer(indptr, dtype=np.int64)),
+                             shape=(len(indptr) - 1, len(vocabulary)))
+
+
+def _published(blog_ids=None):
+    query = (db.select(Blog.id, Blog.category, Blog.title, Blog.summary, Blog.content)
+             .where(Blog.draft == False)  # noqa: E712
+             .order_by(Blog.id))
+    if blog_ids is not None:
+        query = query.where(Blog.id.in_(blog_ids))
+    return db.session.execute(query.execution_options(yield_per=1000))
+
+
+class RelatedIndex:
+    """The vectors of every published post and their current nearest neighbours.
+
+    Row ``i`` of ``vectors`` (a CSR matrix of unit-length rows) belongs to
+    post ``ids[i]`` in ``categories[i]``; ``neighbours[i]`` holds the ids of
+    its nearest posts, most similar first and padded with -1, and
+    ``scores[i]`` their cosine similarities.
+    """
+
+    def __init__(self, ids, categories, vectors, vocabulary, idf, neighbours, scores, same_category, terms_per_post):
+        import numpy as np
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.categories = np.asarray(categories, dtype=str)
+        self.vectors = vectors
+        self.vocabulary = vocabulary  # {term: column}
+        self.idf = idf
+        self.neighbours = neighbours
+        self.scores = scores
+        self.same_category = same_category
+        self.terms_per_post = terms_per_post
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays, not counting the vocabulary dict."""
+        return (self.vectors.data.nbytes + self.vectors.indices.nbytes + self.vectors.indptr.nbytes
+                + self.ids.nbytes + self.idf.nbytes + self.neighbours.nbytes + self.scores.nbytes)
+
+    def vectorize(self, counts, chunk_size=2000):
+        """Unit-length TF-IDF rows for a ``count_matrix()``, each pruned to its strongest terms."""
+        import numpy as np
+        from scipy import sparse
+
+        chunks = []
+        for chunk_start in range(0, counts.shape[0], chunk_size):
+            chunk = counts[chunk_start:chunk_start + chunk_size]
+            indptr, indices = chunk.indptr, chunk.indices
+            # Sublinear term frequency: the tenth mention of a word adds less than the first
+            data = (1 + np.log(chunk.data)) * self.idf[indices]
+            keep = np.zeros(len(data), dtype=bool)
+            for start, end in zip(indptr[:-1], indptr[1:]):
+                if end - start <= self.terms_per_post:
+                    keep[start:end] = True
+                else:
+                    keep[start + np.argpartition(data[start:end], -self.terms_per_post)[-self.terms_per_post:]] = True
+            keep &= data > 0  # Words found in a single post (IDF 0) cannot link two posts
+            kept = np.concatenate(([0], np.cumsum(keep, dtype=np.int64)))
+            matrix = sparse.csr_matrix((data[keep].astype(np.float32), indices[keep], kept[indptr]),
+                                       shape=(chunk.shape[0], len(self.idf)))
+            norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+            norms[norms == 0] = 1
+            matrix.data /= np.repeat(norms, np.diff(matrix.indptr)).astype(np.float32)
+            chunks.append(matrix)
+        if not chunks:
+            return sparse.csr_matrix((0, len(self.idf)), dtype=np.float32)
+        return sparse.vstack(chunks, format='csr')
+
+    def nearest(self, positions, n, chunk_size=1000):
+        """``(neighbours, scores)`` of the posts at ``positions``: their ``n`` most similar other posts."""
+        import numpy as np
+
+        neighbours = np.full((len(positions), n), -1, dtype=np.int64)
+        scores = np.zeros((len(positions), n), dtype=np.float32)
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.same_category:
+            # Each category is compared only with itself
+            groups = [(np.flatnonzero(self.categories[positions] == category),
+                       np.flatnonzero(self.categories == category))
+                      for category in np.unique(self.categories[positions])]
+        else:
+            groups = [(np.arange(len(positions)), np.arange(self.size))]
+        for rows, candidates in groups:
+            transposed = self.vectors[candidates].T.tocsr()
+            step = max(1, min(chunk_size, MAX_SIMILARITIES // max(len(candidates), 1)))
+            for chunk_start in range(0, len(rows), step):
+                chunk = rows[chunk_start:chunk_start + step]
+                similarities = (self.vectors[positions[chunk]] @ transposed).tocsr()
+                for offset, row in enumerate(chunk):
+                    start, end = similarities.indptr[offset], similarities.indptr[offset + 1]
+                    columns, values = candidates[similarities.indices[start:end]], similarities.data[start:end]
+                    other = columns != positions[row]
+                    columns, values = columns[other], values[other]
+                    if len(values) > n:
+                        top = np.argpartition(values, -n)[-n:]
+                        columns, values = columns[top], values[top]
+                    order = np.lexsort((self.ids[columns], -values))  # Ties go to the older post
+                    neighbours[row, :len(order)] = self.ids[columns[order]]
+                    scores[row, :len(order)] = values[order]
+        return neighbours, scores
+
+    def positions(self, blog_ids):
+        import numpy as np
+
+        return np.flatnonzero(np.isin(self.ids, list(blog_ids)))
+
+    def remove(self, blog_ids):
+        import numpy as np
+
+        keep = ~np.isin(self.ids, list(blog_ids))
+        self.ids, self.categories = self.ids[keep], self.categories[keep]
+        self.vectors, self.neighbours, self.scores = self.vectors[keep], self.neighbours[keep], self.scores[keep]
+
+    def append(self, ids, categories, vectors):
+        import numpy as np
+        from scipy import sparse
+
+        n = self.neighbours.shape[1]
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.categories = np.concatenate([self.categories, np.asarray(categories, dtype=str)])
+        self.vectors = sparse.vstack([self.vectors, vectors], format='csr')
+        self.neighbours = np.vstack([self.neighbours, np.full((len(ids), n), -1, dtype=np.int64)])
+        self.scores = np.vstack([self.scores, np.zeros((len(ids), n), dtype=np.float32)])
+
+    def save(self, path):
+        import numpy as np
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        terms = np.empty(len(self.vocabulary), dtype=object)
+        for term, column in self.vocabulary.items():
+            terms[column] = term
+        temporary = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(temporary, ids=self.ids, categories=self.categories, data=self.vectors.data,
+                 indices=self.vectors.indices, indptr=self.vectors.indptr, terms=terms.astype(str), idf=self.idf,
+                 neighbours=self.neighbours, scores=self.scores,
+                 settings=np.array([self.same_category, self.terms_per_post]))
+        os.replace(temporary, path)  # Readers never see a half-written index
+
+    @classmethod
+    def load(cls, path):
+        """The index saved at ``path``, or None if there is none yet."""
+        import numpy as np
+        from scipy import sparse
+
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as saved:
+            terms, idf = saved['terms'], saved['idf']
+            vectors = sparse.csr_matrix((saved['data'], saved['indices'], saved['indptr']),
+                                        shape=(len(saved['ids']), len(idf)))
+            same_category, terms_per_post = saved['settings']
+            return cls(saved['ids'], saved['categories'], vectors, {term: i for i, term in enumerate(terms.tolist())},
+                       idf, saved['neighbours'], saved['scores'], bool(same_category), int(terms_per_post))
+
+
+@contextlib.contextmanager
+def _locked(path):
+    """Serialize builds and updates of the index at ``path``, across threads and processes."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.lock', 'w') as lock:
+        if os.name == 'nt':
+            import msvcrt
+            while True:  # LK_LOCK gives up after ten seconds, and a build can take longer
+                try:
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            try:
+                yield
+            finally:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _write(index, positions, batch_size=5000):
+    """Replace the blog_related rows of the posts at ``positions`` with their neighbours in ``index``."""
+    positions = list(positions)
+    per_batch = max(1, batch_size // index.neighbours.shape[1])
+    for start in range(0, len(positions), per_batch):
+        rows = [{'blog_id': int(index.ids[position]), 'rank': rank, 'related_id': int(related_id),
+                 'score': float(score)}
+                for position in positions[start:start + per_batch]
+                for rank, (related_id, score) in enumerate(zip(index.neighbours[position], index.scores[position]))
+                if related_id >= 0]
+        if rows:
+            db.session.execute(db.insert(BlogRelated), rows)
+
+
+def build(same_category=None, terms_per_post=None, chunk_size=1000):
+    """Compute the related posts of every published post and save the index.
+
+    Returns ``{'posts', 'terms', 'rows', 'seconds': {phase: seconds}, 'index_bytes'}``.
+    """
+    import numpy as np
+
+    config = current_app.config
+    same_category = config['RELATED_SAME_CATEGORY'] if same_category is None else same_category
+    terms_per_post = terms_per_post or config['RELATED_TERMS_PER_POST']
+    path = config['RELATED_INDEX_PATH']
+    seconds = {}
+
+    with _locked(path):
+        started = time.perf_counter()
+        ids, categories, vocabulary = [], [], {}
+
+        def documents():
+            for row in _published():
+                ids.append(row.id)
+                categories.append(row.category)
+                yield term_counts(row.title, row.summary, row.content)
+
+        # Only the counts are kept, as compact arrays, not the posts or their tokens
+        counts = count_matrix(documents(), vocabulary, grow=True)
+        seconds['tokenize'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        document_frequency = np.bincount(counts.indices, minlength=len(vocabulary))
+        idf = (np.log((1 + len(ids)) / (1 + document_frequency)) + 1).astype(np.float32)
+        idf[document_frequency < 2] = 0
+        empty = np.empty((0, config['RELATED_POSTS']))
+        index = RelatedIndex(ids, categories, None, vocabulary, idf, empty.astype(np.int64),
+                             empty.astype(np.float32), same_category, terms_per_post)
+        index.vectors = index.vectorize(counts)
+        del counts
+        seconds['vectorize'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index.neighbours, index.scores = index.nearest(np.arange(index.size), config['RELATED_POSTS'], chunk_size)
+        seconds['similarity'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        db.session.execute(db.delete(BlogRelated))
+        _write(index, range(index.size))
+        db.session.commit()
+        index.save(path)
+        seconds['store'] = time.perf_counter() - started
+
+    return {'posts': index.size, 'terms': int((idf > 0).sum()), 'rows': int((index.neighbours >= 0).sum()),
+            'seconds': {phase: round(value, 2) for phase, value in seconds.items()}, 'index_bytes': index.nbytes}
+
+
+def update(blog_ids):
+    """Bring the related posts up to date after ``blog_ids`` were published, edited, unpublished or deleted.
+
+    Recomputes those posts, the posts that listed them and the posts they
+    now rank in, and commits. Returns the ids of the posts whose related
+    posts changed, so their cached pages can be dropped. Does nothing
+    until ``flask related build`` has saved an index.
+    """
+    import numpy as np
+
+    path = current_app.config['RELATED_INDEX_PATH']
+    with _locked(path):
+        index = RelatedIndex.load(path)
+        if index is None:
+            logger.info('No related posts index at %s yet; run `flask related build`', path)
+            return []
+        blog_ids = set(blog_ids)
+        rows = _published(blog_ids).all()
+        # Posts that listed a changed post: its similarity changed, or it is gone
+        affected = set(index.ids[np.isin(index.neighbours, list(blog_ids)).any(axis=1)].tolist())
+        index.remove(blog_ids)
+        if rows:
+            vectors = index.vectorize(count_matrix(
+                (term_counts(row.title, row.summary, row.content) for row in rows), index.vocabulary))
+            # Posts whose last neighbour is less similar than one of the changed posts now
+            similarities = (index.vectors @ vectors.T).toarray()
+            if index.same_category:
+                similarities[index.categories[:, None] != np.array([row.category for row in rows])[None, :]] = 0
+            threshold = np.where(index.neighbours[:, -1] >= 0, index.scores[:, -1], 0)
+            affected.update(index.ids[(similarities > threshold[:, None]).any(axis=1)].tolist())
+            index.append([row.id for row in rows], [row.category for row in rows], vectors)
+            affected.update(row.id for row in rows)
+        affected -= blog_ids - {row.id for row in rows}
+
+        positions = index.positions(affected)
+        neighbours, scores = index.nearest(positions, index.neighbours.shape[1])
+        # Pages that list a changed post show its old title, even if the ranking stayed the same
+        changed = positions[(neighbours != index.neighbours[positions]).any(axis=1)
+                            | np.isin(neighbours, list(blog_ids)).any(axis=1)]
+        index.neighbours[positions], index.scores[positions] = neighbours, scores
+
+        db.session.execute(db.delete(BlogRelated).where(
+            db.or_(BlogRelated.blog_id.in_(affected | blog_ids), BlogRelated.related_id.in_(blog_ids))))
+        _write(index, positions)
+        db.session.commit()
+        index.save(path)
+    return index.ids[changed].tolist()
+
+
+@related_cli.command('build')
+@click.option('--same-category/--any-category', default=None,
+              help='Only relate posts in the same category. Defaults to RELATED_SAME_CATEGORY.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Posts compared with all others at once.')
+def build_command(same_category, chunk_size):
+    """Compute the related posts of every published post from scratch."""
+    stats = build(same_category=same_category, chunk_size=chunk_size)
+    click.echo(f"Related {stats['posts']} post(s) over {stats['terms']} term(s) in "
+               f"{math.fsum(stats['seconds'].values()):.1f}s: {stats['rows']} row(s) written.")
+    if stats['posts']:
+        from app import page_cache
+        page_cache.invalidate_all_blogs()
@@ -0,0 +1,92 @@
+"""Write-time rendering of blog content.
+
+Posts are written as plain text, optionally with a few HTML tags. Whenever
+Blog.content is assigned, it is sanitized with bleach and formatted once:
+blank lines start paragraphs, single line breaks become <br> and URLs become
+links. The HTML is stored in Blog.content_html with a plain-text excerpt and
+a word count, so pages serve it as it is. Rows saved before this existed
+are rendered by ``flask content backfill``.
+"""
+import html
+import re
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event
+
+from models import db, Blog
+
+ALLOWED_TAGS = {'a', 'b', 'blockquote', 'br', 'code', 'em', 'h3', 'h4', 'i', 'li', 'ol', 'p', 'pre', 'strong', 'ul'}
+ALLOWED_ATTRIBUTES = {'a': ['href', 'title']}
+ALLOWED_PROTOCOLS = {'http', 'https', 'mailto'}
+EXCERPT_CHARS = 300  # The size of Blog.excerpt
+
+# A paragraph containing one of these is the author's own markup and is left as written
+_BLOCK_TAG = re.compile(r'<(blockquote|h3|h4|li|ol|p|pre|ul)\b', re.I)
+_TAG = re.compile(r'<[^>]*>')
+
+content_cli = AppGroup('content', help='Maintain the pre-rendered blog content.')
+
+
+def render(text):
+    """``(html, excerpt, word_count)`` for the blog content ``text``."""
+    import bleach  # Only needed when content is written, and slow to import
+
+    cleaned = bleach.clean(text.replace('\r\n', '\n'), tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+                           protocols=ALLOWED_PROTOCOLS, strip=True)
+    paragraphs = []
+    for paragraph in re.split(r'\n[ \t]*\n', cleaned.strip()):
+        if _BLOCK_TAG.search(paragraph):
+            paragraphs.append(paragraph)
+        elif paragraph:
+            paragraphs.append('<p>' + paragraph.strip().replace('\n', '<br>\n') + '</p>')
+    content_html = bleach.linkify('\n'.join(paragraphs), skip_tags={'pre', 'code'}, parse_email=False)
+
+    # The HTML is sanitized, so every '<' left in it starts a tag
+    words = html.unescape(_TAG.sub(' ', content_html)).split()
+    return content_html, excerpt(' '.join(words)), len(words)
+
+
+def excerpt(plain_text, limit=EXCERPT_CHARS):
+    if len(plain_text) <= limit:
+        return plain_text
+    return plain_text[:limit - 1].rsplit(' ', 1)[0] + '…'
+
+
+def rendered_columns(text):
+    """The pre-rendered columns for ``text``, as values for an INSERT or UPDATE."""
+    return dict(zip(('content_html', 'excerpt', 'word_count'), render(text)))
+
+
+@event.listens_for(Blog.content, 'set')
+def _render_content(blog, value, old_value, initiator):
+    if value == old_value and blog.content_html is not None:
+        return  # e.g. an edit that left the content alone
+    if value is None:
+        blog.content_html = blog.excerpt = blog.word_count = None
+    else:
+        blog.content_html, blog.excerpt, blog.word_count = render(value)
+
+
+@content_cli.command('backfill')
+@click.option('--all', 'rerender', is_flag=True, help='Render every post again, e.g. after changing the allowed tags.')
+@click.option('--batch-size', default=500, show_default=True, help='Posts rendered per UPDATE and transaction.')
+def backfill_command(rerender, batch_size):
+    """Render the content of posts saved before it was pre-rendered."""
+    last_id = 0
+    rendered = 0
+    while True:
+        query = db.select(Blog.id, Blog.content).where(Blog.id > last_id).order_by(Blog.id).limit(batch_size)
+        if not rerender:
+            query = query.where(Blog.content_html.is_(None))
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        db.session.execute(db.update(Blog), [{'id': row.id, **rendered_columns(row.content)} for row in rows])
+        db.session.commit()
+        last_id = rows[-1].id
+        rendered += len(rows)
+    click.echo(f'Rendered {rendered} post(s).')
+    if rendered:
+        from app import page_cache
+        page_cache.invalidate_all_blogs()
@@ -0,0 +1,147 @@
+"""Autosaved working copies of blog content.
+
+While a post is being edited, the browser sends each change as a patch
+against the revision it last saved, and only the patch is stored, so
+requests and writes grow with the edit rather than with the article. Every
+AUTOSAVE_SNAPSHOT_EVERY revisions, or once the patches since the last
+snapshot add up to more than the text itself, the full text is stored
+instead, which bounds the work needed to rebuild the current text. The
+blog row itself only changes when the author saves the form.
+"""
+import os
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db, BlogRevision
+
+
+class RevisionConflict(Exception):
+    """Raised when a save is based on a revision that is no longer the latest."""
+
+    def __init__(self, revision):
+        super().__init__(f'the latest revision is {revision}')
+        self.revision = revision
+
+
+class InvalidPatch(ValueError):
+    """Raised when a patch is malformed or does not fit the text it is applied to."""
+
+
+def normalize(text):
+    """Line breaks as browsers report a textarea's value, so patch offsets agree."""
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def apply_patch(text, patch):
+    """Return ``text`` with ``patch`` applied.
+
+    A patch is a list of ``[start, end, replacement]`` edits, each replacing
+    ``text[start:end]``. Offsets count characters of the original text, and
+    the edits must be in order and must not overlap.
+    """
+    if not isinstance(patch, list) or not patch:
+        raise InvalidPatch('a patch is a non-empty list of [start, end, replacement] edits')
+    parts = []
+    position = 0
+    for edit in patch:
+        if (not isinstance(edit, list) or len(edit) != 3
+                or not all(type(offset) is int for offset in edit[:2]) or not isinstance(edit[2], str)):
+            raise InvalidPatch(f'malformed edit {edit!r}')
+        start, end, replacement = edit
+        if not position <= start <= end <= len(text):
+            raise InvalidPatch(f'edit {start}:{end} is out of order or past the end of the text')
+        parts += [text[position:start], replacement]
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def diff(before, after):
+    """A one-edit patch turning ``before`` into ``after``: whatever lies between their common prefix and suffix."""
+    prefix = len(os.path.commonprefix([before, after]))
+    suffix = min(len(os.path.commonprefix([before[::-1], after[::-1]])), min(len(before), len(after)) - prefix)
+    return [[prefix, len(before) - suffix, after[prefix:len(after) - suffix]]]
+
+
+def patch_size(patch):
+    return sum(len(replacement) + 1 for _, _, replacement in patch)
+
+
+def _chain(blog_id):
+    """The rows from the latest snapshot on, oldest first."""
+    latest_snapshot = (db.select(db.func.max(BlogRevision.revision))
+                       .where(BlogRevision.blog_id == blog_id, BlogRevision.snapshot.isnot(None))
+                       .scalar_subquery())
+    return db.session.execute(
+        db.select(BlogRevision.revision, BlogRevision.snapshot, BlogRevision.patch)
+        .where(BlogRevision.blog_id == blog_id, BlogRevision.revision >= latest_snapshot)
+        .order_by(BlogRevision.revision)).all()
+
+
+def working_copy(blog):
+    """``(revision, text)`` of the latest autosave, or ``(0, blog.content)`` if there is none."""
+    revision, text, _ = _working_copy(blog)
+    return revision, text
+
+
+def _working_copy(blog):
+    rows = _chain(blog.id)
+    if not rows:
+        return 0, normalize(blog.content), []
+    text = rows[0].snapshot
+    for row in rows[1:]:
+        text = apply_patch(text, row.patch)
+    return rows[-1].revision, text, rows[1:]
+
+
+def latest_revision(blog_id):
+    return db.session.execute(db.select(db.func.max(BlogRevision.revision))
+                              .where(BlogRevision.blog_id == blog_id)).scalar() or 0
+
+
+def save(blog, base_revision, patch=None, text=None):
+    """Store a new revision made from ``base_revision``, by ``patch`` or as the full ``text``.
+
+    Either way only the change is stored, unless a snapshot is due.
+    Returns ``(revision, text)``. Raises RevisionConflict if ``base_revision``
+    is not the latest revision, including when another request stores the
+    same revision first, and InvalidPatch if ``patch`` does not apply. The
+    caller commits.
+    """
+    revision, current, patches = _working_copy(blog)
+    if base_revision != revision:
+        raise RevisionConflict(revision)
+    if text is None:
+        text = apply_patch(current, patch)
+    else:
+        text = normalize(text)
+        patch = diff(current, text)
+
+    config = current_app.config
+    snapshot = (not revision or len(patches) + 1 >= config['AUTOSAVE_SNAPSHOT_EVERY']
+                or sum(patch_size(row.patch) for row in patches) + patch_size(patch) > len(text))
+    row = BlogRevision(blog_id=blog.id, revision=revision + 1,
+                       snapshot=text if snapshot else None, patch=None if snapshot else patch)
+    try:
+        with db.session.begin_nested():
+            db.session.add(row)
+    except IntegrityError:
+        raise RevisionConflict(latest_revision(blog.id)) from None
+
+    keep = config['AUTOSAVE_KEEP_REVISIONS']
+    if snapshot and keep:
+        # Drop whole chains older than the newest snapshot that still leaves `keep` revisions
+        cutoff = (db.select(db.func.max(BlogRevision.revision))
+                  .where(BlogRevision.blog_id == blog.id, BlogRevision.snapshot.isnot(None),
+                         BlogRevision.revision <= row.revision - keep)
+                  .scalar_subquery())
+        db.session.execute(db.delete(BlogRevision)
+                           .where(BlogRevision.blog_id == blog.id, BlogRevision.revision < cutoff))
+    return row.revision, text
+
+
+def delete_for(blog_ids):
+    """Delete the revisions of ``blog_ids`` in one statement, for databases that do not enforce the cascade."""
+    if blog_ids:
+        db.session.execute(db.delete(BlogRevision).where(BlogRevision.blog_id.in_(blog_ids)))
@@ -0,0 +1,440 @@
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from markupsafe import Markup, escape
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from models import db, Blog, SearchChange
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Field weights: a match in the title counts more than one in the body
+FIELD_WEIGHTS = {'title': 10.0, 'summary': 5.0, 'content': 1.0}
+
+# Sentinels wrapped around matches before escaping, turned into <mark> afterwards
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def highlight(marked_text):
+    """Escape a snippet containing MARK_START/MARK_END sentinels and turn them into <mark> tags."""
+    escaped = str(escape(marked_text))
+    return Markup(escaped.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def make_snippet(text, terms, width=30):
+    """Return ~``width`` words of ``text`` around the first match of ``terms``, with matches marked."""
+    words = text.split()
+    terms = set(terms)
+    first = next((i for i, word in enumerate(words) if set(tokenize(word)) & terms), 0)
+    start = max(0, first - width // 3)
+    window = words[start:start + width]
+    marked = ' '.join(f'{MARK_START}{word}{MARK_END}' if set(tokenize(word)) & terms else word for word in window)
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if start + width < len(words) else ''
+    return highlight(prefix + marked + suffix)
+
+
+class SearchResult:
+    __slots__ = ('blog_id', 'score', 'snippet')
+
+    def __init__(self, blog_id, score, snippet=None):
+        self.blog_id = blog_id
+        self.score = score
+        self.snippet = snippet
+
+
+class FTS5Backend:
+    """Full-text index in an SQLite FTS5 virtual table, ranked with FTS5's bm25().
+
+    The table is created by the migrations; updates are written in the
+    transaction of the blog change they index.
+    """
+
+    name = 'fts5'
+
+    @staticmethod
+    def available(engine):
+        """Whether SQLite has FTS5 and the blog_fts table was created by the migrations."""
+        if engine.dialect.name != 'sqlite':
+            return False
+        with engine.connect() as connection:
+            options = connection.exec_driver_sql('PRAGMA compile_options').scalars().all()
+            exists = connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'blog_fts'").first()
+        return 'ENABLE_FTS5' in options and exists is not None
+
+    def rebuild(self):
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS blog_fts USING fts5(title, summary, content, tokenize = 'unicode61')"))
+        db.session.execute(text('DELETE FROM blog_fts'))
+        db.session.execute(text(
+            'INSERT INTO blog_fts (rowid, title, summary, content) '
+            'SELECT id, title, summary, content FROM blog WHERE draft = 0'))
+        db.session.commit()
+
+    def update(self, blog):
+        db.session.execute(text('DELETE FROM blog_fts WHERE rowid = :id'), {'id': blog.id})
+        if not blog.draft:
+            db.session.execute(
+                text('INSERT INTO blog_fts (rowid, title, summary, content) VALUES (:id, :title, :summary, :content)'),
+                {'id': blog.id, 'title': blog.title, 'summary': blog.summary, 'content': blog.content})
+
+    def remove(self, blog_id):
+        db.session.execute(text('DELETE FROM blog_fts WHERE rowid = :id'), {'id': blog_id})
+
+    def search(self, terms, category=None, limit=20, offset=0):
+        # Quote every term so user input can never be parsed as FTS5 query syntax
+        match = ' '.join(f'"{term}"' for term in terms)
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS.values())
+        sql = (f"SELECT blog_fts.rowid, bm25(blog_fts, {weights}) AS score, "
+               f"snippet(blog_fts, -1, :start, :end, '…', 30) AS snippet "
+               f"FROM blog_fts ")
+        params = {'match': match, 'start': MARK_START, 'end': MARK_END, 'limit': limit, 'offset': offset}
+        if category:
+            sql += 'JOIN blog ON blog.id = blog_fts.rowid WHERE blog_fts MATCH :match AND blog.category = :category '
+            params['category'] = category
+        else:
+            sql += 'WHERE blog_fts MATCH :match '
+        sql += 'ORDER BY score LIMIT :limit OFFSET :offset'
+        rows = db.session.execute(text(sql), params).all()
+        # bm25() is lower-is-better; flip the sign so higher scores rank first everywhere
+        return [SearchResult(row.rowid, -row.score, highlight(row.snippet)) for row in rows]
+
+
+class InvertedIndex:
+    """Pure-Python BM25 inverted index, used when FTS5 is not available.
+
+    Each term maps to two parallel ``array('I')`` postings lists, sorted
+    doc ids and field-weighted term frequencies, so the index costs a few
+    bytes per posting instead of a Python object. Article text itself is not
+    kept; snippets are cut from the rows fetched for the results page.
+    """
+
+    name = 'memory'
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_terms = {}
+        self.doc_length = {}
+        self.doc_category = {}
+        self.total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_length)
+
+    def add(self, doc_id, category, fields):
+        """Index a document given as ``{field: text}``, replacing any previous version."""
+        frequencies = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(fields.get(field)):
+                term = sys.intern(term)  # One string object per distinct term across the index
+                frequencies[term] = frequencies.get(term, 0) + weight
+                length += weight
+        with self._lock:
+            self.remove(doc_id)
+            for term, frequency in frequencies.items():
+                ids, tfs = self.postings.setdefault(term, (array('I'), array('I')))
+                if not ids or ids[-1] < doc_id:  # Rebuilds add documents in id order
+                    ids.append(doc_id)
+                    tfs.append(int(round(frequency)))
+                    continue
+                position = bisect_left(ids, doc_id)
+                ids.insert(position, doc_id)
+                tfs.insert(position, int(round(frequency)))
+            self.doc_terms[doc_id] = tuple(frequencies)
+            self.doc_length[doc_id] = length
+            self.doc_category[doc_id] = category
+            self.total_length += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            terms = self.doc_terms.pop(doc_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                ids, tfs = self.postings[term]
+                position = bisect_left(ids, doc_id)
+                if position < len(ids) and ids[position] == doc_id:
+                    del ids[position]
+                    del tfs[position]
+                if not ids:
+                    del self.postings[term]
+            self.total_length -= self.doc_length.pop(doc_id)
+            self.doc_category.pop(doc_id, None)
+
+    def search(self, terms, category=None, limit=20, offset=0):
+        with self._lock:
+            lists = [self.postings.get(term) for term in set(terms)]
+            if not lists or any(entry is None for entry in lists):
+                return []  # Every term must match, as with FTS5
+            document_count = len(self.doc_length)
+            average_length = self.total_length / document_count
+            # Walk the rarest term first and keep only documents that contain all terms
+            lists.sort(key=lambda entry: len(entry[0]))
+            scores = None
+            for ids, tfs in lists:
+                idf = math.log(1 + (document_count - len(ids) + 0.5) / (len(ids) + 0.5))
+                term_scores = {}
+                for doc_id, tf in zip(ids, tfs):
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_length[doc_id] / average_length)
+                    term_scores[doc_id] = idf * tf * (self.k1 + 1) / (tf + norm)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {doc_id: scores[doc_id] + score for doc_id, score in term_scores.items()}
+            if category:
+                scores = {doc_id: score for doc_id, score in scores.items()
+                          if self.doc_category.get(doc_id) == category}
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[offset:offset + limit]
+        return [SearchResult(doc_id, score) for doc_id, score in ranked]
+
+
+class SearchUnavailable(Exception):
+    """Raised when this worker's search index is still being built; the request should be retried later."""
+
+    def __init__(self, retry_after=5):
+        super().__init__('The search index is not ready yet')
+        self.retry_after = retry_after
+
+
+class SearchIndex:
+    """Search over published blogs, backed by FTS5 when SQLite provides it.
+
+    The pure-Python fallback lives in each worker's memory and is maintained
+    by a background thread, started by the worker's first search. The thread
+    builds the index, then every ``sync_interval`` seconds re-reads the posts
+    listed in the search_change table since its last look, which every
+    worker (and ``flask data import``) appends to when it changes a post.
+    Requests never build the index; until the first build is done they get
+    SearchUnavailable.
+    """
+
+    # How long a search waits for the worker's first build
+    READY_TIMEOUT = 10
+    # How long search_change rows are kept
+    CHANGE_RETENTION = timedelta(days=1)
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.sync_interval = 5
+        self.app = None
+        self._backend_name = 'auto'
+        self._use_fts5 = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._last_change = 0
+        self._pruned_at = None
+        self._thread_pid = None
+        self._thread_lock = threading.Lock()
+        self.cli = AppGroup('search', help='Manage the blog search index.')
+        self._register_commands()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_BACKEND', 'auto')
+        app.config.setdefault('SEARCH_SYNC_INTERVAL', 5)
+        self.sync_interval = app.config['SEARCH_SYNC_INTERVAL']
+        self._backend_name = app.config['SEARCH_BACKEND']
+        self.backend = self._use_fts5 = None
+        self._last_change = 0
+        self._ready.clear()
+        self.app = app
+        app.cli.add_command(self.cli)
+        if not event.contains(Session, 'after_commit', self._apply_committed):
+            event.listen(Session, 'after_commit', self._apply_committed)
+            event.listen(Session, 'after_rollback', self._discard_changes)
+
+    def _uses_fts5(self):
+        if self._use_fts5 is None:
+            with self._lock:
+                if self._use_fts5 is None:
+                    use_fts = self._backend_name == 'fts5' or (
+                        self._backend_name == 'auto' and FTS5Backend.available(db.engine))
+                    if use_fts:
+                        self.backend = FTS5Backend()
+                    self._use_fts5 = use_fts
+        return self._use_fts5
+
+    def _ensure_thread(self):
+        if self._thread_pid == os.getpid() or self.app is None:
+            return
+        with self._thread_lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._ready = threading.Event()  # A forked worker builds its own index
+            threading.Thread(target=self._run, name='search-index', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.sync()
+            except Exception:
+                logger.exception('Updating the search index failed')
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+
+    def sync(self):
+        """Build the memory index if needed, then apply the changes logged since the last sync."""
+        changes = db.session.execute(
+            db.select(SearchChange.id, SearchChange.blog_id)
+            .where(SearchChange.id > self._last_change).order_by(SearchChange.id)).all()
+        if self.backend is None or any(change.blog_id is None for change in changes):
+            self._build()
+            return
+        if changes:
+            self._apply({change.blog_id for change in changes})
+            self._last_change = changes[-1].id
+        self._ready.set()  # Also in a worker forked with the index already built
+        if self._pruned_at is None or time.monotonic() - self._pruned_at > 3600:
+            db.session.execute(db.delete(SearchChange).where(
+                SearchChange.created_at < datetime.utcnow() - self.CHANGE_RETENTION))
+            db.session.commit()
+            self._pruned_at = time.monotonic()
+
+    def _build(self):
+        # Changes logged from here on are replayed by the next sync, including
+        # the ones made while the new index is built and the old one still serves
+        last_change = db.session.scalar(db.select(db.func.max(SearchChange.id))) or 0
+        fresh = InvertedIndex()
+        rows = db.session.execute(
+            db.select(Blog.id, Blog.category, Blog.title, Blog.summary, Blog.content)
+            .where(Blog.draft == False)  # noqa: E712
+            .execution_options(yield_per=1000))
+        for row in rows:
+            fresh.add(row.id, row.category, {'title': row.title, 'summary': row.summary, 'content': row.content})
+        db.session.rollback()  # Ends the read transaction, so the next sync sees newer changes
+        self.backend = fresh
+        self._last_change = last_change
+        self._ready.set()
+
+    def _apply(self, blog_ids, batch_size=500):
+        blog_ids = sorted(blog_ids)
+        for start in range(0, len(blog_ids), batch_size):
+            batch = blog_ids[start:start + batch_size]
+            rows = db.session.execute(
+                db.select(Blog.id, Blog.category, Blog.title, Blog.summary, Blog.content)
+                .where(Blog.id.in_(batch), Blog.draft == False)).all()  # noqa: E712
+            for row in rows:
+                self.backend.add(row.id, row.category,
+                                 {'title': row.title, 'summary': row.summary, 'content': row.content})
+            for blog_id in set(batch) - {row.id for row in rows}:  # Deleted or unpublished
+                self.backend.remove(blog_id)
+        db.session.rollback()
+
+    def _log_change(self, blog_id, fields=None):
+        """Add a search_change row to the current transaction.
+
+        ``fields`` (``None`` to remove the blog) is applied to this worker's
+        index once the transaction commits, so its searches see the change at
+        once; a rollback drops it along with the row.
+        """
+        db.session.add(SearchChange(blog_id=blog_id))
+        if blog_id is not None:
+            db.session.info.setdefault(('search_changes', id(self)), []).append((blog_id, fields))
+
+    def _apply_committed(self, session):
+        if session.in_nested_transaction():  # A savepoint was released, not the transaction
+            return
+        changes = session.info.pop(('search_changes', id(self)), None)
+        if not changes or not self._ready.is_set():
+            return
+        for blog_id, fields in changes:
+            if fields is None:
+                self.backend.remove(blog_id)
+            else:
+                self.backend.add(blog_id, fields.pop('category'), fields)
+
+    def _discard_changes(self, session):
+        if not session.in_nested_transaction():
+            session.info.pop(('search_changes', id(self)), None)
+
+    def rebuild(self):
+        """Rebuild the index: FTS5 at once, memory indexes in every worker on their next sync."""
+        if self._uses_fts5():
+            self.backend.rebuild()
+            return
+        self._log_change(None)
+        db.session.commit()
+        self._wake.set()
+
+    def update(self, blog):
+        """Index a blog that was created or edited, in the transaction that saves it; drafts are removed.
+
+        Call before committing: the change is written with the blog, so it
+        cannot be lost between two commits.
+        """
+        if self._uses_fts5():
+            self.backend.update(blog)
+        elif blog.draft:
+            self._log_change(blog.id)
+        else:
+            self._log_change(blog.id, {'category': blog.category, 'title': blog.title, 'summary': blog.summary,
+                                       'content': blog.content})
+
+    def remove(self, blog_id):
+        """Drop a blog from the index, in the transaction that deletes or unpublishes it."""
+        if self._uses_fts5():
+            self.backend.remove(blog_id)
+        else:
+            self._log_change(blog_id)
+
+    def search(self, query, category=None, limit=20, offset=0):
+        """Return ranked SearchResults for published blogs matching every word of ``query``."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        if self._uses_fts5():
+            return self.backend.search(terms, category=category, limit=limit, offset=offset)
+        self._ensure_thread()
+        if not self._ready.wait(self.READY_TIMEOUT):
+            raise SearchUnavailable()
+        results = self.backend.search(terms, category=category, limit=limit, offset=offset)
+        if results:
+            contents = dict(db.session.execute(
+                db.select(Blog.id, Blog.content).where(Blog.id.in_([result.blog_id for result in results]))).all())
+            for result in results:
+                result.snippet = make_snippet(contents.get(result.blog_id, ''), terms)
+        return results
+
+    def _register_commands(self):
+        index = self
+
+        @self.cli.command('rebuild')
+        def rebuild():
+            """Rebuild the search index from the blog table."""
+            index.rebuild()
+            if index._uses_fts5():
+                click.echo('Rebuilt the fts5 search index.')
+            else:
+                click.echo('Every worker rebuilds its memory search index within '
+                           f'SEARCH_SYNC_INTERVAL ({index.sync_interval}s).')
+
+
+search_index = SearchIndex()
@@ -0,0 +1,102 @@
+// Autosave the post body while editing. A moment after typing stops, only the
+// changed span is sent, as a patch against the revision the server last stored.
+(function () {
+    var content = document.getElementById('content');
+    var form = content && content.form;
+    if (!form || !form.dataset.autosaveUrl) {
+        return;
+    }
+    var status = document.getElementById('autosave-status');
+    var revisionField = form.elements.revision;
+    var token = form.elements.csrf_token ? form.elements.csrf_token.value : '';
+    var interval = parseInt(form.dataset.autosaveInterval, 10);
+    var saved = content.value;  // The text of revisionField.value on the server
+    var timer = null;
+    var sending = false;
+    var stopped = false;
+
+    function isHighSurrogate(code) { return code >= 0xD800 && code <= 0xDBFF; }
+    function isLowSurrogate(code) { return code >= 0xDC00 && code <= 0xDFFF; }
+
+    // The server counts characters, JavaScript counts UTF-16 units
+    function codePoints(text) {
+        var pairs = text.match(/[\uD800-\uDBFF][\uDC00-\uDFFF]/g);
+        return text.length - (pairs ? pairs.length : 0);
+    }
+
+    // One [start, end, replacement] edit covering everything between the
+    // common prefix and the common suffix of the two texts
+    function diff(before, after) {
+        var limit = Math.min(before.length, after.length);
+        var prefix = 0;
+        while (prefix < limit && before.charCodeAt(prefix) === after.charCodeAt(prefix)) {
+            prefix++;
+        }
+        var suffix = 0;
+        while (suffix < limit - prefix &&
+               before.charCodeAt(before.length - 1 - suffix) === after.charCodeAt(after.length - 1 - suffix)) {
+            suffix++;
+        }
+        if (prefix > 0 && isHighSurrogate(before.charCodeAt(prefix - 1))) {
+            prefix--;
+        }
+        if (suffix > 0 && isLowSurrogate(before.charCodeAt(before.length - suffix))) {
+            suffix--;
+        }
+        var start = codePoints(before.slice(0, prefix));
+        var end = start + codePoints(before.slice(prefix, before.length - suffix));
+        return [start, end, after.slice(prefix, after.length - suffix)];
+    }
+
+    function show(message) {
+        status.textContent = message;
+    }
+
+    function save() {
+        timer = null;
+        var text = content.value;
+        if (stopped || text === saved) {
+            return;
+        }
+        if (sending) {
+            schedule();
+            return;
+        }
+        sending = true;
+        show('Saving…');
+        fetch(form.dataset.autosaveUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': token},
+            body: JSON.stringify({revision: parseInt(revisionField.value, 10), patch: [diff(saved, text)]})
+        })
+            .then(function (response) {
+                if (response.status === 409) {
+                    stopped = true;
+                    show('This post was changed in another window. Autosave is paused; reload to get the latest version.');
+                    return;
+                }
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json().then(function (data) {
+                    saved = text;
+                    revisionField.value = data.revision;
+                    show('Draft autosaved at ' + new Date().toLocaleTimeString() + '.');
+                });
+            })
+            .catch(function () { show('Autosave failed; will retry.'); schedule(); })
+            .then(function () { sending = false; });
+    }
+
+    function schedule() {
+        clearTimeout(timer);
+        timer = setTimeout(save, interval);
+    }
+
+    content.addEventListener('input', schedule);
+    form.addEventListener('submit', function () {
+        clearTimeout(timer);
+        stopped = true;
+    });
+})();
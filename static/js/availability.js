@@ -0,0 +1,32 @@
+// Tell the user a username or email is taken as soon as they leave the field,
+// instead of after submitting the whole signup form.
+(function () {
+    var form = document.getElementById('username') && document.getElementById('username').form;
+    if (!form || !form.dataset.availabilityUrl || !window.fetch) {
+        return;
+    }
+
+    function check(input) {
+        var value = input.value;
+        var message = document.getElementById(input.id + '-availability');
+        if (!value || !input.checkValidity()) {
+            message.textContent = '';
+            return;
+        }
+        fetch(form.dataset.availabilityUrl + '?' + encodeURIComponent(input.id) + '=' + encodeURIComponent(value),
+              {credentials: 'same-origin'})
+            .then(function (response) { return response.ok ? response.json() : null; })
+            .then(function (data) {
+                if (!data || input.value !== value) {
+                    return;  // Rate limited, or the field changed meanwhile
+                }
+                message.textContent = data.available[input.id] ? '' : 'This ' + input.id + ' is already taken.';
+            })
+            .catch(function () { message.textContent = ''; });
+    }
+
+    ['username', 'email'].forEach(function (id) {
+        var input = document.getElementById(id);
+        input.addEventListener('change', function () { check(input); });
+    });
+})();
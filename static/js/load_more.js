@@ -0,0 +1,23 @@
+// Append the next page of cards in place instead of navigating away
+(function () {
+    var button = document.getElementById('load-more');
+    if (!button) {
+        return;
+    }
+    button.addEventListener('click', function () {
+        var url = button.dataset.url + '&after=' + encodeURIComponent(button.dataset.next);
+        button.disabled = true;
+        fetch(url, {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                document.getElementById('blog-cards').insertAdjacentHTML('beforeend', data.html);
+                if (data.next_cursor) {
+                    button.dataset.next = data.next_cursor;
+                    button.disabled = false;
+                } else {
+                    button.remove();
+                }
+            })
+            .catch(function () { button.disabled = false; });
+    });
+})();
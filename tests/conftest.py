@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+
+import pytest
+from flask import has_app_context
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from models import db, User, Blog
+
+PASSWORD = 'secret1'
+
+
+def make_app(tmp_path, **config):
+    """Build the application on a SQLite database in ``tmp_path``; ``config`` overrides the test settings."""
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'WTF_CSRF_ENABLED': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'PASSWORD_HASH_WORKERS': 0,
+        'PAGE_CACHE_BACKEND': 'memory',
+        'PAGE_CACHE_DIR': str(tmp_path / 'page_cache'),
+        'PROFILE_DIR': str(tmp_path / 'profiles'),
+        'RELATED_INDEX_PATH': str(tmp_path / 'related_index.npz'),
+        'SEARCH_BACKEND': 'memory',
+        'VIEW_COUNTER_BUFFER': 'off',
+        'ASSETS_USE_MANIFEST': False,
+        **config,
+    })
+
+
+@pytest.fixture
+def app_config():
+    """Settings for the ``app`` fixture; override with ``@pytest.mark.parametrize('app_config', [{...}])``."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    """The application on a fresh SQLite database, with the schema created.
+
+    No app context is left pushed: each test client request gets its own, as
+    in production. Tests that use the database directly push one around that
+    work, or use ``app_ctx``.
+    """
+    app = make_app(tmp_path, **app_config)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def app_ctx(app):
+    """An app context for the whole test, for tests that do not use the test client."""
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@contextmanager
+def _context(app):
+    """The current app context if there is one, so returned rows stay attached to its session."""
+    if has_app_context():
+        yield
+    else:
+        with app.app_context():
+            yield
+
+
+@pytest.fixture
+def make_user(app):
+    """``make_user(username, user_type='Doctor', password=PASSWORD)`` inserts a user and returns it."""
+    def make_user(username, user_type='Doctor', password=PASSWORD):
+        with _context(app):
+            user = User(first_name='First', last_name='Last', username=username, email=f'{username}@example.com',
+                        password=generate_password_hash(password, method='pbkdf2:sha256:1000'),
+                        address_line1='1 Main St', city='City', state='State', pincode='123456',
+                        user_type=user_type)
+            db.session.add(user)
+            db.session.commit()
+            db.session.refresh(user)
+        return user
+    return make_user
+
+
+@pytest.fixture
+def make_blog(app):
+    """``make_blog(author, title=..., category=..., content=..., draft=False)`` inserts a blog and returns it."""
+    def make_blog(author, title='A post', category='Covid19', content='Some words about vaccines.', draft=False):
+        with _context(app):
+            blog = Blog(title=title, category=category, summary='A summary', content=content, draft=draft,
+                        user_id=author.id)
+            db.session.add(blog)
+            db.session.commit()
+            db.session.refresh(blog)
+        return blog
+    return make_blog
+
+
+@pytest.fixture
+def login():
+    """``login(client, username)`` logs ``client`` in with the password every ``make_user`` user has."""
+    def login(client, username):
+        return client.post('/login', data={'username': username, 'password': PASSWORD})
+    return login
@@ -0,0 +1,91 @@
+import gzip
+import json
+
+import pytest
+
+
+@pytest.fixture
+def blogs(make_user, make_blog):
+    """Two published posts and a draft by ``doc``, and a patient ``pat``."""
+    author = make_user('doc')
+    make_user('pat', user_type='Patient')
+    first = make_blog(author, title='First', content='word ' * 400)
+    second = make_blog(author, title='Second', category='Immunization')
+    draft = make_blog(author, title='Draft', draft=True)
+    return first.id, second.id, draft.id
+
+
+def test_requires_login(client):
+    assert client.get('/api/v1/blogs').status_code == 401
+
+
+def test_batch_ids_lists_missing_ones(client, login, blogs):
+    first, second, draft = blogs
+    login(client, 'pat')
+    response = client.get(f'/api/v1/blogs?ids={second},999,{first},{draft},{second}&fields=id,title')
+    assert response.json == {'data': [{'id': second, 'title': 'Second'}, {'id': first, 'title': 'First'}],
+                             'missing': [999, draft]}
+    assert client.get('/api/v1/blogs?ids=1,x').status_code == 400
+    assert client.get('/api/v1/blogs?ids=' + ','.join(map(str, range(101)))).status_code == 400
+
+
+def test_drafts_are_only_visible_to_their_author(client, app, login, blogs):
+    _, _, draft = blogs
+    login(client, 'pat')
+    assert client.get(f'/api/v1/blogs/{draft}').status_code == 404
+    assert client.get('/api/v1/blogs/999').json == {'error': 'Not found.'}
+    author = app.test_client()
+    login(author, 'doc')
+    assert author.get(f'/api/v1/blogs/{draft}').json['data']['title'] == 'Draft'
+
+
+def test_weak_etag_answers_304(client, login, blogs):
+    first, _, _ = blogs
+    login(client, 'pat')
+    response = client.get(f'/api/v1/blogs/{first}')
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    assert client.get(f'/api/v1/blogs/{first}', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/v1/blogs', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_field_selection(client, login, blogs):
+    first, _, _ = blogs
+    login(client, 'pat')
+    item = client.get(f'/api/v1/blogs/{first}?fields=title,author').json['data']
+    assert item == {'title': 'First', 'author': {'id': 1, 'name': 'First Last'}}
+    assert set(client.get('/api/v1/blogs').json['data'][0]) == {'id', 'title', 'category', 'summary', 'image',
+                                                                'date_posted', 'author'}
+    response = client.get('/api/v1/blogs?fields=title,password')
+    assert response.status_code == 400 and 'password' in response.json['error']
+
+
+def test_list_is_paginated_with_cursors(client, login, blogs):
+    first, second, _ = blogs
+    login(client, 'pat')
+    page = client.get('/api/v1/blogs?limit=1&fields=id').json
+    assert page['data'] == [{'id': second}]
+    page = client.get(f'/api/v1/blogs?limit=1&fields=id&after={page["next_cursor"]}').json
+    assert page['data'] == [{'id': first}] and page['next_cursor'] is None
+    assert client.get('/api/v1/blogs?after=not-a-cursor').json == {'error': 'Invalid cursor.'}
+
+
+def test_export_streams_ndjson_gzipped(client, login, blogs):
+    first, second, _ = blogs
+    login(client, 'pat')
+    response = client.get('/api/v1/blogs/export?fields=id,title', headers={'Accept-Encoding': 'gzip'})
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [{'id': second, 'title': 'Second'}, {'id': first, 'title': 'First'}]
+
+
+def test_large_responses_are_gzipped(client, login, blogs):
+    first, _, _ = blogs
+    login(client, 'pat')
+    response = client.get(f'/api/v1/blogs/{first}?fields=content', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.data))['data']['content'].startswith('word word')
+    small = client.get(f'/api/v1/blogs/{first}?fields=id', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
@@ -0,0 +1,83 @@
+import hashlib
+
+import pytest
+
+import assets
+from assets import VENDOR, load_digests, save_digests
+
+CSS = 'vendor/bootstrap-4.0.0.min.css'
+
+
+@pytest.fixture
+def vendor(app, tmp_path, monkeypatch):
+    """Run `flask assets vendor` into ``tmp_path/static`` with the CDN replaced by ``downloads``."""
+    downloads = {url: f'/* {name} */'.encode() for name, url in VENDOR.items()}
+    monkeypatch.setattr(assets, 'fetch', lambda url: downloads[url])
+    monkeypatch.setattr(assets, 'VENDOR_DIGESTS', str(tmp_path / 'vendor.sha256'))
+    app.static_folder = str(tmp_path / 'static')
+
+    def run(*args):
+        return app.test_cli_runner().invoke(args=['assets', 'vendor', *args])
+    run.downloads = downloads
+    return run
+
+
+def test_pinned_downloads_are_written(vendor, tmp_path):
+    save_digests(assets.VENDOR_DIGESTS, {name: hashlib.sha256(vendor.downloads[url]).hexdigest()
+                                         for name, url in VENDOR.items()})
+    result = vendor()
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / 'static' / CSS).read_bytes() == vendor.downloads[VENDOR[CSS]]
+
+
+def test_mismatched_and_unpinned_downloads_are_refused(vendor, tmp_path):
+    assert vendor('--pin').exit_code == 0
+    digests = load_digests(assets.VENDOR_DIGESTS)
+    assert set(digests) == set(VENDOR)
+    originals = {name: (tmp_path / 'static' / name).read_bytes() for name in VENDOR}
+
+    vendor.downloads[VENDOR[CSS]] = b'/* tampered */'
+    del digests['vendor/popper-2.11.6.min.js']
+    save_digests(assets.VENDOR_DIGESTS, digests)
+    result = vendor('--force')
+    assert result.exit_code == 1
+    assert f'{CSS}: SHA-256 {hashlib.sha256(b"/* tampered */").hexdigest()}' in result.output
+    assert 'vendor/popper-2.11.6.min.js: no digest' in result.output
+    assert (tmp_path / 'static' / CSS).read_bytes() == originals[CSS]
+
+
+def test_load_digests_reads_sha256sum_output(tmp_path):
+    path = tmp_path / 'vendor.sha256'
+    path.write_text('# comment\n\n' + 'AB' * 32 + ' *vendor/a.js\n' + 'cd' * 32 + '  vendor/b.css  # note\n')
+    assert load_digests(str(path)) == {'vendor/a.js': 'ab' * 32, 'vendor/b.css': 'cd' * 32}
+
+
+def test_minify_js_leaves_literals_alone():
+    script = '\n'.join([
+        '// A comment',
+        'var url = "http://example.com";  // Trailing comment',
+        'var text = `first',
+        '    // inside the template',
+        '    ${ {a: 1}.a + `nested ${"}"}` } end`;',
+        'var slashes = /\\/\\//g, half = 10 / 2;  /* block',
+        'comment */ var quote = /\'/.test("\'");',
+    ])
+    assert assets.minify_js(script) == '\n'.join([
+        'var url = "http://example.com";',
+        'var text = `first',
+        '    // inside the template',
+        '    ${ {a: 1}.a + `nested ${"}"}` } end`;',
+        'var slashes = /\\/\\//g, half = 10 / 2;',
+        'var quote = /\'/.test("\'");',
+    ]) + '\n'
+
+
+def test_minify_js_leaves_scripts_it_cannot_read_alone():
+    assert assets.minify_js('var a = `open;\n  // b\n') == 'var a = `open;\n  // b\n'
+
+
+def test_image_urls_are_fingerprinted(client, login, make_user, monkeypatch):
+    monkeypatch.setattr(assets.assets, 'manifest', {'images/default_profile_pic.png': 'dist/images/pic.0123.png'})
+    make_user('doc')
+    login(client, 'doc')
+    assert b'/static/dist/images/pic.0123.png' in client.get('/dashboard').data
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from app import availability_index
+from availability import BloomFilter, fold
+from models import db, User
+
+
+def wait_for_filters(timeout=5):
+    deadline = time.monotonic() + timeout
+    while availability_index.filters is None or availability_index._rebuilding is not None:
+        assert time.monotonic() < deadline, 'the availability filters were not built'
+        time.sleep(0.01)
+
+
+def test_bloom_filter_never_misses_an_added_value():
+    bloom = BloomFilter(1000)
+    values = [f'user{i}' for i in range(1000)]
+    for value in values:
+        bloom.add(value)
+    assert all(value in bloom for value in values)
+    assert sum(f'free{i}' in bloom for i in range(10000)) < 300
+
+
+def test_fold_matches_case_and_accent_insensitive_collations():
+    assert fold('José ') == fold('JOSE') == fold('jose')
+    assert fold('Straße') == fold('STRASSE')
+
+
+def test_first_lookup_is_answered_by_the_database_and_builds_in_the_background(app_ctx, make_user):
+    make_user('alice')
+    assert availability_index.filters is None
+    assert availability_index.is_taken('username', 'alice')
+    assert not availability_index.is_taken('username', 'bob')
+    wait_for_filters()
+    lookups = dict(availability_index.lookups)
+    assert not availability_index.is_taken('username', 'bob')
+    assert availability_index.lookups['filter'] == lookups['filter'] + 1
+
+
+def test_case_variants_are_checked_in_the_database(app_ctx, make_user):
+    make_user('Alice')
+    availability_index.rebuild()
+    lookups = dict(availability_index.lookups)
+    availability_index.is_taken('username', 'ALICE')
+    assert availability_index.lookups['database'] == lookups['database'] + 1
+
+
+def test_stale_filters_keep_answering_while_rebuilt(app_ctx, make_user, monkeypatch):
+    make_user('alice')
+    availability_index.rebuild()
+    filters = availability_index.filters
+    make_user('bob')
+    monkeypatch.setattr(availability_index, 'refresh_interval', 0)
+    assert availability_index._get_filters() is filters
+    monkeypatch.setattr(availability_index, 'refresh_interval', 300)
+    wait_for_filters()
+    assert availability_index.filters is not filters
+    assert fold('bob') in availability_index.filters['username']
+
+
+def test_signup_during_a_rebuild_is_kept(app_ctx):
+    availability_index.rebuild()
+    availability_index._added_during_rebuild = []  # As if a rebuild had started
+    availability_index.add('carol', 'carol@example.com')
+    assert availability_index._added_during_rebuild == [('username', 'carol'), ('email', 'carol@example.com')]
+    availability_index._added_during_rebuild = None
+
+
+def test_recheck_asks_the_database(app_ctx, make_user):
+    make_user('dave')
+    availability_index.rebuild()
+    assert availability_index.recheck('dave', 'someone@example.com') == ['username']
+    assert availability_index.recheck('erin', 'dave@example.com') == ['email']
+    assert availability_index.recheck('erin', 'erin@example.com') == []
+
+
+@pytest.mark.parametrize('username, status', [('frank', 302), ('Frank', 200)])
+def test_signup_leaves_the_final_word_to_the_database(app, client, make_user, username, status):
+    make_user('Frank')
+    with app.app_context():
+        availability_index.rebuild()
+    response = client.post('/signup', data=dict(
+        first_name='A', last_name='B', username=username, email=f'{username.lower()}2@example.com',
+        password='secret1', confirm_password='secret1', address_line1='x', city='c', state='s',
+        pincode='123456', user_type='Patient'))
+    assert response.status_code == status
+
+
+def test_free_answers_are_not_remembered(app_ctx, make_user):
+    availability_index.rebuild()
+    availability_index.filters['username'].add(fold('grace'))  # A false positive
+    assert not availability_index.is_taken('username', 'grace')
+    make_user('grace')  # e.g. in another worker, which this one's filters have not heard of
+    assert availability_index.is_taken('username', 'grace')
+    lookups = dict(availability_index.lookups)
+    assert availability_index.is_taken('username', 'grace')
+    assert availability_index.lookups['cache'] == lookups['cache'] + 1
+
+
+def test_deleted_users_are_forgotten(app_ctx, make_user):
+    user = make_user('Heidi')
+    availability_index.rebuild()
+    assert availability_index.taken('Heidi', 'Heidi@example.com') == ['username', 'email']
+    db.session.delete(user)
+    db.session.commit()
+    availability_index.remove('Heidi', 'Heidi@example.com')
+    assert availability_index.taken('Heidi', 'Heidi@example.com') == []
+    make_user('Heidi')  # Signed up again, in another worker
+    assert availability_index.taken('Heidi', 'Heidi@example.com') == ['username', 'email']
+
+
+def test_imported_users_are_added_to_the_filters(app, app_ctx, tmp_path):
+    availability_index.rebuild()
+    source = tmp_path / 'users.ndjson'
+    source.write_text('{"first_name": "I", "last_name": "V", "username": "ivan", "email": "ivan@example.com", '
+                      '"password": "secret1", "address_line1": "x", "city": "c", "state": "s", '
+                      '"pincode": "123456", "user_type": "Patient"}\n')
+    result = app.test_cli_runner().invoke(args=['data', 'import', 'users', str(source), '--workers', '0'])
+    assert 'Imported 1 of 1 users' in result.output
+    assert fold('ivan') in availability_index.filters['username']
+    assert fold('ivan@example.com') in availability_index.filters['email']
+    lookups = dict(availability_index.lookups)
+    assert availability_index.taken('ivan', 'ivan@example.com') == ['username', 'email']
+    assert availability_index.lookups['database'] == lookups['database']
@@ -0,0 +1,114 @@
+import csv
+import json
+
+import pytest
+from werkzeug.security import check_password_hash
+
+from counters import author_counts, category_counts
+from models import db, User, Blog
+
+USER = {'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com', 'password': 'secret1',
+        'address_line1': '1 Main St', 'city': 'City', 'state': 'State', 'pincode': '123456', 'user_type': 'Doctor'}
+
+
+def run(app, *args):
+    result = app.test_cli_runner().invoke(args=['data', *args])
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_ndjson(path, lines):
+    path.write_text(''.join((line if isinstance(line, str) else json.dumps(line)) + '\n' for line in lines),
+                    encoding='utf-8')
+
+
+def test_import_users_rejects_invalid_rows(app, app_ctx, tmp_path, make_user):
+    make_user('taken')
+    source = tmp_path / 'users.csv'
+    write_csv(source, [
+        {**USER, 'username': 'ada'},
+        {**USER, 'username': 'short', 'email': 'short@example.com', 'password': 'abc'},
+        {**USER, 'username': 'taken', 'email': 'other@example.com'},
+        {**USER, 'username': 'ada2'},  # Same email as the first row
+    ])
+    result = run(app, 'import', 'users', str(source), '--workers', '0', '--batch-size', '2')
+    assert 'Imported 1 of 4 users' in result.output
+
+    ada = db.session.execute(db.select(User).filter_by(username='ada')).scalar_one()
+    assert check_password_hash(ada.password, 'secret1')
+    with open(tmp_path / 'users.csv.rejects.csv', newline='', encoding='utf-8') as f:
+        rejects = {row['username']: row for row in csv.DictReader(f)}
+    assert set(rejects) == {'short', 'taken', 'ada2'}
+    assert rejects['short']['line'] == '3'
+    assert 'password' in rejects['short']['errors']
+    assert rejects['short']['password'] == '(removed)'
+    assert rejects['taken']['errors'] == 'username or email already exists'
+    assert rejects['ada2']['errors'] == 'duplicate username or email earlier in the file'
+
+
+def test_import_blogs_updates_counts(app, app_ctx, tmp_path, make_user):
+    doctor, patient = make_user('doc'), make_user('pat', user_type='Patient')
+    source = tmp_path / 'blogs.ndjson'
+    blog = {'title': 'Vaccines', 'category': 'Covid19', 'summary': 'S', 'content': 'Words', 'author': 'doc'}
+    write_ndjson(source, [
+        blog,
+        {**blog, 'title': 'Draft', 'draft': 'true', 'date_posted': '2024-01-02T03:04:05'},
+        {**blog, 'author': 'pat'},
+        {**blog, 'date_posted': 'yesterday'},
+        'not json',
+    ])
+    result = run(app, 'import', 'blogs', str(source))
+    assert 'Imported 2 of 5 blogs' in result.output
+
+    draft = db.session.execute(db.select(Blog).filter_by(title='Draft')).scalar_one()
+    assert draft.draft and draft.date_posted.isoformat() == '2024-01-02T03:04:05'
+    assert category_counts() == {'Covid19': 1}
+    assert author_counts(doctor.id) == {'posts': 2, 'drafts': 1}
+    assert author_counts(patient.id) == {'posts': 0, 'drafts': 0}
+    rejects = [json.loads(line) for line in (tmp_path / 'blogs.ndjson.rejects.ndjson').read_text().splitlines()]
+    assert [(row['line'], row['errors']) for row in rejects] == [
+        (3, 'author: no doctor with this username'),
+        (4, 'date_posted: not an ISO 8601 date'),
+        (5, 'not a JSON object'),
+    ]
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'ndjson'])
+def test_export_round_trips(app, app_ctx, tmp_path, make_user, make_blog, fmt):
+    author = make_user('doc')
+    make_user('pat', user_type='Patient')
+    make_blog(author, title='Heart health', category='Heart Disease')
+    make_blog(author, title='Draft', draft=True)
+    users, blogs = tmp_path / f'users.{fmt}', tmp_path / f'blogs.{fmt}'
+    run(app, 'export', 'users', str(users), '--with-password-hashes')
+    run(app, 'export', 'blogs', str(blogs))
+    exported_users = db.session.execute(db.select(User.username, User.password).order_by(User.id)).all()
+    exported_blogs = db.session.execute(db.select(Blog.title, Blog.draft, Blog.date_posted).order_by(Blog.id)).all()
+
+    db.session.execute(db.delete(Blog))
+    db.session.execute(db.delete(User))
+    db.session.commit()
+    run(app, 'import', 'users', str(users), '--workers', '0')
+    run(app, 'import', 'blogs', str(blogs))
+
+    # Password hashes carry over, so the accounts keep their passwords
+    assert db.session.execute(db.select(User.username, User.password).order_by(User.id)).all() == exported_users
+    assert db.session.execute(
+        db.select(Blog.title, Blog.draft, Blog.date_posted).order_by(Blog.id)).all() == exported_blogs
+    assert not (tmp_path / f'users.{fmt}.rejects.{fmt}').exists()
+    assert not (tmp_path / f'blogs.{fmt}.rejects.{fmt}').exists()
+
+
+def test_export_leaves_out_password_hashes(app, make_user):
+    make_user('doc')
+    result = run(app, 'export', 'users', '--format', 'ndjson')
+    row = json.loads(result.stdout)
+    assert row['username'] == 'doc'
+    assert 'password' not in row and 'password_hash' not in row
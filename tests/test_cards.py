@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import event
+
+from models import db, Blog, BlogCard
+
+SUMMARY = ' '.join(f'word{i}' for i in range(20))
+
+
+@pytest.fixture
+def statements(app):
+    """SQL statements run by the app while the test runs."""
+    with app.app_context():
+        engine = db.engine
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_card_is_built_from_the_card_columns(app_ctx, make_user, make_blog):
+    blog = make_blog(make_user('doc'))
+    blog.summary = SUMMARY
+    db.session.commit()
+    row = Blog.query.with_entities(*Blog.card_columns()).one()
+    assert 'content' not in row._fields
+    card = BlogCard.from_row(row)
+    assert (card.id, card.title, card.user_id, card.date_posted) == (blog.id, 'A post', blog.user_id,
+                                                                      blog.date_posted)
+    assert card.truncated_summary == blog.truncated_summary() == ' '.join(SUMMARY.split()[:15]) + '...'
+    assert not hasattr(card, '__dict__')
+
+
+@pytest.mark.parametrize('user_type, path', [('Patient', '/blogs/all'), ('Patient', '/blogs?category=Covid19'),
+                                             ('Doctor', '/blogs'), ('Doctor', '/blogs/my'), ('Doctor', '/draft')])
+def test_listings_never_select_the_article_body(client, login, make_user, make_blog, statements, user_type, path):
+    author = make_user('doc')
+    make_blog(author, title='Published', content='BODY ' * 50)
+    make_blog(author, title='Drafted', content='BODY ' * 50, draft=True)
+    make_user('viewer', user_type=user_type)
+    login(client, 'doc' if user_type == 'Doctor' else 'viewer')
+    del statements[:]
+    response = client.get(path)
+    assert response.status_code == 200
+    assert b'Published' in response.data or b'Drafted' in response.data
+    assert b'BODY' not in response.data
+    blog_reads = [sql for sql in statements if 'FROM blog' in sql and 'blog.title' in sql]
+    assert blog_reads and not any('blog.content' in sql for sql in blog_reads)
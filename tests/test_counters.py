@@ -0,0 +1,73 @@
+from bulk import count_blogs
+from counters import actual_counts, author_counts, category_counts
+from models import db, Blog, BlogCount, User
+
+
+def stored_counts():
+    return {(row.kind, row.subject): row.count for row in db.session.execute(
+        db.select(BlogCount.kind, BlogCount.subject, BlogCount.count)) if row.count}
+
+
+def published():
+    return {category: count for category, count in category_counts().items() if count}
+
+
+def test_counters_follow_publishing_moves_and_deletes(app_ctx, make_user, make_blog):
+    doctor, other = make_user('doc'), make_user('other')
+    post = make_blog(doctor, category='Covid19')
+    draft = make_blog(doctor, category='Immunization', draft=True)
+    make_blog(other, category='Covid19')
+    assert stored_counts() == actual_counts()
+    assert published() == {'Covid19': 2}
+    assert author_counts(doctor.id) == {'posts': 2, 'drafts': 1}
+
+    draft.draft = False  # Publish
+    post.category = 'Heart Disease'  # Move
+    db.session.commit()
+    assert stored_counts() == actual_counts()
+    assert published() == {'Covid19': 1, 'Heart Disease': 1, 'Immunization': 1}
+    assert author_counts(doctor.id) == {'posts': 2, 'drafts': 0}
+
+    db.session.expire_all()
+    post = db.session.get(Blog, post.id)
+    post.draft = True  # Unpublish, without the old values loaded first
+    db.session.delete(db.session.get(Blog, draft.id))
+    db.session.commit()
+    assert stored_counts() == actual_counts()
+    assert published() == {'Covid19': 1}
+    assert author_counts(doctor.id) == {'posts': 1, 'drafts': 1}
+
+
+def test_deleting_a_user_removes_their_posts_from_the_counts(app, client, make_user, make_blog):
+    doctor, other = make_user('doc'), make_user('other')
+    make_blog(doctor, category='Covid19')
+    make_blog(doctor, category='Covid19', draft=True)
+    make_blog(other, category='Covid19')
+    client.post(f'/delete_user/{doctor.id}')
+    with app.app_context():
+        assert db.session.get(User, doctor.id) is None
+        assert stored_counts() == actual_counts()
+        assert published() == {'Covid19': 1}
+        assert author_counts(doctor.id) == {'posts': 0, 'drafts': 0}
+
+
+def test_bulk_inserts_are_counted(app_ctx, make_user):
+    doctor = make_user('doc')
+    rows = [{'title': f'Post {i}', 'category': 'Covid19' if i % 2 else 'Immunization', 'summary': 's',
+             'content': 'c', 'draft': i % 3 == 0, 'user_id': doctor.id} for i in range(10)]
+    db.session.execute(db.insert(Blog), rows)  # Core INSERTs, as `flask data import` does
+    count_blogs(rows)
+    db.session.commit()
+    assert stored_counts() == actual_counts()
+    assert author_counts(doctor.id) == {'posts': 10, 'drafts': 4}
+
+
+def test_rebuild_command_fixes_drift(app, app_ctx, make_user, make_blog):
+    make_blog(make_user('doc'))
+    db.session.execute(db.update(BlogCount).values(count=BlogCount.count + 5))
+    db.session.commit()
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['counts', 'rebuild', '--check']).exit_code == 1
+    assert runner.invoke(args=['counts', 'rebuild']).exit_code == 0
+    assert runner.invoke(args=['counts', 'rebuild', '--check']).exit_code == 0
+    assert stored_counts() == actual_counts()
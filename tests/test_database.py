@@ -0,0 +1,81 @@
+import re
+
+import pytest
+from flask import session as flask_session
+from sqlalchemy import event
+
+from database import STICKY_KEY, use_replica
+from models import db, Blog
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    yield {'DATABASE_REPLICA_URLS': [f'sqlite:///{tmp_path / "replica.db"}']}
+    db.metadatas.pop('replica0', None)  # Registered on the shared extension; later apps have no such bind
+
+
+@pytest.fixture
+def reads(app):
+    """``(engine, table)`` for every SELECT the app runs, where engine is 'primary' or 'replica0'."""
+    seen = []
+    with app.app_context():
+        db.metadata.create_all(db.engines['replica0'])  # Same schema, as a real replica would have
+        engines = {'primary': db.engine, 'replica0': db.engines['replica0']}
+
+    def recorder(label):
+        def record(conn, cursor, statement, parameters, context, executemany):
+            match = re.match(r'SELECT\b.*?\bFROM (\w+)', statement, re.S)
+            if match:
+                seen.append((label, match.group(1)))
+        return record
+
+    listeners = [(engine, recorder(label)) for label, engine in engines.items()]
+    for engine, listener in listeners:
+        event.listen(engine, 'before_cursor_execute', listener)
+    yield seen
+    for engine, listener in listeners:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+
+def test_reads_go_to_the_replica_until_the_session_writes(app_ctx, reads):
+    db.session.info['replica'] = 'replica0'
+    db.session.execute(db.select(Blog)).all()
+    assert reads == [('replica0', 'blog')]
+
+    db.session.execute(db.update(Blog).values(title='x'))
+    db.session.execute(db.select(Blog)).all()
+    assert reads[-1] == ('primary', 'blog')  # Reads its own write
+
+    db.session.rollback()
+    db.session.info.pop('wrote')
+    db.session.add(Blog(title='t', category='Covid19', summary='s', content='c', user_id=1))
+    db.session.flush()
+    db.session.execute(db.select(Blog)).all()
+    assert reads[-1] == ('primary', 'blog')
+
+
+def test_replica_views_read_from_the_replica(client, login, make_user, make_blog, reads):
+    make_blog(make_user('doc'))
+    login(client, 'doc')
+    del reads[:]
+    assert client.get('/blogs/my').status_code == 200
+    assert ('replica0', 'blog') in reads and ('primary', 'blog') not in reads
+
+
+def test_page_cache_is_filled_from_the_primary(client, login, make_user, make_blog, reads):
+    make_blog(make_user('doc'))
+    make_user('pat', user_type='Patient')
+    login(client, 'pat')
+    del reads[:]
+    assert client.get('/blogs/all').status_code == 200
+    assert ('primary', 'blog') in reads and ('replica0', 'blog') not in reads
+
+
+def test_clients_stick_to_the_primary_after_writing(app):
+    view = use_replica(lambda: db.session.info.get('replica'))
+    with app.test_request_context():
+        assert view() == 'replica0'
+        db.session.execute(db.update(Blog).values(title='x'))
+        db.session.commit()
+        assert flask_session[STICKY_KEY] > 0
+        assert view() is None
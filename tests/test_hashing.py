@@ -0,0 +1,40 @@
+import os
+import time
+
+import pytest
+
+from hashing import HashingBusy, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1, max_pending=1, timeout=30)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_hashes_on_the_pool(hasher):
+    assert hasher.verify(hasher.hash('secret1'), 'secret1')
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes(hasher):
+    hasher.timeout = 0.05
+    with pytest.raises(HashingBusy):
+        hasher._run(time.sleep, 1)
+    hasher.timeout = 30
+    with pytest.raises(HashingBusy):  # Still running, so the queue is full
+        hasher._run(abs, -1)
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            assert hasher._run(abs, -1) == 1
+            break
+        except HashingBusy:
+            assert time.monotonic() < deadline, 'the slot was never released'
+            time.sleep(0.05)
+
+
+def test_a_crashed_worker_is_replaced(hasher):
+    with pytest.raises(HashingBusy):
+        hasher._run(os._exit, 1)
+    assert hasher._run(abs, -2) == 2
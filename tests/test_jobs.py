@@ -0,0 +1,126 @@
+import io
+
+import pytest
+from PIL import Image
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from jobs import queue
+from models import db, Blog, Job, SearchChange
+
+calls = []
+
+
+@queue.job('test.record')
+def record(value):
+    calls.append(value)
+
+
+@queue.job('test.flaky', max_attempts=2)
+def flaky(value):
+    calls.append(value)
+    raise RuntimeError('boom')
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    calls.clear()
+
+
+def work(app):
+    queue.work(app, threads=1, poll_interval=0.01, burst=True)
+
+
+def test_job_runs_after_commit_only(app, app_ctx, make_user, make_blog):
+    make_blog(make_user('doc'))
+    db.session.add(Blog(title='Unsaved', category='Covid19', summary='-', content='-', user_id=1))
+    queue.enqueue('test.record', {'value': 1})
+    db.session.rollback()
+    queue.enqueue('test.record', {'value': 2})
+    db.session.commit()
+    work(app)
+    assert calls == [2]
+    assert [job.status for job in Job.query] == ['done']
+
+
+def test_unknown_job_is_rejected(app_ctx):
+    with pytest.raises(KeyError):
+        queue.enqueue('test.missing')
+
+
+def test_queued_job_is_not_enqueued_twice(app, app_ctx):
+    first = queue.enqueue('test.record', {'value': 1}, idempotency_key='k')
+    db.session.commit()
+    assert queue.enqueue('test.record', {'value': 1}, idempotency_key='k').id == first.id
+    db.session.commit()
+    work(app)
+    assert calls == [1]
+
+
+def test_finished_job_releases_its_key(app, app_ctx):
+    queue.enqueue('test.record', {'value': 1}, idempotency_key='k')
+    db.session.commit()
+    work(app)
+    queue.enqueue('test.record', {'value': 2}, idempotency_key='k')
+    db.session.commit()
+    work(app)
+    assert calls == [1, 2]
+    assert Job.query.filter_by(idempotency_key='k').count() == 1
+
+
+def test_failed_job_is_retried_then_failed(app, app_ctx):
+    app.config['JOBS_RETRY_BACKOFF'] = queue.backoff = 0
+    queue.enqueue('test.flaky', {'value': 1})
+    db.session.commit()
+    work(app)
+    job = Job.query.one()
+    assert calls == [1, 1]
+    assert (job.status, job.attempts) == ('failed', 2)
+    assert 'boom' in job.last_error
+
+
+def image_upload(color, name):
+    data = io.BytesIO()
+    Image.new('RGB', (600, 400), color).save(data, 'PNG')
+    data.seek(0)
+    return data, name
+
+
+def test_switching_back_to_an_earlier_image_makes_its_variants(app, client, tmp_path, make_user, make_blog, login):
+    """A -> B -> A: the last upload reuses A's path, whose first job is done."""
+    app.static_folder = str(tmp_path / 'static')
+    author = make_user('doc')
+    blog_id = make_blog(author).id
+    login(client, 'doc')
+
+    for color in ('red', 'blue', 'red'):
+        response = client.post(f'/edit_blog/{blog_id}', content_type='multipart/form-data', data={
+            'title': 'A post', 'category': 'Covid19', 'summary': 'A summary', 'content': 'Some words.',
+            'image': image_upload(color, 'photo.png')})
+        assert response.status_code == 302
+        work(app)
+
+    with app.app_context():
+        blog = db.session.get(Blog, blog_id)
+        assert blog.image_variants is not None
+        assert blog.image_variants['webp']['400'].startswith(blog.image.rsplit('.', 1)[0])
+
+
+def test_new_post_commits_its_work_once(app, client, make_user, login):
+    make_user('doc')
+    login(client, 'doc')
+    commits = []
+
+    def count(session):
+        if not session.in_nested_transaction():  # Releasing a savepoint also fires after_commit
+            commits.append(session)
+    event.listen(Session, 'after_commit', count)
+    try:
+        client.post('/create_blog', data={'title': 'A post', 'category': 'Covid19', 'summary': 'A summary',
+                                          'content': 'Some words.'})
+    finally:
+        event.remove(Session, 'after_commit', count)
+    assert len(commits) == 1
+    with app.app_context():
+        assert [job.name for job in Job.query] == ['related.update']
+        assert db.session.query(SearchChange.blog_id).all() == [(1,)]
@@ -0,0 +1,28 @@
+from metrics import Registry
+
+
+def test_metrics_answers_local_scrapers(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'# TYPE page_cache_hits_total counter' in response.data
+
+
+def test_metrics_refuses_other_addresses(client):
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.9'}).status_code == 403
+
+
+def test_metrics_accepts_allowed_networks_and_the_token(app, client):
+    app.config['METRICS_ALLOWED_IPS'] = ['10.0.0.0/8']
+    app.config['METRICS_TOKEN'] = 's3cret'
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.1.2.3'}).status_code == 200
+    outside = {'REMOTE_ADDR': '203.0.113.9'}
+    assert client.get('/metrics', environ_base=outside, headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+    assert client.get('/metrics', environ_base=outside, headers={'Authorization': 'Bearer wrong'}).status_code == 403
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.register(lambda: [('requests_total', 'counter', 'Requests.',
+                                [('', {'path': 'C:\\tmp\n"x"'}, 1)])])
+    assert registry.render().splitlines()[-1] == 'requests_total{path="C:\\\\tmp\\n\\"x\\""} 1'
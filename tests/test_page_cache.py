@@ -0,0 +1,107 @@
+import os
+
+import page_cache as page_cache_module
+from app import page_cache
+from page_cache import CacheEntry, FileGenerations, FileSystemBackend, MemoryBackend, PageCache
+
+
+def test_memory_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(page_cache_module.time, 'monotonic', lambda: now[0])
+    backend = MemoryBackend(ttl=60)
+    backend.set('blog:1', CacheEntry('<p>1</p>'))
+    now[0] += 59
+    assert backend.get('blog:1').body == b'<p>1</p>'
+    now[0] += 2
+    assert backend.get('blog:1') is None
+
+
+def test_memory_evicts_least_recently_used():
+    backend = MemoryBackend(max_bytes=10)
+    backend.set('a', CacheEntry('aaaa'))
+    backend.set('b', CacheEntry('bbbb'))
+    backend.get('a')
+    backend.set('c', CacheEntry('cccc'))
+    assert backend.get('b') is None
+    assert backend.get('a') is not None and backend.get('c') is not None
+
+
+def test_invalidating_a_category_changes_its_feed_keys(tmp_path):
+    for backend in (MemoryBackend(), FileSystemBackend(str(tmp_path))):
+        cache = PageCache(backend)
+        covid, heart, everything = (cache.feed_key('main.view_blogs', category)
+                                    for category in ('Covid19', 'Heart Disease', None))
+        cache.invalidate_feeds('Covid19')
+        assert cache.feed_key('main.view_blogs', 'Covid19') != covid
+        assert cache.feed_key('main.view_blogs', None) != everything
+        assert cache.feed_key('main.view_blogs', 'Heart Disease') != heart  # Embeds the unfiltered generation
+
+
+def test_blog_page_is_cached_and_invalidated_by_an_edit(client, make_user, make_blog, login):
+    blog_id = make_blog(make_user('doc'), title='First title').id
+    login(client, 'doc')
+    response = client.get(f'/blog/{blog_id}')
+    assert b'First title' in response.data
+    assert response.headers['ETag'] and 'Last-Modified' not in response.headers
+    assert client.get(f'/blog/{blog_id}', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    client.post(f'/edit_blog/{blog_id}', data={'title': 'Second title', 'category': 'Covid19',
+                                               'summary': 'A summary', 'content': 'Some words.'})
+    assert b'Second title' in client.get(f'/blog/{blog_id}').data
+
+
+def test_feed_is_invalidated_by_a_new_post(app, client, make_user, make_blog, login):
+    make_blog(make_user('doc'), title='Older post')
+    make_user('pat', user_type='Patient')
+    login(client, 'pat')
+    assert b'Older post' in client.get('/blogs/all').data
+    hits = page_cache.hits
+    client.get('/blogs/all')
+    assert page_cache.hits == hits + 1
+
+    doctor = app.test_client()
+    login(doctor, 'doc')
+    doctor.post('/create_blog', data={'title': 'Newer post', 'category': 'Covid19', 'summary': 'A summary',
+                                      'content': 'Some words.'})
+    hits, misses = page_cache.hits, page_cache.misses
+    assert b'Newer post' in client.get('/blogs/all').data
+    assert (page_cache.hits, page_cache.misses) == (hits, misses + 1)
+
+
+def test_invalidation_reaches_other_processes_caches(tmp_path, monkeypatch):
+    """Two memory caches sharing a generations directory, like a web worker and `flask jobs worker`."""
+    monkeypatch.setattr(FileGenerations, 'REFRESH_INTERVAL', 0)
+    web, worker = (PageCache(MemoryBackend(), generations=FileGenerations(str(tmp_path))) for _ in range(2))
+    web.backend.set(web.blog_key(1), CacheEntry('old'))
+    feed_key = web.feed_key('main.view_blogs', 'Covid19')
+    web.backend.set(feed_key, CacheEntry('old feed'))
+
+    worker.invalidate_blog(1)
+    worker.invalidate_feeds('Covid19')
+    assert web.get(web.blog_key(1)) is None
+    assert web.feed_key('main.view_blogs', 'Covid19') != feed_key
+
+    web.backend.set(web.blog_key(2), CacheEntry('old'))
+    worker.invalidate_all_blogs()
+    assert web.get(web.blog_key(2)) is None
+
+
+def test_generations_are_read_from_disk_once_per_interval(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(page_cache_module.time, 'monotonic', lambda: now[0])
+    web, worker = FileGenerations(str(tmp_path)), FileGenerations(str(tmp_path))
+    before = web.get('Covid19')
+    bumped = worker.bump('Covid19')
+    stats = []
+    stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        if str(path).startswith(str(tmp_path)):
+            stats.append(path)
+        return stat(path, *args, **kwargs)
+    monkeypatch.setattr(os, 'stat', counting_stat)
+    assert web.get('Covid19') == before
+    assert stats == []
+    now[0] += FileGenerations.REFRESH_INTERVAL
+    assert web.get('Covid19') == bumped
+    assert len(stats) == 1
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Blog
+from pagination import InvalidCursor, decode_cursor, encode_cursor, paginate
+
+
+@pytest.fixture
+def posts(make_user, make_blog):
+    """Ids of five published posts by ``doc``, newest first; the two newest were posted at the same time."""
+    author = make_user('doc')
+    ids = [make_blog(author, title=f'Post {i}').id for i in range(5)]
+    start = datetime(2024, 1, 1)
+    dates = [start, start + timedelta(hours=1), start + timedelta(hours=2), start + timedelta(hours=3),
+             start + timedelta(hours=3)]
+    for blog_id, date_posted in zip(ids, dates):
+        db.session.execute(db.update(Blog).where(Blog.id == blog_id).values(date_posted=date_posted))
+    db.session.commit()
+    return list(reversed(ids))
+
+
+def ids(page):
+    return [blog.id for blog in page.items]
+
+
+def test_cursor_round_trip():
+    blog = Blog(id=7, date_posted=datetime(2024, 5, 6, 7, 8, 9, 123456))
+    assert decode_cursor(encode_cursor(blog)) == (blog.date_posted, 7)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not-a-cursor', '!!!!', encode_cursor(Blog(id=1, date_posted=datetime(2024, 1, 1)))[:-4]])
+def test_malformed_cursors_are_refused(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_pages_walk_forward_and_back(app_ctx, posts):
+    first = paginate(Blog.published(), per_page=2)
+    assert ids(first) == posts[:2] and first.prev_cursor is None
+    second = paginate(Blog.published(), after=first.next_cursor, per_page=2)
+    third = paginate(Blog.published(), after=second.next_cursor, per_page=2)
+    assert ids(second) == posts[2:4]
+    assert ids(third) == posts[4:] and not third.has_next
+
+    back = paginate(Blog.published(), before=third.prev_cursor, per_page=2)
+    assert ids(back) == posts[2:4] and back.has_prev
+    assert ids(paginate(Blog.published(), before=back.prev_cursor, per_page=2)) == posts[:2]
+
+
+def test_branches_are_merged_in_order(app_ctx, posts):
+    draft = Blog(title='Draft', category='Covid19', summary='s', content='c', draft=True, user_id=1,
+                 date_posted=datetime(2024, 1, 1, 2, 30))
+    db.session.add(draft)
+    db.session.commit()
+    page = paginate(Blog.doctor_feed(1), per_page=3)
+    assert ids(page) == posts[:2] + [draft.id]
+    assert ids(paginate(Blog.doctor_feed(1), after=page.next_cursor, per_page=3)) == posts[2:]
+
+
+def test_listing_answers_400_for_a_malformed_cursor(client, login, make_user):
+    make_user('pat', user_type='Patient')
+    login(client, 'pat')
+    assert client.get('/blogs/all?after=not-a-cursor').status_code == 400
+    assert client.get('/blogs/all?before=%21%21').status_code == 400
+
+
+@pytest.mark.parametrize('app_config', [{'BLOGS_PER_PAGE': 2}])
+def test_load_more_fragment(app, client, login, make_user, make_blog):
+    author = make_user('doc')
+    for i in range(3):
+        make_blog(author, title=f'Post {i}')
+    make_user('pat', user_type='Patient')
+    login(client, 'pat')
+    first = client.get('/blogs/all?format=fragment').json
+    assert 'Post 2' in first['html'] and 'Post 0' not in first['html']
+    second = client.get(f'/blogs/all?format=fragment&after={first["next_cursor"]}').json
+    assert 'Post 0' in second['html'] and second['next_cursor'] is None
@@ -0,0 +1,7 @@
+from benchmarks.seed import seed
+from query_plans import check_query_plans
+
+
+def test_listing_queries_use_indexes(app_ctx):
+    seed(users=10, blogs=500, content_words=20)
+    assert check_query_plans() == {}
@@ -0,0 +1,93 @@
+import pytest
+
+import ratelimit
+from ratelimit import MemoryStore, RateLimitExceeded, SlidingWindow
+
+PASSWORD = 'right-password'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+    return now
+
+
+def test_sliding_window_limits_and_resets(clock):
+    window = SlidingWindow(MemoryStore(), 'test', limit=3, window=60)
+    for _ in range(3):
+        window.hit('a')
+    with pytest.raises(RateLimitExceeded) as error:
+        window.hit('a')
+    assert 1 <= error.value.retry_after <= 60
+    window.hit('b')  # Other identities have their own count
+    window.reset('a')
+    window.hit('a')
+
+
+def test_sliding_window_counts_part_of_the_previous_window(clock):
+    window = SlidingWindow(MemoryStore(), 'test', limit=4, window=60)
+    clock[0] = 60 * 1000 + 30  # Halfway through a window
+    for _ in range(4):
+        window.hit('a')
+    clock[0] += 45  # A quarter into the next one: 4 * 0.75 = 3 still count
+    window.hit('a')
+    with pytest.raises(RateLimitExceeded):
+        window.hit('a')
+
+
+def test_memory_store_drops_the_least_recently_updated_keys():
+    store = MemoryStore(max_keys=2, shards=1)
+    store.incr('a', 1, 60)
+    store.incr('b', 1, 60)
+    store.incr('c', 1, 60)
+    assert (store.get('a'), store.get('b'), store.get('c')) == (0, 1, 1)
+
+
+def login(client, username, password, address='198.51.100.1', forwarded_for=None):
+    headers = {'X-Forwarded-For': forwarded_for} if forwarded_for else {}
+    return client.post('/login', data={'username': username, 'password': password},
+                       environ_base={'REMOTE_ADDR': address}, headers=headers)
+
+
+@pytest.mark.parametrize('app_config', [{'LOGIN_LIMIT_PER_USERNAME': 2}])
+def test_failed_logins_lock_the_username(app, client, make_user):
+    make_user('doc', password=PASSWORD)
+    for _ in range(2):
+        assert login(client, 'doc', 'wrong').status_code == 200
+    response = login(client, 'DOC', PASSWORD)
+    assert response.status_code == 429 and response.headers['Retry-After']
+
+
+@pytest.mark.parametrize('app_config', [{'LOGIN_LIMIT_PER_USERNAME': 2}])
+def test_a_successful_login_resets_the_username_count(app, client, make_user):
+    make_user('doc', password=PASSWORD)
+    login(client, 'doc', 'wrong')
+    assert login(client, 'doc', PASSWORD).status_code == 302
+    login(client, 'doc', 'wrong')
+    assert login(client, 'doc', 'wrong').status_code == 200
+
+
+@pytest.mark.parametrize('app_config', [{'LOGIN_LIMIT_PER_IP': 2}])
+def test_attempts_are_limited_per_client_address(app, client):
+    for _ in range(2):
+        login(client, 'nobody', 'wrong')
+    assert login(client, 'nobody', 'wrong').status_code == 429
+    assert login(client, 'nobody', 'wrong', address='198.51.100.2').status_code == 200
+
+
+@pytest.mark.parametrize('app_config', [{'LOGIN_LIMIT_PER_IP': 2, 'TRUSTED_PROXY_HOPS': 1}])
+def test_behind_a_proxy_the_forwarded_address_is_limited(app, client):
+    proxy = '10.0.0.5'
+    for _ in range(2):
+        login(client, 'nobody', 'wrong', address=proxy, forwarded_for='203.0.113.7')
+    assert login(client, 'nobody', 'wrong', address=proxy, forwarded_for='203.0.113.7').status_code == 429
+    # Other clients behind the same proxy are not affected
+    assert login(client, 'nobody', 'wrong', address=proxy, forwarded_for='203.0.113.8').status_code == 200
+
+
+@pytest.mark.parametrize('app_config', [{'LOGIN_LIMIT_PER_IP': 2}])
+def test_forwarded_headers_are_ignored_without_trusted_proxies(app, client):
+    for forwarded in ('203.0.113.1', '203.0.113.2'):
+        login(client, 'nobody', 'wrong', forwarded_for=forwarded)
+    assert login(client, 'nobody', 'wrong', forwarded_for='203.0.113.3').status_code == 429
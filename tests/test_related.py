@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from flask import current_app
+
+import related
+from models import db, Blog, BlogRelated
+from related import RelatedIndex
+
+TOPICS = {
+    'vaccines': 'vaccine dose booster immunity antibody',
+    'heart': 'heart artery pressure cholesterol pulse',
+    'diet': 'diet sugar fibre protein vitamin',
+}
+
+
+@pytest.fixture
+def posts(app_ctx, make_user, make_blog):
+    """Three posts on each topic, each leaning on a different word of it; ``{(topic, i): id}``."""
+    author = make_user('doc')
+    posts = {}
+    for topic, words in TOPICS.items():
+        words = words.split()
+        for i in range(3):
+            content = ' '.join(words + [words[i]] * 3)
+            posts[topic, i] = make_blog(author, title=f'{topic} {i}', content=content).id
+    return posts
+
+
+def stored():
+    """``{blog_id: [related_id, ...]}`` from blog_related, most similar first."""
+    related_ids = {}
+    for row in db.session.execute(db.select(BlogRelated).order_by(BlogRelated.blog_id, BlogRelated.rank)).scalars():
+        related_ids.setdefault(row.blog_id, []).append(row.related_id)
+    return related_ids
+
+
+def assert_up_to_date():
+    """The saved index and blog_related hold what comparing every post with every other gives now."""
+    index = RelatedIndex.load(current_app.config['RELATED_INDEX_PATH'])
+    published = db.session.execute(db.select(Blog.id).filter_by(draft=False)).scalars().all()
+    assert sorted(index.ids.tolist()) == sorted(published)
+    neighbours, scores = index.nearest(np.arange(index.size), index.neighbours.shape[1])
+    assert (neighbours == index.neighbours).all()
+    assert np.allclose(scores, index.scores)
+    expected = {int(blog_id): [int(i) for i in row if i >= 0] for blog_id, row in zip(index.ids, neighbours)}
+    assert stored() == {blog_id: ids for blog_id, ids in expected.items() if ids}
+
+
+@pytest.mark.parametrize('app_config', [{'RELATED_POSTS': 2}])
+def test_update_matches_a_full_comparison(posts, make_blog):
+    assert related.update([posts['heart', 0]]) == []  # No index until the first build
+    related.build()
+    assert_up_to_date()
+    assert set(stored()[posts['vaccines', 0]]) == {posts['vaccines', 1], posts['vaccines', 2]}
+
+    # Publishing a post that belongs with the diet posts
+    author = db.session.get(Blog, posts['diet', 0]).author
+    new = make_blog(author, title='diet 3', content='diet sugar fibre protein vitamin sugar sugar sugar')
+    changed = related.update([new.id])
+    assert_up_to_date()
+    assert new.id in changed and posts['diet', 1] in changed
+    assert new.id in stored()[posts['diet', 1]]
+
+    # An edit that moves a post from one topic to another
+    blog = db.session.get(Blog, posts['heart', 2])
+    blog.title, blog.content = 'vaccines 3', TOPICS['vaccines'] + ' vaccine vaccine vaccine'
+    db.session.commit()
+    changed = related.update([blog.id])
+    assert_up_to_date()
+    assert {blog.id, posts['heart', 0], posts['vaccines', 0]} <= set(changed)
+    assert blog.id in stored()[posts['vaccines', 0]] and blog.id not in stored()[posts['heart', 0]]
+
+    # Unpublishing and deleting
+    db.session.get(Blog, posts['vaccines', 0]).draft = True
+    db.session.commit()
+    related.update([posts['vaccines', 0]])
+    assert_up_to_date()
+    related.forget([new.id])
+    db.session.delete(db.session.get(Blog, new.id))
+    db.session.commit()
+    related.update([new.id])
+    assert_up_to_date()
+    assert all(new.id not in ids and posts['vaccines', 0] not in ids for ids in stored().values())
+
+
+@pytest.mark.parametrize('app_config', [{'RELATED_POSTS': 2, 'RELATED_SAME_CATEGORY': True}])
+def test_same_category_only_relates_posts_in_one_category(posts):
+    blog = db.session.get(Blog, posts['vaccines', 1])
+    blog.category = 'Immunization'
+    db.session.commit()
+    related.build()
+    assert posts['vaccines', 1] not in stored()
+    blog.category = 'Covid19'
+    db.session.commit()
+    related.update([blog.id])
+    assert_up_to_date()
+    assert blog.id in stored()[posts['vaccines', 0]]
@@ -0,0 +1,63 @@
+from models import db, Blog
+from rendering import EXCERPT_CHARS, render
+
+
+def test_content_is_sanitized():
+    content_html, excerpt, word_count = render(
+        'Hi <script>alert(1)</script><b onclick="steal()">there</b> '
+        '<a href="javascript:steal()">x</a> <a href="https://example.com" target="_blank">y</a> <img src=x>')
+    assert '<script' not in content_html and 'onclick' not in content_html and '<img' not in content_html
+    assert 'javascript:' not in content_html and 'target=' not in content_html
+    assert '<b>there</b>' in content_html and 'href="https://example.com"' in content_html
+    assert excerpt == 'Hi alert(1) there x y' and word_count == 5
+
+
+def test_text_is_formatted():
+    content_html, excerpt, word_count = render('One\r\ntwo\n\n<ul><li>item</li></ul>\n\nSee www.example.com')
+    assert content_html == ('<p>One<br>\ntwo</p>\n<ul><li>item</li></ul>\n'
+                            '<p>See <a href="http://www.example.com" rel="nofollow">www.example.com</a></p>')
+    assert (excerpt, word_count) == ('One two item See www.example.com', 5)
+
+
+def test_long_excerpts_are_cut_at_a_word():
+    _, excerpt, word_count = render('word ' * 100)
+    assert len(excerpt) <= EXCERPT_CHARS and excerpt.endswith('word…')
+    assert word_count == 100
+
+
+def test_setting_content_renders_it(app_ctx, make_user, make_blog):
+    blog = make_blog(make_user('doc'), content='<i>Old</i>')
+    assert blog.content_html == '<p><i>Old</i></p>'
+    blog.content = 'New <script>x</script>'
+    db.session.commit()
+    assert db.session.get(Blog, blog.id).content_html == '<p>New x</p>'
+
+
+def test_view_blog_serves_the_sanitized_html(client, login, make_user, make_blog):
+    blog = make_blog(make_user('doc'), content='<em>Safe</em><script>alert(1)</script>')
+    login(client, 'doc')
+    page = client.get(f'/blog/{blog.id}').data
+    assert b'<em>Safe</em>' in page and b'<script>alert(1)' not in page
+
+
+def test_backfill_renders_old_rows_in_batches(app, app_ctx, make_user):
+    author = make_user('doc')
+    db.session.execute(db.insert(Blog), [
+        {'title': f'Post {i}', 'category': 'Covid19', 'summary': 's', 'content': f'Post <b>{i}</b>',
+         'user_id': author.id} for i in range(5)])  # Core INSERTs skip the rendering listener
+    db.session.execute(db.update(Blog).where(Blog.title == 'Post 2')
+                       .values(content_html='<p>kept</p>', excerpt='kept', word_count=1))
+    db.session.commit()
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['content', 'backfill', '--batch-size', '2'])
+    assert 'Rendered 4 post(s).' in result.output
+    db.session.expire_all()
+    rows = db.session.execute(db.select(Blog.title, Blog.content_html, Blog.word_count).order_by(Blog.id)).all()
+    assert [(row.content_html, row.word_count) for row in rows] == [
+        (f'<p>Post <b>{i}</b></p>', 2) if i != 2 else ('<p>kept</p>', 1) for i in range(5)]
+    assert 'Rendered 0 post(s).' in runner.invoke(args=['content', 'backfill']).output
+
+    assert 'Rendered 5 post(s).' in runner.invoke(args=['content', 'backfill', '--all', '--batch-size', '3']).output
+    db.session.expire_all()
+    assert db.session.execute(db.select(Blog.content_html).filter_by(title='Post 2')).scalar() == '<p>Post <b>2</b></p>'
@@ -0,0 +1,92 @@
+import pytest
+
+import revisions
+from models import db, Blog, BlogRevision
+from revisions import InvalidPatch, RevisionConflict, apply_patch, diff
+
+
+def stored(blog):
+    """``[(revision, is snapshot)]`` of the rows kept for ``blog``."""
+    return [(row.revision, row.snapshot is not None) for row in db.session.execute(
+        db.select(BlogRevision).where(BlogRevision.blog_id == blog.id).order_by(BlogRevision.revision)).scalars()]
+
+
+def test_apply_patch_and_diff():
+    assert apply_patch('hello world', [[0, 5, 'goodbye'], [11, 11, '!']]) == 'goodbye world!'
+    for before, after in [('abc', 'abXc'), ('aaa', 'aa'), ('', 'new'), ('same', 'same'), ('a\nb', 'b')]:
+        assert apply_patch(before, diff(before, after)) == after
+    assert diff('the cat sat', 'the dog sat') == [[4, 7, 'dog']]
+
+
+@pytest.mark.parametrize('patch', [[], [[0, 1]], [[2, 1, 'x']], [[0, 99, 'x']], [[3, 4, 'x'], [0, 1, 'y']],
+                                   [['0', 1, 'x']], 'text'])
+def test_invalid_patches_are_refused(patch):
+    with pytest.raises(InvalidPatch):
+        apply_patch('text', patch)
+
+
+@pytest.mark.parametrize('app_config', [{'AUTOSAVE_SNAPSHOT_EVERY': 3, 'AUTOSAVE_KEEP_REVISIONS': 4}])
+def test_patches_between_snapshots_and_pruning(app_ctx, make_user, make_blog):
+    blog = make_blog(make_user('doc'), content='Line one\r\nline two')
+    assert revisions.working_copy(blog) == (0, 'Line one\nline two')
+
+    text = 'Line one\nline two'
+    for revision in range(10):
+        text += f' {revision}'
+        assert revisions.save(blog, revision, patch=[[len(text) - 2, len(text) - 2, f' {revision}']]) \
+            == (revision + 1, text)
+        db.session.commit()
+    assert revisions.working_copy(blog) == (10, text)
+    # A snapshot every third revision. Storing 10 drops the chain before 4, the newest snapshot that
+    # still leaves 4 revisions (at 7 that was 1, so nothing was dropped)
+    assert stored(blog) == [(4, True), (5, False), (6, False), (7, True), (8, False), (9, False), (10, True)]
+
+
+def test_large_patches_are_stored_as_a_snapshot(app_ctx, make_user, make_blog):
+    blog = make_blog(make_user('doc'), content='short')
+    revisions.save(blog, 0, text='short')
+    revisions.save(blog, 1, patch=[[5, 5, ' and then much longer']])
+    revisions.save(blog, 2, text='tiny')
+    db.session.commit()
+    assert stored(blog) == [(1, True), (2, False), (3, True)]
+    assert revisions.working_copy(blog) == (3, 'tiny')
+
+
+def test_stale_revision_conflicts(app_ctx, make_user, make_blog):
+    blog = make_blog(make_user('doc'), content='text')
+    revisions.save(blog, 0, text='text v1')
+    db.session.commit()
+    with pytest.raises(RevisionConflict) as excinfo:
+        revisions.save(blog, 0, text='text v2')
+    assert excinfo.value.revision == 1
+
+
+def test_autosave_endpoint(app, client, make_user, make_blog, login):
+    author = make_user('doc')
+    blog = make_blog(author, content='Hello')
+    login(client, 'doc')
+    url = f'/edit_blog/{blog.id}/autosave'
+    assert client.get(url).json == {'revision': 0, 'content': 'Hello'}
+
+    response = client.post(url, json={'revision': 0, 'patch': [[5, 5, ' world']]})
+    assert response.json == {'revision': 1, 'length': 11}
+    assert client.get(url).json == {'revision': 1, 'content': 'Hello world'}
+    with app.app_context():
+        assert db.session.get(Blog, blog.id).content == 'Hello'  # The post only changes when the form is saved
+
+    response = client.post(url, json={'revision': 0, 'patch': [[0, 0, 'Oh, ']]})
+    assert response.status_code == 409
+    assert response.json == {'error': 'conflict', 'revision': 1}
+    assert client.post(url, json={'revision': 1, 'patch': [[50, 60, 'x']]}).status_code == 400
+    assert client.post(url, json={'patch': [[0, 0, 'x']]}).status_code == 400
+
+
+def test_autosave_is_only_for_the_author(app, client, make_user, make_blog, login):
+    blog = make_blog(make_user('doc'))
+    make_user('other')
+    login(client, 'other')
+    assert client.get(f'/edit_blog/{blog.id}/autosave').status_code == 403
+    assert client.post(f'/edit_blog/{blog.id}/autosave', json={'revision': 0, 'patch': [[0, 0, 'x']]}) \
+        .status_code == 403
+    with app.app_context():
+        assert stored(blog) == []
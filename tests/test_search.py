@@ -0,0 +1,117 @@
+import pytest
+
+from models import db, Blog
+from search import SearchIndex, SearchUnavailable, search_index
+
+
+@pytest.fixture
+def workers(app):
+    """Two memory indexes over the same database, like two web workers, synced by calling sync()."""
+    indexes = []
+    for _ in range(2):
+        index = SearchIndex()
+        index.init_app(app)
+        index.app = None  # No background thread
+        indexes.append(index)
+    return indexes
+
+
+def ids(index, query):
+    return [result.blog_id for result in index.search(query)]
+
+
+def test_search_waits_for_the_first_build(app_ctx, workers, make_user, make_blog, monkeypatch):
+    make_blog(make_user('doc'), title='Vaccines for children')
+    first, _ = workers
+    monkeypatch.setattr(SearchIndex, 'READY_TIMEOUT', 0)
+    with pytest.raises(SearchUnavailable):
+        first.search('vaccines')
+    first.sync()
+    assert len(ids(first, 'vaccines')) == 1
+
+
+def test_changes_reach_the_other_workers(app_ctx, workers, make_user, make_blog):
+    first, second = workers
+    author = make_user('doc')
+    kept = make_blog(author, title='Heart health')
+    dropped = make_blog(author, title='Heart surgery')
+    for index in workers:
+        index.sync()
+
+    added = Blog(title='Heart rate', category='Covid19', summary='s', content='c', user_id=author.id)
+    db.session.add(added)
+    db.session.flush()
+    first.update(added)
+    kept.title = 'Healthy hearts'
+    first.update(kept)
+    dropped.draft = True
+    first.update(dropped)
+    assert sorted(ids(first, 'heart')) == sorted([kept.id, dropped.id])  # Not before the commit
+    db.session.commit()
+    assert sorted(ids(first, 'heart')) == [added.id]  # Applied at once by the worker that made them
+
+    assert sorted(ids(second, 'heart')) == sorted([kept.id, dropped.id])
+    second.sync()
+    assert sorted(ids(second, 'heart')) == [added.id]
+    assert ids(second, 'hearts') == [kept.id]
+
+    first.remove(added.id)
+    db.session.delete(added)
+    db.session.commit()
+    second.sync()
+    assert ids(second, 'heart') == []
+
+
+def test_rolled_back_changes_are_not_indexed(app_ctx, workers, make_user, make_blog):
+    first, second = workers
+    blog = make_blog(make_user('doc'), title='Heart health')
+    for index in workers:
+        index.sync()
+    blog.title = 'Lung health'
+    first.update(blog)
+    with db.session.begin_nested():  # e.g. enqueuing a job; releasing it is not the commit
+        pass
+    db.session.rollback()
+    second.sync()
+    assert ids(first, 'lung') == ids(second, 'lung') == []
+    assert ids(first, 'heart') == ids(second, 'heart') == [blog.id]
+
+
+def test_rebuild_is_picked_up_by_every_worker(app_ctx, workers, make_user, make_blog):
+    first, second = workers
+    author = make_user('doc')
+    make_blog(author, title='Sleep and stress')
+    second.sync()
+    db.session.execute(db.text("INSERT INTO blog (title, category, summary, content, draft, user_id, date_posted) "
+                               "VALUES ('Stress at work', 'Mental Health', 's', 'c', 0, :id, CURRENT_TIMESTAMP)"),
+                       {'id': author.id})  # A bulk import bypasses update()
+    db.session.commit()
+    first.rebuild()
+    assert len(ids(second, 'stress')) == 1
+    second.sync()
+    assert len(ids(second, 'stress')) == 2
+
+
+def test_search_page(client, make_user, make_blog, login):
+    make_blog(make_user('doc'), title='Immunity and sleep', content='Sleep helps the immune system.')
+    login(client, 'doc')
+    response = client.get('/blogs/search?q=sleep')
+    assert response.status_code == 200
+    assert b'Immunity and sleep' in response.data and b'<mark>' in response.data
+
+
+@pytest.mark.parametrize('app_config', [{'SEARCH_BACKEND': 'fts5'}])
+def test_fts5_index_is_written_with_the_blog(app, client, make_user, login):
+    make_user('doc')
+    with app.app_context():
+        search_index.rebuild()  # Creates the table, as the migration does
+    login(client, 'doc')
+    client.post('/create_blog', data={'title': 'Vaccines for adults', 'category': 'Covid19', 'summary': 'A summary',
+                                      'content': 'Some words.'})
+    with app.app_context():
+        assert [result.blog_id for result in search_index.search('vaccines')] == [1]
+        blog = db.session.get(Blog, 1)
+        blog.title = 'Boosters'
+        search_index.update(blog)
+        db.session.rollback()
+        assert [result.blog_id for result in search_index.search('vaccines')] == [1]
@@ -0,0 +1,72 @@
+import pytest
+
+from app import user_cache
+from models import db, User
+from user_cache import LocalBackend, UserCache
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = UserCache(maxsize=2, ttl=60)
+    cache.set(1, {'id': 1})
+    cache.set(2, {'id': 2})
+    cache.get(1)
+    cache.set(3, {'id': 3})
+    assert cache.get(2) is None
+    assert cache.get(1) == {'id': 1} and cache.get(3) == {'id': 3}
+
+
+def test_expired_entries_are_misses():
+    cache = UserCache(ttl=0)
+    cache.set(1, {'id': 1})
+    assert cache.get(1) is None
+    assert cache.stats() == {'hits': 0, 'misses': 1, 'size': 0}
+
+
+def test_shared_backend_fills_other_processes_and_is_invalidated():
+    backend = LocalBackend()
+    one, two = UserCache(backend=backend), UserCache(backend=backend)
+    one.set(1, {'id': 1})
+    assert two.get(1) == {'id': 1}
+    one.invalidate(1)
+    two.clear()  # Another process's local copy only lives for the TTL
+    assert two.get(1) is None
+
+
+@pytest.fixture
+def cached_user(app_ctx, make_user):
+    user = make_user('doc')
+    user_cache.set(user.id, {'id': user.id, 'first_name': user.first_name})
+    assert user_cache.get(user.id) is not None
+    return user
+
+
+def test_update_invalidates(cached_user):
+    cached_user.first_name = 'Changed'
+    db.session.flush()
+    assert user_cache.get(cached_user.id) is None  # Dropped at flush...
+    user_cache.set(cached_user.id, {'id': cached_user.id, 'first_name': 'Stale'})
+    db.session.commit()
+    assert user_cache.get(cached_user.id) is None  # ...and again at commit
+
+
+def test_delete_invalidates(cached_user):
+    db.session.delete(cached_user)
+    db.session.commit()
+    assert user_cache.get(cached_user.id) is None
+
+
+def test_profile_changes_show_on_the_next_request(app, client, login, make_user):
+    user = make_user('doc')
+    login(client, 'doc')
+    assert b'Welcome, First Last' in client.get('/dashboard').data
+    assert user_cache.get(user.id) is not None
+
+    with app.app_context():
+        db.session.get(User, user.id).first_name = 'Renamed'
+        db.session.commit()
+    assert b'Welcome, Renamed Last' in client.get('/dashboard').data
+
+    client.post(f'/delete_user/{user.id}')
+    assert user_cache.get(user.id) is None
+    response = client.get('/dashboard')
+    assert response.status_code == 302 and '/login' in response.headers['Location']
@@ -0,0 +1,73 @@
+import pytest
+
+import views
+from models import db, Blog, BlogViewCount
+from views import ALL, ViewCounter
+
+
+@pytest.fixture
+def counter():
+    """A counter with no app, so no flush thread is started and the tests flush it themselves."""
+    counter = ViewCounter()
+    counter.top_k = 2
+    return counter
+
+
+@pytest.fixture
+def posts(app_ctx, make_user, make_blog):
+    author = make_user('doc')
+    return [make_blog(author, title=title, category=category).id
+            for title, category in [('A', 'Covid19'), ('B', 'Covid19'), ('C', 'Covid19'), ('D', 'Immunization')]]
+
+
+def stored_views():
+    return dict(db.session.execute(db.select(BlogViewCount.blog_id, BlogViewCount.views)).all())
+
+
+def test_flush_writes_the_buffered_counts(counter, posts):
+    a, b, c, d = posts
+    draft = Blog(title='Draft', category='Covid19', summary='s', content='c', draft=True, user_id=1)
+    db.session.add(draft)
+    db.session.commit()
+    for blog_id in [a, a, b, d, draft.id, 999]:
+        counter.record(blog_id)
+    assert counter.flush() == 4  # Views of the draft and the missing post are dropped
+    assert stored_views() == {a: 2, b: 1, d: 1}
+    assert len(counter.buffer) == 0 and counter.flush() == 0
+
+    for blog_id in [b, b, c]:
+        counter.record(blog_id)
+    assert counter.flush() == 3
+    assert stored_views() == {a: 2, b: 3, c: 1, d: 1}  # Added to the stored totals
+    assert counter.most_read('Covid19') == [(b, 'B'), (a, 'A')]
+    assert counter.most_read() == [(b, 'B'), (a, 'A')]
+    assert counter.most_read('Immunization') == [(d, 'D')]
+
+
+def test_failed_flush_keeps_the_counts(counter, posts, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('database is down')
+
+    counter.record(posts[0])
+    monkeypatch.setattr(views, 'upsert_increments', fail)
+    with pytest.raises(RuntimeError):
+        counter.flush()
+    assert counter.buffer.drain() == {posts[0]: 1} and counter.flush_errors == 1
+
+
+def test_rankings_are_rebuilt_from_the_database(counter, posts):
+    a, b, c, d = posts
+    db.session.add_all([BlogViewCount(blog_id=a, views=5), BlogViewCount(blog_id=b, views=9),
+                        BlogViewCount(blog_id=c, views=5), BlogViewCount(blog_id=d, views=7)])
+    db.session.get(Blog, b).draft = True
+    db.session.commit()
+    counter.refresh_rankings()
+    assert counter.most_read('Covid19') == [(c, 'C'), (a, 'A')]  # Ties go to the newer post
+    assert counter.most_read() == [(d, 'D'), (c, 'C')]
+    assert counter.rankings[ALL] == [(7, d, 'D'), (5, c, 'C')]
+
+    counter.discard(c)
+    assert counter.most_read('Covid19') == [(a, 'A')]
+    counter.forget([a])
+    db.session.commit()
+    assert a not in stored_views() and counter.most_read('Covid19') == []
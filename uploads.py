@@ -0,0 +1,133 @@
+import hashlib
+import os
+import tempfile
+
+from werkzeug.utils import secure_filename
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # Pillow is optional; without it originals are stored but not resized
+    Image = None
+
+CHUNK_SIZE = 64 * 1024
+
+# Widths (in pixels) of the resized copies made for each kind of upload
+VARIANT_WIDTHS = {
+    'user': (128, 256),
+    'blog': (400, 800),
+}
+
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+PIL_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+class InvalidImage(ValueError):
+    """Raised when an upload is not an image we accept."""
+
+
+def _content_path(root, digest, suffix):
+    # Two-level fan-out keeps directories small: images/blog/ab/abcdef...jpg
+    return os.path.join(root, digest[:2], digest + suffix)
+
+
+def save_original(file_storage, static_folder, subdir):
+    """Stream an upload to disk under a content-addressed name.
+
+    The file is copied in chunks to a temp file while it is hashed, then
+    moved to ``<static_folder>/<subdir>/<xx>/<sha256>.<ext>``. Identical
+    uploads therefore share one file, and client filenames never collide.
+    Returns the path relative to ``static_folder``.
+    """
+    root = os.path.join(static_folder, subdir)
+    os.makedirs(root, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        extension = _detect_extension(tmp_path, file_storage.filename)
+        final_path = _content_path(root, digest.hexdigest(), '.' + extension)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)  # Already stored; reuse it
+        else:
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return os.path.relpath(final_path, static_folder).replace(os.sep, '/')
+
+
+def _detect_extension(path, filename):
+    if Image is None:
+        extension = secure_filename(filename or '').rsplit('.', 1)[-1].lower()
+        if extension not in ALLOWED_EXTENSIONS:
+            raise InvalidImage(filename)
+        return 'jpg' if extension == 'jpeg' else extension
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise InvalidImage(filename) from e
+    if image_format not in PIL_EXTENSIONS:
+        raise InvalidImage(filename)
+    return PIL_EXTENSIONS[image_format]
+
+
+def make_variants(static_folder, relative_path, widths):
+    """Create resized copies of a stored image, each in its own format and in WebP.
+
+    Returns ``{'webp': {width: path}, '<format>': {width: path}}`` with paths
+    relative to ``static_folder``, or None when Pillow is not installed.
+    Variants that already exist (from an identical upload) are reused.
+    """
+    if Image is None:
+        return None
+    source = os.path.join(static_folder, relative_path)
+    stem = os.path.splitext(source)[0]
+    variants = {}
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        fallback = 'png' if has_alpha else 'jpg'
+        # Never upscale: widths wider than the original collapse to the original width
+        targets = sorted({min(width, image.width) for width in widths})
+        for width in targets:
+            height = max(1, round(image.height * width / image.width))
+            resized = None
+            for extension in ('webp', fallback):
+                path = f'{stem}-{width}.{extension}'
+                if not os.path.exists(path):
+                    if resized is None:
+                        resized = image.convert('RGBA' if has_alpha else 'RGB').resize((width, height), Image.LANCZOS)
+                    _save(resized, path, extension)
+                variants.setdefault(extension, {})[str(width)] = \
+                    os.path.relpath(path, static_folder).replace(os.sep, '/')
+    return variants
+
+
+def _save(image, path, extension):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.variant-')
+    os.close(fd)
+    if extension == 'webp':
+        image.save(tmp_path, 'WEBP', quality=80, method=4)
+    elif extension == 'png':
+        image.save(tmp_path, 'PNG', optimize=True)
+    else:
+        image.save(tmp_path, 'JPEG', quality=82, optimize=True, progressive=True)
+    os.replace(tmp_path, path)
+
+
+def srcset(variants, extension):
+    """Return the (width, path) pairs of one format, smallest first."""
+    if not variants or extension not in variants:
+        return []
+    return sorted(((int(width), path) for width, path in variants[extension].items()))
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from werkzeug.utils import import_string
+
+
+class LocalBackend:
+    """In-process stand-in for a shared cache such as Redis or memcached.
+
+    A shared backend only needs ``get(key)``, ``set(key, value, ttl)`` and
+    ``delete(key)``; values are plain dicts so they can be serialized.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class CachedUser(UserMixin):
+    """Detached copy of a User row, used as ``current_user``.
+
+    It carries every column except the password hash, so role checks and the
+    dashboard can be served without a database round trip.
+    """
+
+    def __init__(self, data):
+        self.__dict__.update(data)
+
+    def __repr__(self):
+        return f"<CachedUser {self.username}>"
+
+
+def snapshot(user):
+    """Return the cacheable fields of a User as a plain dict."""
+    return {column.name: getattr(user, column.name)
+            for column in user.__table__.columns if column.name != 'password'}
+
+
+def make_backend(spec):
+    """Build a shared backend from a USER_CACHE_BACKEND setting: '' for none, 'local', or an import path."""
+    if not spec:
+        return None
+    if spec == 'local':
+        return LocalBackend()
+    return import_string(spec)()
+
+
+class UserCache:
+    """Process-local LRU/TTL cache of user identity data, optionally backed by a shared store."""
+
+    def __init__(self, maxsize=1024, ttl=60, backend=None, app=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_SIZE', 1024)
+        app.config.setdefault('USER_CACHE_TTL', 60)
+        app.config.setdefault('USER_CACHE_BACKEND', '')
+        self.maxsize = app.config['USER_CACHE_SIZE']
+        self.ttl = app.config['USER_CACHE_TTL']
+        self.backend = make_backend(app.config['USER_CACHE_BACKEND'])
+        self.clear()
+
+    @staticmethod
+    def _key(user_id):
+        return f'user:{user_id}'
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self._entries.pop(user_id, None)
+
+        data = self.backend.get(self._key(user_id)) if self.backend is not None else None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._store_local(user_id, data)
+        return data
+
+    def set(self, user_id, data):
+        self._store_local(user_id, data)
+        if self.backend is not None:
+            self.backend.set(self._key(user_id), data, self.ttl)
+        return data
+
+    def _store_local(self, user_id, data):
+        with self._lock:
+            self._entries[user_id] = (data, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if self.backend is not None:
+            self.backend.delete(self._key(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def collect_metrics(self):
+        stats = self.stats()
+        return [
+            ('user_cache_hits_total', 'counter', 'User cache lookups served from cache.',
+             [('', {}, stats['hits'])]),
+            ('user_cache_misses_total', 'counter', 'User cache lookups that went to the database.',
+             [('', {}, stats['misses'])]),
+            ('user_cache_entries', 'gauge', 'Users held in the process-local cache.',
+             [('', {}, stats['size'])]),
+        ]
+
+    def watch(self, model):
+        """Invalidate cached users whenever a ``model`` row is updated or deleted.
+
+        Entries are dropped as soon as the change is flushed and again after
+        the commit, so a concurrent request cannot re-cache the old row in
+        between.
+        """
+        def on_change(mapper, connection, target):
+            self.invalidate(target.id)
+            session = object_session(target)
+            if session is not None:
+                session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+        def after_commit(session):
+            for user_id in session.info.pop('changed_user_ids', ()):
+                self.invalidate(user_id)
+
+        event.listen(model, 'after_update', on_change)
+        event.listen(model, 'after_delete', on_change)
+        event.listen(Session, 'after_commit', after_commit)
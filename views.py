@@ -0,0 +1,282 @@
+"""Blog view counts, buffered in memory and written to the database in batches.
+
+Counting a view is a dict update under a lock; nothing touches the
+database on the request path. A background thread in each worker flushes
+the buffered counts every VIEW_FLUSH_INTERVAL seconds with one upsert into
+blog_view_count, so however often a post is read it costs one row write per
+interval. The same thread keeps the "most read" posts of every category in
+memory for the listing pages.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+
+from werkzeug.utils import import_string
+
+from counters import upsert_increments
+from models import db, Blog, BlogViewCount
+
+logger = logging.getLogger(__name__)
+
+ALL = '*'  # The rankings across every category
+
+
+class LocalBuffer:
+    """Per-process buffer. Each worker flushes its own counts, and the upserts add them up."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, blog_id, count=1):
+        with self._lock:
+            self._counts[blog_id] = self._counts.get(blog_id, 0) + count
+
+    def drain(self):
+        """Return the buffered ``{blog_id: count}`` and start over."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def __len__(self):
+        return len(self._counts)
+
+
+class RedisBuffer:
+    """Buffer shared by every worker, kept in a Redis hash (``pip install redis``).
+
+    Whichever worker flushes first writes everyone's counts, so each post
+    gets one upsert per interval across the whole deployment.
+    """
+
+    def __init__(self, url, key='blog_views'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._no_such_key = redis.ResponseError
+        self.key = key
+
+    def add(self, blog_id, count=1):
+        self._redis.hincrby(self.key, blog_id, count)
+
+    def drain(self):
+        # Renaming hands the hash over atomically; views counted meanwhile start a new one
+        draining = f'{self.key}:draining:{uuid.uuid4().hex}'
+        try:
+            self._redis.rename(self.key, draining)
+        except self._no_such_key:  # Nothing was counted
+            return {}
+        counts = self._redis.hgetall(draining)
+        self._redis.delete(draining)
+        return {int(blog_id): int(count) for blog_id, count in counts.items()}
+
+    def __len__(self):
+        return self._redis.hlen(self.key)
+
+
+class NullBuffer:
+    """Views are not counted."""
+
+    def add(self, blog_id, count=1):
+        pass
+
+    def drain(self):
+        return {}
+
+    def __len__(self):
+        return 0
+
+
+def make_buffer(spec):
+    """Build a view buffer from a VIEW_COUNTER_BUFFER setting: 'memory', 'off', a redis:// URL, or an import path."""
+    if not spec or spec == 'memory':
+        return LocalBuffer()
+    if spec == 'off':
+        return NullBuffer()
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBuffer(spec)
+    return import_string(spec)()
+
+
+class ViewCounter:
+    """Buffered view counts and in-memory "most read" rankings.
+
+    ``record()`` is called by the blog page. ``most_read()`` answers from the
+    worker's rankings: the top VIEW_TOP_K posts per category, updated with
+    the new totals of every post this worker flushes and rebuilt from the
+    database every VIEW_TOP_REFRESH seconds to pick up the other workers'
+    counts. The flush thread is started by the first call in each worker
+    process, so it also runs in workers forked from a preloaded app.
+    """
+
+    def __init__(self, app=None):
+        self.buffer = LocalBuffer()
+        self.flush_interval = 10
+        self.top_k = 10
+        self.refresh_interval = 300
+        self.rankings = {}  # {category: [(views, blog_id, title), ...]}, most read first
+        self._rankings_lock = threading.Lock()
+        self._refreshed_at = None
+        self._thread_pid = None
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.flushes = 0
+        self.flushed_views = 0
+        self.flush_errors = 0
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('VIEW_COUNTER_BUFFER', 'memory')
+        app.config.setdefault('VIEW_FLUSH_INTERVAL', 10)
+        app.config.setdefault('VIEW_TOP_K', 10)
+        app.config.setdefault('VIEW_TOP_REFRESH', 300)
+        self.buffer = make_buffer(app.config['VIEW_COUNTER_BUFFER'])
+        self.flush_interval = app.config['VIEW_FLUSH_INTERVAL']
+        self.top_k = app.config['VIEW_TOP_K']
+        self.refresh_interval = app.config['VIEW_TOP_REFRESH']
+        self.app = app
+
+    @property
+    def enabled(self):
+        return not isinstance(self.buffer, NullBuffer)
+
+    def record(self, blog_id):
+        """Count one view of a published blog."""
+        self.buffer.add(blog_id)
+        self._ensure_thread()
+
+    def most_read(self, category=None, limit=5):
+        """``[(blog_id, title), ...]`` of the most read published posts in ``category`` (or overall)."""
+        self._ensure_thread()
+        return [(blog_id, title) for _, blog_id, title in self.rankings.get(category or ALL, [])[:limit]]
+
+    def digest(self, category=None, limit=5):
+        """A short token that changes whenever ``most_read(category, limit)`` does, for cache keys."""
+        ids = ','.join(str(blog_id) for blog_id, _ in self.most_read(category, limit))
+        return hashlib.blake2b(ids.encode(), digest_size=6).hexdigest()
+
+    def _ensure_thread(self):
+        if not self.enabled or self._thread_pid == os.getpid() or self.app is None:
+            return
+        with self._thread_lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._stop = threading.Event()
+            threading.Thread(target=self._run, name='view-counter', daemon=True).start()
+            atexit.register(self._stop_and_flush)
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    if self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.refresh_interval:
+                        self.refresh_rankings()
+                    self.flush()
+            except Exception:
+                logger.exception('Flushing blog view counts failed')
+            if self._stop.wait(self.flush_interval):
+                return
+
+    def _stop_and_flush(self):
+        self._stop.set()
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception:
+            logger.exception('Flushing blog view counts at exit failed')
+
+    def flush(self):
+        """Write the buffered counts with one upsert and merge the new totals into the rankings.
+
+        Returns the number of views written. Counts for posts that were
+        deleted or unpublished meanwhile are dropped. If the write fails the
+        counts go back into the buffer.
+        """
+        counts = self.buffer.drain()
+        if not counts:
+            return 0
+        try:
+            posts = {row.id: row for row in db.session.execute(
+                db.select(Blog.id, Blog.category, Blog.title)
+                .where(Blog.id.in_(list(counts)), Blog.draft == False))}  # noqa: E712
+            # Sorted so concurrent flushes from several workers lock rows in the same order
+            rows = [{'blog_id': blog_id, 'views': counts[blog_id]} for blog_id in sorted(posts)]
+            upsert_increments(db.session, BlogViewCount, ('blog_id',), 'views', rows)
+            totals = db.session.execute(db.select(BlogViewCount.blog_id, BlogViewCount.views)
+                                        .where(BlogViewCount.blog_id.in_(list(posts)))).all()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for blog_id, count in counts.items():
+                self.buffer.add(blog_id, count)
+            self.flush_errors += 1
+            raise
+        self._merge([(views, blog_id, posts[blog_id].title, posts[blog_id].category)
+                     for blog_id, views in totals])
+        self.flushes += 1
+        written = sum(row['views'] for row in rows)
+        self.flushed_views += written
+        return written
+
+    def _merge(self, entries):
+        with self._rankings_lock:
+            rankings = {category: {blog_id: (views, blog_id, title) for views, blog_id, title in ranked}
+                        for category, ranked in self.rankings.items()}
+            for views, blog_id, title, category in entries:
+                for key in (category, ALL):
+                    rankings.setdefault(key, {})[blog_id] = (views, blog_id, title)
+            # Replaced rather than edited in place, so readers never see a half-updated list
+            self.rankings = {category: sorted(ranked.values(), reverse=True)[:self.top_k]
+                             for category, ranked in rankings.items()}
+
+    def refresh_rankings(self):
+        """Rebuild the rankings from the totals of every worker."""
+        rank = db.func.row_number().over(partition_by=Blog.category,
+                                         order_by=(BlogViewCount.views.desc(), Blog.id.desc())).label('rank')
+        ranked = (db.select(Blog.id, Blog.title, Blog.category, BlogViewCount.views, rank)
+                  .join(BlogViewCount, BlogViewCount.blog_id == Blog.id)
+                  .where(Blog.draft == False)  # noqa: E712
+                  .subquery())
+        rows = db.session.execute(db.select(ranked).where(ranked.c.rank <= self.top_k)).all()
+        rankings = {}
+        for row in rows:
+            rankings.setdefault(row.category, []).append((row.views, row.id, row.title))
+        # The overall top K is among the categories' top Ks
+        rankings[ALL] = sorted((entry for ranked in rankings.values() for entry in ranked), reverse=True)
+        with self._rankings_lock:
+            self.rankings = {category: sorted(ranked, reverse=True)[:self.top_k]
+                             for category, ranked in rankings.items()}
+        self._refreshed_at = time.monotonic()
+
+    def discard(self, *blog_ids):
+        """Take blogs out of this worker's rankings, e.g. when unpublished; they return on a later flush."""
+        with self._rankings_lock:
+            self.rankings = {category: [entry for entry in ranked if entry[1] not in blog_ids]
+                             for category, ranked in self.rankings.items()}
+
+    def forget(self, blog_ids):
+        """Delete the counts of blogs about to be deleted, in the caller's transaction."""
+        if blog_ids:
+            db.session.execute(db.delete(BlogViewCount).where(BlogViewCount.blog_id.in_(blog_ids)))
+            self.discard(*blog_ids)
+
+    def collect_metrics(self):
+        return [
+            ('blog_views_buffered', 'gauge', 'Blog views counted but not yet written to the database.',
+             [('', {}, len(self.buffer))]),
+            ('blog_views_flushed_total', 'counter', 'Blog views written to the database.',
+             [('', {}, self.flushed_views)]),
+            ('blog_view_flushes_total', 'counter', 'Batched writes of blog view counts.',
+             [('', {}, self.flushes)]),
+            ('blog_view_flush_errors_total', 'counter', 'Batched writes of blog view counts that failed.',
+             [('', {}, self.flush_errors)]),
+        ]
+
+
+view_counter = ViewCounter()